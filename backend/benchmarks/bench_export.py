@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Benchmark da exportação de projetos (/projects/export): gera CSV e XLSX em streaming a partir de um
+cursor simulado e mede tempo, tamanho e quanto o pico de memória do processo (max RSS) cresceu,
+conferindo que o arquivo lido de volta tem todas as linhas.
+
+Falha (código 1) quando alguma linha se perde, o arquivo não abre ou a memória cresce além do limite.
+
+Uso:
+    python backend/benchmarks/bench_export.py --rows 500000 --max-growth-mb 32
+    python backend/benchmarks/bench_export.py --rows 100000 --output /tmp/export --buffered
+"""
+import argparse
+import asyncio
+import csv
+import random
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from xml.etree.ElementTree import iterparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tabular_export import ExportColumn, csv_stream, xlsx_stream  # noqa: E402
+
+# Same shape as EXPORT_COLUMNS in server.py, which cannot be imported without the API dependencies
+COLUMNS = [
+    ExportColumn("id", "ID"),
+    ExportColumn("title", "Título"),
+    ExportColumn("municipality_name", "Município"),
+    ExportColumn("project_type", "Tipo"),
+    ExportColumn("status", "Status"),
+    ExportColumn("priority", "Prioridade", "number"),
+    ExportColumn("complexity", "Complexidade"),
+    ExportColumn("ipr_score", "IPR", "number"),
+    ExportColumn("progress_percent", "Progresso (%)", "number"),
+    ExportColumn("desired_deadline", "Prazo desejado"),
+    ExportColumn("estimated_deadline", "Prazo estimado", "date"),
+    ExportColumn("actual_deadline", "Prazo realizado", "date"),
+    ExportColumn("assigned_team", "Equipe"),
+    ExportColumn("created_at", "Criado em", "date"),
+    ExportColumn("updated_at", "Atualizado em", "date"),
+    ExportColumn("archived", "Arquivado"),
+]
+MUNICIPALITIES = ["Jaraguá do Sul", "Guaramirim", "Schroeder", "Corupá", "Massaranduba", "São João do Itaperiú"]
+STATUSES = ["solicitacao", "briefing", "diagnostico", "validacao", "execucao", "entrega", "concluido", "pausado"]
+TYPES = ["pavimentacao", "edificacao", "infraestrutura"]
+
+
+def synthetic_project(rng: random.Random, i: int, start: datetime) -> dict:
+    created = start + timedelta(minutes=i)
+    return {
+        "id": f"00000000-0000-4000-8000-{i:012d}",
+        "title": f"{rng.choice(['Pavimentação', 'Reforma', 'Drenagem'])} da Rua {i}; trecho \"{rng.randint(1, 9)}\"",
+        "municipality_name": rng.choice(MUNICIPALITIES),
+        "project_type": rng.choice(TYPES),
+        "status": rng.choice(STATUSES),
+        "priority": rng.randint(1, 5),
+        "complexity": rng.choice(["minima", "media", "alta", None]),
+        "ipr_score": round(rng.uniform(0, 10), 2),
+        "progress_percent": float(rng.randint(0, 100)),
+        "desired_deadline": rng.choice(["curto", "medio", "longo"]),
+        "estimated_deadline": (created + timedelta(days=rng.randint(30, 400))).isoformat() if i % 3 else None,
+        "actual_deadline": None,
+        "assigned_team": [f"tecnico-{rng.randint(1, 30)}" for _ in range(rng.randint(0, 3))],
+        "created_at": created.isoformat(),
+        "updated_at": (created + timedelta(days=rng.randint(0, 60))).isoformat(),
+    }
+
+
+async def cursor(rows: int, batch_size: int):
+    """Stands in for a Motor cursor: documents come in batches, with a yield to the loop between them"""
+    rng = random.Random(42)
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+    for i in range(rows):
+        if i % batch_size == 0:
+            await asyncio.sleep(0)
+        yield synthetic_project(rng, i, start)
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+async def consume(stream, output: Path):
+    """Drain the response body the way the server would, chunk by chunk, into a file"""
+    size = chunks = 0
+    with open(output, "wb") as handle:
+        async for chunk in stream:
+            size += len(chunk)
+            chunks += 1
+            handle.write(chunk)
+    return size, chunks
+
+
+def count_csv_rows(path: Path) -> int:
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f, delimiter=";")
+        next(reader)
+        return sum(1 for _ in reader)
+
+
+def count_xlsx_rows(path: Path) -> int:
+    with zipfile.ZipFile(path) as archive:
+        if archive.testzip() is not None:
+            return -1
+        rows = 0
+        with archive.open("xl/worksheets/sheet1.xml") as sheet:
+            for _, element in iterparse(sheet):
+                if element.tag.endswith("}row"):
+                    rows += 1
+                    element.clear()
+        return rows - 1
+
+
+async def run(fmt: str, args, directory: Path) -> bool:
+    rows = cursor(args.rows, args.batch_size)
+    stream = csv_stream(COLUMNS, rows) if fmt == "csv" else xlsx_stream(COLUMNS, rows, sheet_name="Projetos")
+    path = directory / f"projetos.{fmt}"
+
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    size, chunks = await consume(stream, path)
+    elapsed = time.perf_counter() - start
+    growth = max_rss_mb() - rss_before
+    read_back = count_csv_rows(path) if fmt == "csv" else count_xlsx_rows(path)
+
+    print(f"{fmt}: {args.rows} rows in {elapsed:.2f}s ({args.rows / elapsed:,.0f} rows/s), "
+          f"{size / 1024 / 1024:.1f} MiB in {chunks} chunks, max RSS grew {growth:.1f} MiB, {read_back} rows read back")
+    return read_back == args.rows and growth <= args.max_growth_mb
+
+
+async def buffered_baseline(args):
+    """What a fully buffered response costs: every document held at once before serialization starts"""
+    rss_before = max_rss_mb()
+    projects = [project async for project in cursor(args.rows, args.batch_size)]
+    print(f"buffered: {len(projects)} documents held in memory, max RSS grew {max_rss_mb() - rss_before:.1f} MiB "
+          f"before serializing")
+
+
+async def main_async(args) -> int:
+    if args.output:
+        directory = Path(args.output)
+        directory.mkdir(parents=True, exist_ok=True)
+        results = [await run(fmt, args, directory) for fmt in args.formats]
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = [await run(fmt, args, Path(tmp)) for fmt in args.formats]
+    if args.buffered:
+        await buffered_baseline(args)
+    print("\nEvery export streamed all rows within the memory limit" if all(results) else "\nSome exports failed")
+    return 0 if all(results) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming CSV/XLSX project export benchmark")
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--formats', nargs='+', default=["csv", "xlsx"], choices=["csv", "xlsx"])
+    parser.add_argument('--max-growth-mb', type=float, default=32.0)
+    parser.add_argument('--output', help="keep the generated files in this directory")
+    parser.add_argument('--buffered', action='store_true', help="also measure holding every document at once")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
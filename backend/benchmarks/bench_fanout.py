@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark do fan_out: consultas independentes aguardadas em sequência vs concorrentes.
+
+Cada consulta simulada dorme uma latência aleatória, como um round-trip ao MongoDB. Em sequência
+o tempo total é a soma das latências; com fan_out deve ficar próximo da consulta mais lenta
+(ou de soma/limit quando há mais consultas que vagas).
+
+Falha (código 1) quando o fan_out não é mais rápido que a sequência, passa do tempo esperado além da
+tolerância ou, com uma consulta falhando, espera pela mais lenta.
+
+Uso:
+    python backend/benchmarks/bench_fanout.py --queries 9 --limit 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'intraamvali_bench')
+
+from server import fan_out  # noqa: E402
+
+
+def simulated_query(latency: float, fail: bool = False):
+    async def query():
+        await asyncio.sleep(latency)
+        if fail:
+            raise RuntimeError("simulated query failure")
+        return latency
+    return query
+
+
+async def run(latencies, limit: int, rounds: int):
+    sequential, concurrent = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for latency in latencies:
+            await simulated_query(latency)()
+        sequential.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        results = await fan_out(limit=limit, **{f"q{i}": simulated_query(latency) for i, latency in enumerate(latencies)})
+        concurrent.append(time.perf_counter() - start)
+        assert list(results.values()) == list(latencies)
+    return np.median(sequential), np.median(concurrent)
+
+
+async def run_failure(latencies, limit: int):
+    """The fastest query fails: the call should return after it, not after the slowest one"""
+    failing = int(np.argmin(latencies))
+    queries = {f"q{i}": simulated_query(latency, fail=i == failing) for i, latency in enumerate(latencies)}
+    start = time.perf_counter()
+    try:
+        await fan_out(limit=limit, **queries)
+    except RuntimeError:
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs concurrent independent queries")
+    parser.add_argument('--queries', type=int, default=9)
+    parser.add_argument('--limit', type=int, default=8)
+    parser.add_argument('--min-ms', type=float, default=5)
+    parser.add_argument('--max-ms', type=float, default=40)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="how far over the ideal time (slowest query, or sum/limit) fan_out may run")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    latencies = [float(x) for x in rng.uniform(args.min_ms, args.max_ms, args.queries) / 1000]
+    sequential, concurrent = asyncio.run(run(latencies, args.limit, args.rounds))
+    failure = asyncio.run(run_failure(latencies, args.limit))
+
+    print(f"{args.queries} queries, limit {args.limit}, latencies {args.min_ms:.0f}-{args.max_ms:.0f}ms")
+    print(f"  sum of latencies:   {sum(latencies) * 1000:8.1f} ms")
+    print(f"  slowest query:      {max(latencies) * 1000:8.1f} ms")
+    print(f"  sequential (p50):   {sequential * 1000:8.1f} ms")
+    print(f"  fan_out (p50):      {concurrent * 1000:8.1f} ms  ({sequential / concurrent:.1f}x)")
+    print(f"  first-error return: {failure * 1000:8.1f} ms  (fastest query fails, the rest are cancelled)")
+
+    ideal = max(max(latencies), sum(latencies) / args.limit)
+    checks = {
+        "fan_out faster than sequential": concurrent < sequential,
+        f"fan_out within {args.tolerance}x of the ideal {ideal * 1000:.1f} ms": concurrent <= ideal * args.tolerance,
+        "first error returns before the slowest query": failure < max(latencies),
+    }
+    for name, ok in checks.items():
+        print(f"  {'ok  ' if ok else 'FAIL'} {name}")
+    sys.exit(0 if all(checks.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Exercita o InvalidationBus contra um banco em memória que imita um replica set (change streams) e um
+servidor standalone (polling): latência de entrega, agregação de rajadas, remoções, escritas confirmadas
+depois da marca d'água e ausência de eventos repetidos.
+
+Cada cenário imprime o que mediu e falha (código 1) quando o comportamento esperado não ocorre.
+
+Uso:
+    python backend/benchmarks/bench_invalidation_bus.py --poll-interval 0.2 --burst 1000
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from invalidation_bus import ChangeEvent, InvalidationBus, WatchedCollection  # noqa: E402
+
+
+class NotReplicaSet(Exception):
+    code = 40573
+
+
+# ==================== STAND-IN DATABASE ====================
+def _matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(_matches(doc, sub) for sub in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = doc.get(field)
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$gt" in condition and (value is None or not value > condition["$gt"]):
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda d: d.get(field) or "", reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, n):
+        return self.docs if n is None else self.docs[:n]
+
+
+class FakeCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.docs = {}
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(d) for d in self.docs.values() if _matches(d, query)])
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    def insert(self, doc, stamped_ago: float = 0.0):
+        stamp = datetime.now(timezone.utc) - timedelta(seconds=stamped_ago)
+        doc = {**doc, "updated_at": stamp.isoformat()}
+        self.docs[doc['id']] = doc
+        self.database.record("insert", self.name, doc)
+
+    def update(self, doc_id, **fields):
+        self.docs[doc_id].update(fields, updated_at=datetime.now(timezone.utc).isoformat())
+        self.database.record("update", self.name, self.docs[doc_id])
+
+    def delete(self, doc_id):
+        del self.docs[doc_id]
+        self.database.record("delete", self.name, None)
+
+
+class FakeChangeStream:
+    def __init__(self, database, collections, resume_after):
+        self.database = database
+        self.collections = collections
+        self.position = int(resume_after['_data']) if resume_after else len(database.oplog)
+
+    @property
+    def resume_token(self):
+        return {"_data": str(self.position)}
+
+    async def __aenter__(self):
+        if not self.database.replica_set:
+            raise NotReplicaSet("The $changeStream stage is only supported on replica sets")
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def try_next(self):
+        while self.position < len(self.database.oplog):
+            change = self.database.oplog[self.position]
+            self.position += 1
+            if self.collections is None or change['ns']['coll'] in self.collections:
+                return change
+        return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            change = await self.try_next()
+            if change is not None:
+                return change
+            async with self.database.changed:
+                await self.database.changed.wait()
+
+
+class FakeDatabase:
+    def __init__(self, replica_set: bool):
+        self.replica_set = replica_set
+        self.collections = {}
+        self.oplog = []
+        self.changed = asyncio.Condition()
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, name))
+
+    def record(self, operation, collection, document):
+        change = {"operationType": operation, "ns": {"coll": collection}}
+        if document is not None:
+            change["fullDocument"] = dict(document)
+        self.oplog.append(change)
+        asyncio.get_running_loop().create_task(self._notify())
+
+    async def _notify(self):
+        async with self.changed:
+            self.changed.notify_all()
+
+    def watch(self, pipeline, full_document=None, resume_after=None, max_await_time_ms=None):
+        collections = None
+        for stage in pipeline:
+            if "$match" in stage:
+                collections = set(stage["$match"]["ns.coll"]["$in"])
+        return FakeChangeStream(self, collections, resume_after)
+
+
+# ==================== SCENARIOS ====================
+class Recorder:
+    def __init__(self):
+        self.events = []
+        self.arrived = asyncio.Event()
+
+    async def __call__(self, event: ChangeEvent):
+        self.events.append((time.perf_counter(), event))
+        self.arrived.set()
+
+    async def next_events(self, timeout: float):
+        self.events.clear()
+        self.arrived.clear()
+        await asyncio.wait_for(self.arrived.wait(), timeout)
+        await asyncio.sleep(0.05)  # let the rest of the batch land
+        return [event for _, event in self.events]
+
+
+async def scenario(name: str, replica_set: bool, args) -> bool:
+    database = FakeDatabase(replica_set)
+    projects = database["projects"]
+    for i in range(10):
+        projects.insert({"id": f"p{i}", "municipality_id": f"m{i % 3}"})
+    database.oplog.clear()
+
+    bus = InvalidationBus(database, [WatchedCollection("projects", fields=("municipality_id",))],
+                          poll_interval=args.poll_interval, batch_window=0.01, max_events_per_batch=200)
+    recorder = Recorder()
+    bus.subscribe("projects", recorder)
+    task = asyncio.create_task(bus.run())
+    await asyncio.sleep(0.05)
+    timeout = args.poll_interval * 3 + 1
+    checks = []
+    try:
+        start = time.perf_counter()
+        projects.update("p4", status="execucao")
+        events = await recorder.next_events(timeout)
+        latency = (recorder.events[0][0] - start) * 1000
+        single = events == [ChangeEvent("projects", "p4", {"municipality_id": "m1"})]
+        print(f"{name} ({bus.source}): one update delivered in {latency:.1f}ms as {events}")
+        checks.append(single)
+
+        for i in range(args.burst):
+            projects.insert({"id": f"burst{i}", "municipality_id": "m0"})
+        events = await recorder.next_events(timeout)
+        print(f"{name}: burst of {args.burst} inserts delivered as {len(events)} event(s)")
+        checks.append(events == [ChangeEvent("projects")])
+
+        projects.delete("p0")
+        events = await recorder.next_events(timeout)
+        print(f"{name}: delete delivered as {events}")
+        checks.append(events == [ChangeEvent("projects")])
+
+        # Stamped before the watermark but committed after it: only the overlap lets polling see it
+        projects.update("p5", status="briefing")
+        await recorder.next_events(timeout)
+        projects.insert({"id": "late", "municipality_id": "m2"}, stamped_ago=args.poll_interval * 2)
+        events = await recorder.next_events(timeout)
+        print(f"{name}: late-committed insert delivered as {events}")
+        checks.append(events == [ChangeEvent("projects", "late", {"municipality_id": "m2"})])
+
+        # Nothing new: the overlap window must not deliver the same documents again
+        try:
+            events = await recorder.next_events(args.poll_interval * 3)
+        except asyncio.TimeoutError:
+            events = []
+        print(f"{name}: {len(events)} repeated event(s) while idle")
+        checks.append(events == [])
+    except asyncio.TimeoutError:
+        print(f"{name}: an expected event never arrived")
+        checks.append(False)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return all(checks)
+
+
+async def main_async(args) -> int:
+    results = [
+        await scenario("change streams", True, args),
+        await scenario("polling", False, args),
+    ]
+    print("\nAll invalidation bus scenarios behaved as expected" if all(results) else "\nSome invalidation bus scenarios failed")
+    return 0 if all(results) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Invalidation bus against replica-set and standalone stand-ins")
+    parser.add_argument('--poll-interval', type=float, default=0.2)
+    parser.add_argument('--burst', type=int, default=1000)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Exercita o LLMGateway contra o provedor falso local: limites de concorrência, timeout e circuit breaker.
+
+Cada cenário imprime o que mediu e falha (código 1) quando o comportamento esperado não ocorre.
+
+Uso:
+    python backend/benchmarks/bench_llm_gateway.py --requests 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from llm_gateway import CircuitBreaker, FakeLLMProvider, LLMGateway, LLMUnavailable  # noqa: E402
+
+
+async def call(gateway, municipality_id=None):
+    try:
+        await gateway.complete("bench", "system", "prompt", session_id="bench", municipality_id=municipality_id)
+        return "ok"
+    except LLMUnavailable:
+        return "rejected"
+    except Exception:
+        return "error"
+
+
+async def concurrency_limits(args) -> bool:
+    provider = FakeLLMProvider(latency=args.latency)
+    gateway = LLMGateway(provider, max_concurrency=args.max_concurrency, max_per_municipality=args.requests, timeout=60)
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(call(gateway, f"m{i % 10}") for i in range(args.requests)))
+    elapsed = time.perf_counter() - start
+    print(f"global limit {args.max_concurrency}: {args.requests} calls in {elapsed:.2f}s, "
+          f"peak in flight {provider.max_in_flight}, {outcomes.count('ok')} ok")
+    global_ok = provider.max_in_flight <= args.max_concurrency and outcomes.count('ok') == args.requests
+
+    provider = FakeLLMProvider(latency=args.latency)
+    gateway = LLMGateway(provider, max_concurrency=args.requests, max_per_municipality=2, timeout=60)
+    await asyncio.gather(*(call(gateway, "m0") for _ in range(20)))
+    print(f"per-municipality limit 2: 20 calls from one municipality, peak in flight {provider.max_in_flight}")
+    return global_ok and provider.max_in_flight <= 2
+
+
+async def timeouts(args) -> bool:
+    gateway = LLMGateway(FakeLLMProvider(latency=1.0), timeout=0.1)
+    start = time.perf_counter()
+    outcome = await call(gateway)
+    elapsed = time.perf_counter() - start
+    print(f"timeout 0.1s on a 1s provider: {outcome} after {elapsed:.2f}s")
+    return outcome == "error" and elapsed < 0.5
+
+
+async def circuit_breaker(args) -> bool:
+    provider = FakeLLMProvider(latency=args.latency, failure_rate=1.0)
+    gateway = LLMGateway(provider, breaker=CircuitBreaker(failure_threshold=5, reset_timeout=0.5), timeout=5)
+    outcomes = [await call(gateway) for _ in range(20)]
+    start = time.perf_counter()
+    fast = await call(gateway)
+    fast_ms = (time.perf_counter() - start) * 1000
+    print(f"failing provider: {outcomes.count('error')} errors then {outcomes.count('rejected')} fast rejections "
+          f"({fast_ms:.2f}ms each), provider called {provider.calls} times")
+
+    provider.failure_rate = 0.0
+    await asyncio.sleep(0.6)
+    recovered = await call(gateway)
+    print(f"after reset timeout with a healthy provider: {recovered}, circuit {gateway.breaker.state}")
+    return provider.calls == 6 and fast == "rejected" and recovered == "ok" and gateway.breaker.state == "closed"
+
+
+async def main_async(args) -> int:
+    results = [await concurrency_limits(args), await timeouts(args), await circuit_breaker(args)]
+    print("\nAll gateway scenarios behaved as expected" if all(results) else "\nSome gateway scenarios failed")
+    return 0 if all(results) else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM gateway scenarios against the fake provider")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
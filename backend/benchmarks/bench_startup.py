@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inicialização: import do server.py, create_app(), lifespan (índices + warm-up) e
+latência da primeira requisição, cada rodada em um interpretador novo.
+
+Não depende de CI: grava um baseline JSON e compara execuções locais, como o load_test.py.
+
+Uso:
+    python backend/benchmarks/bench_startup.py --rounds 5
+    python backend/benchmarks/bench_startup.py --save-baseline backend/benchmarks/startup_baseline.json
+    python backend/benchmarks/bench_startup.py --baseline backend/benchmarks/startup_baseline.json
+
+Sem MongoDB acessível, use --no-lifespan para medir apenas import e create_app().
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# Runs in a fresh interpreter so that every round pays the real cold-start cost
+PROBE = r"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+import server
+timings = {"import": time.perf_counter() - start}
+
+start = time.perf_counter()
+app = server.create_app()
+timings["create_app"] = time.perf_counter() - start
+
+async def lifespan_and_first_request():
+    import httpx
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        timings["lifespan"] = time.perf_counter() - start
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            response = await client.post("/api/auth/login", json={"email": "nobody@bench", "password": "x"})
+            timings["first_request"] = time.perf_counter() - start
+            assert response.status_code in (401, 429), response.status_code
+
+if sys.argv[1] == "lifespan":
+    asyncio.run(lifespan_and_first_request())
+print(json.dumps(timings))
+"""
+
+
+def run_round(with_lifespan: bool, env: dict) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, "lifespan" if with_lifespan else "import"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IntraAMVALI cold start benchmark")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--mongo-url', default=os.environ.get('BENCH_MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default='intraamvali_bench')
+    parser.add_argument('--no-lifespan', action='store_true', help="only measure import and create_app()")
+    parser.add_argument('--baseline', help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', help="write this run's medians as a baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    env = {**os.environ, "MONGO_URL": args.mongo_url, "DB_NAME": args.db_name}
+    rounds = [run_round(not args.no_lifespan, env) for _ in range(args.rounds)]
+    results = {
+        phase: round(float(np.median([r[phase] for r in rounds])) * 1000, 1)
+        for phase in rounds[0]
+    }
+
+    print(f"Median of {args.rounds} cold starts (ms):")
+    for phase, ms in results.items():
+        print(f"  {phase:<14} {ms:9.1f}")
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline and Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text())
+        regressions = [
+            f"{phase}: {baseline[phase]}ms -> {ms}ms"
+            for phase, ms in results.items()
+            if phase in baseline and ms > baseline[phase] * (1 + args.tolerance)
+        ]
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
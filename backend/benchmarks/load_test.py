@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga da API contra um MongoDB local (mongod) ou mongomock-motor.
+
+Sobe o backend localmente, popula a base com volumes realistas e executa cenários concorrentes,
+reportando vazão e latências p50/p95/p99. Com --baseline, compara com uma execução anterior e
+retorna código 1 quando algum cenário regride além da tolerância.
+
+Uso:
+    # mongod local, backend em subprocesso com 2 workers
+    python backend/benchmarks/load_test.py --mongo-url mongodb://localhost:27017 --workers 2
+
+    # sem mongod: backend em processo com mongomock-motor (volumes menores)
+    python backend/benchmarks/load_test.py --mongomock --projects 5000 --notifications 20000
+
+    # grava / compara baseline
+    python backend/benchmarks/load_test.py --save-baseline backend/benchmarks/baseline.json
+    python backend/benchmarks/load_test.py --baseline backend/benchmarks/baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from seeding import SEED_ADMIN_EMAIL, SEED_PASSWORD, SyntheticDataset, seed_database  # noqa: E402
+
+
+# ==================== SCENARIOS ====================
+async def login_storm(client, ctx):
+    email = random.choice(ctx['login_emails'])
+    return await client.post("/api/auth/login", json={"email": email, "password": SEED_PASSWORD})
+
+
+async def dashboard_refresh(client, ctx):
+    if random.random() < 0.5:
+        return await client.get("/api/dashboard/stats", headers=ctx['admin_headers'])
+    municipality_id = random.choice(ctx['municipality_ids'])
+    return await client.get(f"/api/dashboard/municipality/{municipality_id}", headers=ctx['admin_headers'])
+
+
+async def queue_view(client, ctx):
+    return await client.get("/api/queue", headers=ctx['admin_headers'])
+
+
+async def stage_updates(client, ctx):
+    project_id = random.choice(ctx['project_ids'])
+    stage = {"stage_index": random.randrange(6), "status": random.choice(["in_progress", "completed"])}
+    return await client.put(f"/api/projects/{project_id}/stage", json=stage, headers=ctx['admin_headers'])
+
+
+SCENARIOS = {
+    "login_storm": login_storm,
+    "dashboard_refresh": dashboard_refresh,
+    "queue_view": queue_view,
+    "stage_updates": stage_updates,
+}
+
+
+async def run_scenario(client, name, ctx, concurrency: int, duration: float) -> dict:
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, ctx)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    samples = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(np.percentile(samples, 50)), 1),
+        "p95_ms": round(float(np.percentile(samples, 95)), 1),
+        "p99_ms": round(float(np.percentile(samples, 99)), 1),
+    }
+
+
+# ==================== BASELINE ====================
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+    return regressions
+
+
+# ==================== APP TARGETS ====================
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server_process(mongo_url: str, db_name: str, workers: int):
+    port = _free_port()
+    # The login storm would otherwise be throttled by the per-account login limit
+    env = {**os.environ, "MONGO_URL": mongo_url, "DB_NAME": db_name, "LOGIN_RATE_LIMIT_PER_MINUTE": "0"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:create_app", "--factory", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if httpx.get(f"{base_url}/api/", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("backend did not start")
+
+
+def in_process_app(db_name: str):
+    """Import the app with a mongomock-motor database swapped in for the Motor one"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", db_name)
+    os.environ.setdefault("LOGIN_RATE_LIMIT_PER_MINUTE", "0")
+    import server
+
+    app = server.create_app()
+    server.db = server.read_db = AsyncMongoMockClient()[db_name]
+    return app, server.db
+
+
+async def build_context(client, dataset: SyntheticDataset) -> dict:
+    response = await client.post("/api/auth/login", json={"email": SEED_ADMIN_EMAIL, "password": SEED_PASSWORD})
+    response.raise_for_status()
+    return {
+        "admin_headers": {"Authorization": f"Bearer {response.json()['token']}"},
+        "login_emails": [u['email'] for u in dataset.user_docs],
+        "municipality_ids": [m['id'] for m in dataset.municipality_docs],
+        "project_ids": dataset.project_ids,
+    }
+
+
+async def main_async(args) -> int:
+    dataset = SyntheticDataset(
+        municipalities=args.municipalities, projects=args.projects, notifications=args.notifications,
+        seed=args.seed, bcrypt_rounds=args.bcrypt_rounds
+    )
+
+    process = None
+    if args.mongomock:
+        app, db = in_process_app(args.db_name)
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://bench"
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        db = AsyncIOMotorClient(args.mongo_url)[args.db_name]
+        transport = None
+        base_url = args.base_url
+
+    print(f"Seeding {args.municipalities} municipalities, {args.projects:,} projects, {args.notifications:,} notifications...")
+    seeded = await seed_database(db, dataset, batch_size=args.batch_size)
+    print(f"Seeded: {json.dumps(seeded)}")
+
+    if not args.mongomock and not base_url:
+        process, base_url = start_server_process(args.mongo_url, args.db_name, args.workers)
+
+    results = {}
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=60) as client:
+            ctx = await build_context(client, dataset)
+            for name in args.scenarios:
+                print(f"Running {name} ({args.concurrency} concurrent, {args.duration}s)...")
+                results[name] = await run_scenario(client, name, ctx, args.concurrency, args.duration)
+                print(f"  {json.dumps(results[name])}")
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    print("\n{:<20} {:>10} {:>8} {:>10} {:>9} {:>9} {:>9}".format(
+        "scenario", "requests", "errors", "req/s", "p50 ms", "p95 ms", "p99 ms"))
+    for name, r in results.items():
+        print("{:<20} {:>10} {:>8} {:>10} {:>9} {:>9} {:>9}".format(
+            name, r['requests'], r['errors'], r['throughput_rps'], r['p50_ms'], r['p95_ms'], r['p99_ms']))
+
+    if args.save_baseline:
+        Path(args.save_baseline).write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline and Path(args.baseline).exists():
+        regressions = compare_with_baseline(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IntraAMVALI API load test")
+    parser.add_argument('--mongo-url', default=os.environ.get('BENCH_MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default='intraamvali_bench')
+    parser.add_argument('--mongomock', action='store_true', help="run the app in-process on mongomock-motor")
+    parser.add_argument('--base-url', help="target an already running backend instead of starting one")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--municipalities', type=int, default=100)
+    parser.add_argument('--projects', type=int, default=100_000)
+    parser.add_argument('--notifications', type=int, default=1_000_000)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help="cost of the shared synthetic password hash")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=20.0, help="seconds per scenario")
+    parser.add_argument('--baseline', help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', help="write this run's results as a baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Barramento de invalidação: acompanha as alterações nas coleções do MongoDB e entrega eventos de
+granularidade fina (coleção, id do documento, campos observados) aos caches inscritos, inclusive para
+escritas feitas por outro worker, pelo /seed, por scripts (seeding.py) ou direto no banco.
+
+A fonte é escolhida ao iniciar (INVALIDATION_BUS_MODE=auto|change_stream|polling):
+
+    change streams   replica set / Atlas: eventos em tempo real, retomados pelo resume token após falhas
+    polling          MongoDB standalone: consulta periódica pelos campos de timestamp de cada coleção
+
+O polling recua a marca d'água em `overlap` segundos a cada consulta, para não perder escritas carimbadas
+pouco antes dela mas confirmadas depois (ou carimbadas por um worker com o relógio atrasado); o que já
+foi entregue com o mesmo timestamp é descartado. Remoções só aparecem pela queda na contagem: uma remoção
+e uma inserção no mesmo intervalo se compensam e a remoção passa despercebida até a próxima queda ou a
+expiração dos caches.
+
+Um evento sem id significa "qualquer documento da coleção pode ter mudado" (remoção, drop, rajada de
+alterações, histórico perdido); os assinantes então invalidam tudo o que depende da coleção.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}  # not a replica set / unrecognized $changeStream stage
+CHANGE_STREAM_HISTORY_LOST = 286
+
+
+class ChangeEvent(NamedTuple):
+    collection: str
+    document_id: Optional[str] = None  # None: anything in the collection may have changed
+    document: Optional[dict] = None    # the watched fields of the document after the change
+
+
+class WatchedCollection(NamedTuple):
+    name: str
+    fields: Sequence[str] = ()                          # copied into ChangeEvent.document
+    timestamp_fields: Sequence[str] = ("updated_at",)   # what polling compares against its watermark
+
+
+Handler = Callable[[ChangeEvent], Awaitable[None]]
+
+
+class _PollState:
+    """Where polling stands on one collection"""
+
+    def __init__(self):
+        self.watermark: Optional[str] = None
+        self.count = 0
+        self.seen: Dict[str, Tuple] = {}  # id -> timestamps already delivered, within the overlap window
+
+
+class InvalidationBus:
+    def __init__(self, db, collections: Sequence[WatchedCollection], mode: str = "auto",
+                 poll_interval: float = 2.0, batch_window: float = 0.05, max_events_per_batch: int = 200,
+                 overlap: float = 5.0):
+        self.db = db
+        self.collections = {c.name: c for c in collections}
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.overlap = overlap
+        self.batch_window = batch_window
+        self.max_events_per_batch = max_events_per_batch
+        self.source: Optional[str] = None
+        self.events_delivered = 0
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._pending: Dict[str, Dict[Optional[str], ChangeEvent]] = {}
+        self._wake = asyncio.Event()
+
+    def subscribe(self, collection: str, handler: Handler):
+        if collection not in self.collections:
+            raise ValueError(f"{collection} is not watched by this bus")
+        self._handlers.setdefault(collection, []).append(handler)
+
+    def collect(self, event: ChangeEvent):
+        """
+        Queue an event for the next delivery. Repeats of a document collapse into one, and a burst larger
+        than max_events_per_batch (a seed, a bulk rescore) collapses into one collection-wide event.
+        """
+        if event.collection not in self._handlers:
+            return
+        bucket = self._pending.setdefault(event.collection, {})
+        if None in bucket:
+            return
+        if event.document_id is None or len(bucket) >= self.max_events_per_batch:
+            bucket.clear()
+            bucket[None] = ChangeEvent(event.collection)
+        else:
+            bucket[event.document_id] = event
+        self._wake.set()
+
+    async def deliver_pending(self):
+        pending, self._pending = self._pending, {}
+        for collection, bucket in pending.items():
+            for event in bucket.values():
+                for handler in self._handlers.get(collection, ()):
+                    try:
+                        await handler(event)
+                    except Exception as e:
+                        logger.error(f"Invalidation handler for {collection} failed: {e}")
+                self.events_delivered += 1
+
+    async def run(self):
+        """Tail the best available source until cancelled, restarting (and invalidating everything) after errors"""
+        delivery = asyncio.create_task(self._deliver_forever())
+        try:
+            while True:
+                try:
+                    if self.mode == "change_stream" or (self.mode == "auto" and await self._change_streams_supported()):
+                        self.source = "change_stream"
+                        await self._tail_change_streams()
+                    else:
+                        self.source = "polling"
+                        await self._poll()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Invalidation bus ({self.source}) failed, restarting: {e}")
+                    # Changes may have been missed while the source was down
+                    for name in self._handlers:
+                        self.collect(ChangeEvent(name))
+                    await asyncio.sleep(1)
+        finally:
+            delivery.cancel()
+
+    async def _deliver_forever(self):
+        while True:
+            await self._wake.wait()
+            # A short window lets a burst of changes arrive before they are coalesced and delivered
+            await asyncio.sleep(self.batch_window)
+            self._wake.clear()
+            await self.deliver_pending()
+
+    async def _change_streams_supported(self) -> bool:
+        try:
+            async with self.db.watch([], max_await_time_ms=1) as stream:
+                await stream.try_next()
+            return True
+        except Exception as e:
+            if getattr(e, 'code', None) in CHANGE_STREAM_UNSUPPORTED:
+                logger.info("Change streams unavailable, the invalidation bus polls instead")
+                return False
+            raise
+
+    # ==================== CHANGE STREAMS ====================
+    def _pipeline(self) -> list:
+        fields = {"id"}
+        for name in self._handlers:
+            fields.update(self.collections[name].fields)
+        return [
+            {"$match": {"ns.coll": {"$in": list(self._handlers)}}},
+            {"$project": {"operationType": 1, "ns.coll": 1, **{f"fullDocument.{field}": 1 for field in sorted(fields)}}}
+        ]
+
+    def _change_event(self, change: dict) -> ChangeEvent:
+        collection = change['ns']['coll']
+        document = change.get('fullDocument')
+        # Deletes carry no document (and updateLookup finds none if it was deleted since): the id is unknown
+        if change['operationType'] not in ("insert", "update", "replace") or not document:
+            return ChangeEvent(collection)
+        watched = self.collections[collection].fields
+        return ChangeEvent(collection, document.get('id'), {field: document.get(field) for field in watched})
+
+    async def _tail_change_streams(self):
+        resume_token = None
+        while True:
+            try:
+                async with self.db.watch(self._pipeline(), full_document="updateLookup", resume_after=resume_token) as stream:
+                    async for change in stream:
+                        self.collect(self._change_event(change))
+                        resume_token = stream.resume_token
+            except Exception as e:
+                if getattr(e, 'code', None) != CHANGE_STREAM_HISTORY_LOST:
+                    raise
+                # The oplog moved past the token: start from now and treat everything as changed
+                logger.warning("Invalidation bus resume token expired, invalidating all watched collections")
+                resume_token = None
+                for name in self._handlers:
+                    self.collect(ChangeEvent(name))
+
+    # ==================== POLLING ====================
+    async def _latest(self, watched: WatchedCollection) -> Optional[str]:
+        latest = None
+        for field in watched.timestamp_fields:
+            docs = await self.db[watched.name].find(
+                {field: {"$ne": None}}, {"_id": 0, field: 1}
+            ).sort(field, -1).limit(1).to_list(1)
+            if docs and (latest is None or docs[0][field] > latest):
+                latest = docs[0][field]
+        return latest
+
+    def _rewind(self, watermark: Optional[str]) -> Optional[str]:
+        if watermark is None or not self.overlap:
+            return watermark
+        try:
+            return (datetime.fromisoformat(watermark) - timedelta(seconds=self.overlap)).isoformat()
+        except ValueError:
+            return watermark
+
+    @staticmethod
+    def _since_query(watched: WatchedCollection, since: Optional[str]) -> dict:
+        if since is None:
+            return {}
+        return {"$or": [{field: {"$gt": since}} for field in watched.timestamp_fields]}
+
+    @staticmethod
+    def _stamp(watched: WatchedCollection, doc: dict) -> Tuple:
+        return tuple(doc.get(field) for field in watched.timestamp_fields)
+
+    async def _reset(self, watched: WatchedCollection, state: _PollState):
+        """Start over from the newest timestamps, treating everything inside the overlap window as delivered"""
+        state.watermark = await self._latest(watched)
+        projection = {"_id": 0, "id": 1, **{f: 1 for f in watched.timestamp_fields}}
+        docs = await self.db[watched.name].find(
+            self._since_query(watched, self._rewind(state.watermark)), projection
+        ).to_list(None) if state.watermark is not None else []
+        state.seen = {doc.get('id'): self._stamp(watched, doc) for doc in docs}
+
+    async def _poll(self):
+        # Start from the newest timestamps: history before the bus started is not replayed
+        watched = [self.collections[name] for name in self._handlers]
+        states = {w.name: _PollState() for w in watched}
+        for w in watched:
+            states[w.name].count = await self.db[w.name].estimated_document_count()
+            await self._reset(w, states[w.name])
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for w in watched:
+                await self._poll_collection(w, states[w.name])
+
+    async def _poll_collection(self, watched: WatchedCollection, state: _PollState):
+        # Removals leave no timestamp behind; a shrinking collection is the only trace polling sees
+        current_count = await self.db[watched.name].estimated_document_count()
+        shrank = current_count < state.count
+        state.count = current_count
+        if shrank:
+            self.collect(ChangeEvent(watched.name))
+            await self._reset(watched, state)
+            return
+
+        projection = {"_id": 0, "id": 1, **{f: 1 for f in watched.fields}, **{f: 1 for f in watched.timestamp_fields}}
+        # Everything seen in the window comes back again, so the limit leaves room for it
+        docs = await self.db[watched.name].find(
+            self._since_query(watched, self._rewind(state.watermark)), projection
+        ).limit(self.max_events_per_batch + len(state.seen) + 1).to_list(None)
+        fresh = [doc for doc in docs if state.seen.get(doc.get('id')) != self._stamp(watched, doc)]
+        if len(fresh) > self.max_events_per_batch:
+            self.collect(ChangeEvent(watched.name))
+            await self._reset(watched, state)
+            return
+
+        for doc in fresh:
+            self.collect(ChangeEvent(watched.name, doc.get('id'), {f: doc.get(f) for f in watched.fields}))
+            state.seen[doc.get('id')] = self._stamp(watched, doc)
+            for field in watched.timestamp_fields:
+                if doc.get(field) is not None and (state.watermark is None or doc[field] > state.watermark):
+                    state.watermark = doc[field]
+        # Forget what has fallen out of the window: it cannot come back without a newer timestamp
+        since = self._rewind(state.watermark)
+        state.seen = {doc_id: stamp for doc_id, stamp in state.seen.items()
+                      if since is None or any(t is not None and t > since for t in stamp)}
@@ -0,0 +1,388 @@
+"""
+Gateway único para chamadas ao LLM: limites de concorrência (global e por município), timeout e
+circuit breaker que falha rápido para as respostas de fallback quando o provedor está degradado.
+
+O provedor é escolhido por LLM_PROVIDER:
+
+    emergent    emergentintegrations (padrão quando EMERGENT_LLM_KEY está definida)
+    anthropic   Messages API via um httpx.AsyncClient compartilhado (conexões reaproveitadas)
+    fake        provedor local com latência/falhas configuráveis, para testes e benchmarks
+"""
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_MODEL = ("anthropic", "claude-sonnet-4-5-20250929")
+
+
+class LLMUnavailable(Exception):
+    """Raised without calling the provider: none configured, circuit open, or no free slot in time"""
+
+
+# ==================== PROVIDERS ====================
+class LLMProvider:
+    async def complete(self, system: str, prompt: str, session_id: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, system: str, prompt: str, session_id: str) -> AsyncIterator[str]:
+        # Providers without streaming deliver the whole answer as a single chunk
+        yield await self.complete(system, prompt, session_id)
+
+    async def warm_up(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class EmergentLLMProvider(LLMProvider):
+    """LlmChat is session-scoped, so one is built per call; its HTTP client is managed by the library"""
+
+    def __init__(self, api_key: str, model: tuple = DEFAULT_MODEL):
+        self.api_key = api_key
+        self.model = model
+        self._classes = None
+
+    def _load(self):
+        # emergentintegrations is slow to import: loaded once, normally during the startup warm-up
+        if self._classes is None:
+            from emergentintegrations.llm.chat import LlmChat, UserMessage
+            self._classes = (LlmChat, UserMessage)
+        return self._classes
+
+    async def warm_up(self):
+        await asyncio.to_thread(self._load)
+
+    async def complete(self, system: str, prompt: str, session_id: str) -> str:
+        LlmChat, UserMessage = self._load()
+        chat = LlmChat(api_key=self.api_key, session_id=session_id, system_message=system).with_model(*self.model)
+        return await chat.send_message(UserMessage(text=prompt))
+
+
+class AnthropicHTTPProvider(LLMProvider):
+    """Messages API over one long-lived httpx client, so connections and TLS sessions are reused"""
+
+    def __init__(self, api_key: str, base_url: str = "https://api.anthropic.com", model: str = DEFAULT_MODEL[1],
+                 max_connections: int = 20, max_tokens: int = 2048):
+        import httpx
+
+        self.model = model
+        self.max_tokens = max_tokens
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"x-api-key": api_key, "anthropic-version": "2023-06-01"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+
+    def _payload(self, system: str, prompt: str, session_id: str, stream: bool = False) -> dict:
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "system": system,
+            "messages": [{"role": "user", "content": prompt}],
+            "metadata": {"user_id": session_id},
+            "stream": stream,
+        }
+
+    async def complete(self, system: str, prompt: str, session_id: str) -> str:
+        response = await self.client.post("/v1/messages", json=self._payload(system, prompt, session_id))
+        response.raise_for_status()
+        return "".join(block.get("text", "") for block in response.json().get("content", []))
+
+    async def stream(self, system: str, prompt: str, session_id: str) -> AsyncIterator[str]:
+        async with self.client.stream("POST", "/v1/messages", json=self._payload(system, prompt, session_id, stream=True)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[5:])
+                if event.get("type") == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                    yield event["delta"]["text"]
+                elif event.get("type") == "error":
+                    raise RuntimeError(f"LLM stream error: {event.get('error')}")
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class FakeLLMProvider(LLMProvider):
+    """Local stand-in: answers `response` after `latency` seconds and fails with probability `failure_rate`"""
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, response: Optional[str] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.response = response or json.dumps({"complexity": "media", "justification": "fake provider", "confidence": 0.5})
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def complete(self, system: str, prompt: str, session_id: str) -> str:
+        return "".join([chunk async for chunk in self.stream(system, prompt, session_id)])
+
+    async def stream(self, system: str, prompt: str, session_id: str, chunk_size: int = 8) -> AsyncIterator[str]:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            chunks = [self.response[i:i + chunk_size] for i in range(0, len(self.response), chunk_size)]
+            if random.random() < self.failure_rate:
+                await asyncio.sleep(self.latency)
+                raise RuntimeError("fake provider failure")
+            for chunk in chunks:
+                await asyncio.sleep(self.latency / len(chunks))
+                yield chunk
+        finally:
+            self.in_flight -= 1
+
+
+def provider_from_env() -> Optional[LLMProvider]:
+    name = os.environ.get('LLM_PROVIDER') or ("emergent" if os.environ.get('EMERGENT_LLM_KEY') else "")
+    if name == "emergent":
+        return EmergentLLMProvider(os.environ['EMERGENT_LLM_KEY'])
+    if name == "anthropic":
+        return AnthropicHTTPProvider(
+            os.environ['ANTHROPIC_API_KEY'],
+            base_url=os.environ.get('LLM_BASE_URL', 'https://api.anthropic.com'),
+            max_connections=int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+        )
+    if name == "fake":
+        return FakeLLMProvider(
+            latency=float(os.environ.get('FAKE_LLM_LATENCY_SECONDS', '0.05')),
+            failure_rate=float(os.environ.get('FAKE_LLM_FAILURE_RATE', '0'))
+        )
+    if name:
+        raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+    return None
+
+
+# ==================== CIRCUIT BREAKER ====================
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for `reset_timeout` seconds;
+    then a single trial call (half-open) decides whether to close it again or re-open it.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return self.state != self.OPEN
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """The allowed call never reached the provider: neither a success nor a failure"""
+        self._trial_in_flight = False
+
+
+# ==================== GATEWAY ====================
+class LLMGateway:
+    def __init__(self, provider: Optional[LLMProvider], max_concurrency: int = 8, max_per_municipality: int = 2,
+                 timeout: float = 30.0, breaker: Optional[CircuitBreaker] = None,
+                 observe: Optional[Callable[[str], object]] = None,
+                 on_prompt: Optional[Callable[[str, str, str], None]] = None):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_per_municipality = max_per_municipality
+        self.breaker = breaker or CircuitBreaker()
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._per_municipality: Dict[str, asyncio.Semaphore] = {}
+        self._observe = observe or _no_observation
+        self._on_prompt = on_prompt
+
+    @classmethod
+    def from_env(cls, observe=None, on_prompt=None) -> "LLMGateway":
+        return cls(
+            provider_from_env(),
+            max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', '8')),
+            max_per_municipality=int(os.environ.get('LLM_MAX_CONCURRENCY_PER_MUNICIPALITY', '2')),
+            timeout=float(os.environ.get('LLM_TIMEOUT_SECONDS', '30')),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get('LLM_BREAKER_FAILURES', '5')),
+                reset_timeout=float(os.environ.get('LLM_BREAKER_RESET_SECONDS', '30'))
+            ),
+            observe=observe,
+            on_prompt=on_prompt,
+        )
+
+    @property
+    def configured(self) -> bool:
+        return self.provider is not None
+
+    def _municipality_semaphore(self, municipality_id: Optional[str]) -> Optional[asyncio.Semaphore]:
+        """Per-municipality cap; calls made on no municipality's behalf (AMVALI staff) only take a global slot"""
+        if not municipality_id:
+            return None
+        if municipality_id not in self._per_municipality:
+            self._per_municipality[municipality_id] = asyncio.Semaphore(self.max_per_municipality)
+        return self._per_municipality[municipality_id]
+
+    async def _acquire(self, semaphore: asyncio.Semaphore, deadline: float):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise LLMUnavailable("LLM concurrency limit reached") from None
+
+    @asynccontextmanager
+    async def _provider_slot(self, endpoint: str, municipality_id: Optional[str]):
+        """
+        Breaker check plus both concurrency slots; yields the call deadline. The timeout covers
+        waiting for a slot too, but only provider errors and timeouts count towards opening the circuit.
+        """
+        if self.provider is None:
+            raise LLMUnavailable("no LLM provider configured")
+        if not self.breaker.allow():
+            raise LLMUnavailable("LLM provider circuit is open")
+
+        deadline = time.monotonic() + self.timeout
+        municipality_slot = self._municipality_semaphore(municipality_id)
+        reached_provider = False
+        try:
+            if municipality_slot is not None:
+                await self._acquire(municipality_slot, deadline)
+            try:
+                await self._acquire(self._global, deadline)
+                try:
+                    reached_provider = True
+                    async with self._observe(endpoint):
+                        yield deadline
+                finally:
+                    self._global.release()
+            finally:
+                if municipality_slot is not None:
+                    municipality_slot.release()
+        except Exception:
+            if reached_provider:
+                self.breaker.record_failure()
+            else:
+                self.breaker.release()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+
+    async def complete(self, endpoint: str, system: str, prompt: str, session_id: str,
+                       municipality_id: Optional[str] = None) -> str:
+        self._report_prompt(endpoint, system, prompt)
+        async with self._provider_slot(endpoint, municipality_id) as deadline:
+            return await asyncio.wait_for(
+                self.provider.complete(system, prompt, session_id), max(deadline - time.monotonic(), 0)
+            )
+
+    async def stream(self, endpoint: str, system: str, prompt: str, session_id: str,
+                     municipality_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Like complete, yielding text as it arrives; the timeout then bounds the wait for each chunk"""
+        self._report_prompt(endpoint, system, prompt)
+        async with self._provider_slot(endpoint, municipality_id):
+            chunks = self.provider.stream(system, prompt, session_id).__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+
+    def _report_prompt(self, endpoint: str, system: str, prompt: str):
+        if self._on_prompt is not None and self.provider is not None:
+            self._on_prompt(endpoint, system, prompt)
+
+    async def warm_up(self):
+        if self.provider is not None:
+            await self.provider.warm_up()
+
+    async def close(self):
+        if self.provider is not None:
+            await self.provider.close()
+
+
+@asynccontextmanager
+async def _no_observation(endpoint: str):
+    yield
+
+
+# ==================== STREAMED JSON ====================
+class JSONFieldStream:
+    """
+    Incremental reader for a JSON object arriving in arbitrary chunks. feed() returns the top-level
+    fields whose values were completed by that chunk; text before the opening brace (prose,
+    code fences) is skipped.
+    """
+
+    def __init__(self):
+        self._member: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.done = False
+
+    def feed(self, text: str) -> List[Tuple[str, object]]:
+        fields = []
+        for ch in text:
+            if self.done:
+                break
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                continue
+            if self._in_string:
+                self._member.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == ',' and self._depth == 1:
+                fields.extend(self._flush())
+                continue
+            if ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    fields.extend(self._flush())
+                    self.done = True
+                    continue
+            elif ch in '{[':
+                self._depth += 1
+            elif ch == '"':
+                self._in_string = True
+            self._member.append(ch)
+        return fields
+
+    def _flush(self) -> List[Tuple[str, object]]:
+        member = "".join(self._member).strip()
+        self._member = []
+        if not member:
+            return []
+        try:
+            return list(json.loads("{" + member + "}").items())
+        except ValueError:
+            return []
@@ -0,0 +1,90 @@
+"""
+Orçamento de tokens para os prompts de IA: estima o tamanho, corta campos longos e limita listas
+(anexos, equipe) antes da chamada ao provedor, para que a latência do LLM não cresça com os dados.
+
+Limites por variáveis de ambiente (em tokens estimados):
+
+    PROMPT_MAX_TOKENS         soma dos campos variáveis de um prompt (padrão 1500)
+    PROMPT_FIELD_MAX_TOKENS   um único campo de texto livre (padrão 400)
+    PROMPT_MAX_LIST_ITEMS     itens listados, como nomes de anexos (padrão 20)
+    PROMPT_TEAM_TOP_K         técnicos descritos ao modelo (padrão 5)
+"""
+import os
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Rough average for Portuguese prose with Claude's tokenizer; good enough to bound prompt size
+CHARS_PER_TOKEN = 4
+ELLIPSIS = " […] "
+HEAD_SHARE = 0.75
+MIN_FIELD_TOKENS = 32
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text or "") // CHARS_PER_TOKEN)
+
+
+def truncate(text: str, max_tokens: int) -> str:
+    """
+    Keep the start and the end of `text` within `max_tokens`, cut on whitespace: the opening usually
+    states what is requested and the closing what is expected, the middle is detail.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(max_tokens * CHARS_PER_TOKEN - len(ELLIPSIS), 0)
+    head = text[:int(max_chars * HEAD_SHARE)]
+    if " " in head:
+        head = head[:head.rindex(" ")]
+    tail = text[len(text) - (max_chars - len(head)):] if max_chars > len(head) else ""
+    if " " in tail:
+        tail = tail[tail.index(" ") + 1:]
+    return head.rstrip() + ELLIPSIS + tail.lstrip()
+
+
+def join_limited(items: Sequence[str], max_items: int, separator: str = ", ") -> str:
+    items = [item for item in items if item]
+    if len(items) <= max_items:
+        return separator.join(items)
+    return separator.join(items[:max_items]) + f" (+{len(items) - max_items} outros)"
+
+
+def top_k(items: Sequence[dict], k: int, key: Callable[[dict], object]) -> List[dict]:
+    """The k best items by `key` (descending), ties kept in their original order"""
+    return sorted(items, key=key, reverse=True)[:k]
+
+
+class PromptBudget:
+    def __init__(self, max_tokens: int = 1500, field_tokens: int = 400, max_list_items: int = 20, team_top_k: int = 5):
+        self.max_tokens = max_tokens
+        self.field_tokens = field_tokens
+        self.max_list_items = max_list_items
+        self.team_top_k = team_top_k
+
+    @classmethod
+    def from_env(cls) -> "PromptBudget":
+        return cls(
+            max_tokens=int(os.environ.get('PROMPT_MAX_TOKENS', '1500')),
+            field_tokens=int(os.environ.get('PROMPT_FIELD_MAX_TOKENS', '400')),
+            max_list_items=int(os.environ.get('PROMPT_MAX_LIST_ITEMS', '20')),
+            team_top_k=int(os.environ.get('PROMPT_TEAM_TOP_K', '5')),
+        )
+
+    def fit(self, fields: Dict[str, str]) -> Tuple[Dict[str, str], List[str]]:
+        """
+        Cap each field, then shrink the largest ones until the total fits. Returns the fitted
+        fields and the names of those that were cut.
+        """
+        fitted = {name: truncate(value, self.field_tokens) for name, value in fields.items()}
+        sizes = {name: estimate_tokens(value) for name, value in fitted.items()}
+        excess = sum(sizes.values()) - self.max_tokens
+        while excess > 0:
+            name = max(sizes, key=sizes.get)
+            if sizes[name] <= MIN_FIELD_TOKENS:
+                break
+            fitted[name] = truncate(fitted[name], max(sizes[name] - excess, MIN_FIELD_TOKENS))
+            size = estimate_tokens(fitted[name])
+            if size >= sizes[name]:
+                break
+            excess -= sizes[name] - size
+            sizes[name] = size
+        truncated = [name for name in fields if fitted[name] != fields[name]]
+        return fitted, truncated
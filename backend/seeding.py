@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Geração de massa de dados: documentos determinísticos inseridos com insert_many em lotes.
+
+Usado pelo POST /seed (volume sintético opcional), pelos benchmarks e pela linha de comando:
+
+    # popula o MongoDB configurado (MONGO_URL / DB_NAME)
+    python backend/seeding.py --projects 100000 --notifications 1000000
+
+    # grava fixtures JSONL sem MongoDB e as carrega depois
+    python backend/seeding.py --projects 100000 --output fixtures/
+    python backend/seeding.py --from-fixtures fixtures/
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+import bcrypt
+import numpy as np
+
+STAGE_NAMES = [
+    "Solicitação Formal",
+    "Briefing Técnico",
+    "Diagnóstico de Complexidade",
+    "Validação Conjunta",
+    "Execução",
+    "Entrega e Encerramento",
+]
+STATUS_BY_STAGE = ["solicitacao", "briefing", "diagnostico", "validacao", "execucao", "entrega"]
+PROJECT_TYPES = np.array(["pavimentacao", "edificacao", "infraestrutura"], dtype=object)
+COMPLEXITIES = np.array(["minima", "media", "alta"], dtype=object)
+COMPLEXITY_DIVISORS = {"minima": 1, "media": 5, "alta": 10}
+
+SEED_PASSWORD = "seed123"
+SEED_ADMIN_EMAIL = "seed-admin@amvali.org.br"
+SEEDED_COLLECTIONS = ("municipalities", "users", "projects", "notifications")
+# Derived from the seeded projects; stale once they are replaced
+DERIVED_COLLECTIONS = ("projects_archive", "archive_counters")
+
+
+def _uuid(rng: np.random.Generator) -> str:
+    return str(uuid.UUID(bytes=rng.bytes(16), version=4))
+
+
+def default_score(impact: np.ndarray, urgency: np.ndarray, cost: np.ndarray, complexity: np.ndarray) -> np.ndarray:
+    """IPR with the built-in policy weights; the API passes its active policy instead"""
+    divisor = np.vectorize(COMPLEXITY_DIVISORS.get, otypes=[np.float64])(complexity)
+    return (impact * 3.0 + urgency * 2.0 + cost) / divisor
+
+
+class SyntheticDataset:
+    """Deterministic documents for a given volume: the same seed always yields the same ids and values"""
+
+    def __init__(self, municipalities: int = 100, projects: int = 100_000, notifications: int = 1_000_000,
+                 technicians: int = 50, seed: int = 42, bcrypt_rounds: int = 4, password_hash: Optional[str] = None,
+                 score: Callable[..., np.ndarray] = default_score, scoring_policy_version: Optional[int] = None):
+        self.municipalities = municipalities
+        self.projects = projects
+        self.notifications = notifications
+        self.technicians = technicians
+        self.score = score
+        self.scoring_policy_version = scoring_policy_version
+        self.rng = np.random.default_rng(seed)
+        self.now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        # One hash shared by every synthetic account: bcrypt runs once instead of once per user
+        self.password_hash = password_hash or bcrypt.hashpw(SEED_PASSWORD.encode(), bcrypt.gensalt(rounds=bcrypt_rounds)).decode()
+        self.municipality_docs = []
+        self.user_docs = []
+        self.project_ids = []
+
+    def build_municipalities(self):
+        for i in range(self.municipalities):
+            self.municipality_docs.append({
+                "id": _uuid(self.rng),
+                "name": f"Município {i:03d}",
+                "code": f"M{i:03d}",
+                "contact_email": f"contato{i}@municipio.sc.gov.br",
+                "contact_phone": None,
+                "engagement_score": round(float(self.rng.uniform(30, 100)), 1),
+                "meeting_participations": int(self.rng.integers(0, 24)),
+                "clarity_score": round(float(self.rng.uniform(0, 10)), 1),
+                "financial_regularity": True,
+                "total_projects": 0,
+                "completed_projects": 0,
+                "active_stars": {},
+                "created_at": self.now.isoformat(),
+                "updated_at": self.now.isoformat(),
+            })
+        return self.municipality_docs
+
+    def build_users(self):
+        def user(email, name, role, municipality_id=None, specialties=None, workload_hours=40):
+            return {
+                "id": _uuid(self.rng),
+                "email": email,
+                "name": name,
+                "role": role,
+                "municipality_id": municipality_id,
+                "specialties": specialties or [],
+                "workload_hours": workload_hours,
+                "active_projects": 0,
+                "password_hash": self.password_hash,
+                "created_at": self.now.isoformat(),
+                "updated_at": self.now.isoformat(),
+            }
+
+        self.user_docs.append(user(SEED_ADMIN_EMAIL, "Gestor Sintético", "gestor_amvali"))
+        for i in range(self.technicians):
+            specialties = list(self.rng.choice(PROJECT_TYPES, size=int(self.rng.integers(1, 3)), replace=False))
+            self.user_docs.append(user(f"seed-tecnico{i}@amvali.org.br", f"Técnico {i}", "tecnico_amvali",
+                                       specialties=specialties, workload_hours=int(self.rng.choice([20, 30, 40]))))
+        for i, m in enumerate(self.municipality_docs):
+            self.user_docs.append(user(f"seed-municipal{i}@municipio.sc.gov.br", f"Municipal {i}", "municipal",
+                                       municipality_id=m['id']))
+        return self.user_docs
+
+    @staticmethod
+    def _tally(municipality: dict, project_type: str, status: str, priority: int):
+        """The counters the API keeps on a municipality, for one generated project"""
+        municipality['total_projects'] += 1
+        if status == "concluido":
+            municipality['completed_projects'] += 1
+        else:
+            stars = municipality['active_stars']
+            stars[project_type] = stars.get(project_type, 0) + priority
+
+    def iter_project_batches(self, batch_size: int):
+        technician_ids = [u['id'] for u in self.user_docs if u['role'] == "tecnico_amvali"]
+        for start in range(0, self.projects, batch_size):
+            n = min(batch_size, self.projects - start)
+            municipality_index = self.rng.integers(0, len(self.municipality_docs), n)
+            stage_index = self.rng.integers(0, 7, n)  # 6 means concluded
+            types = PROJECT_TYPES[self.rng.integers(0, 3, n)]
+            complexities = COMPLEXITIES[self.rng.integers(0, 3, n)]
+            impact, urgency, cost = (self.rng.integers(1, 11, n) for _ in range(3))
+            ipr = self.score(impact, urgency, cost, complexities)
+            age_days = self.rng.uniform(0, 3 * 365, n)
+            stage_days = self.rng.gamma(2.0, 5.0, (n, len(STAGE_NAMES)))
+
+            batch = []
+            for j in range(n):
+                created_at = self.now - timedelta(days=float(age_days[j]))
+                current = int(stage_index[j])
+                stages = []
+                cursor = created_at
+                for k, name in enumerate(STAGE_NAMES):
+                    stage = {"name": name, "status": "pending", "started_at": None, "completed_at": None, "notes": None}
+                    if k <= current and cursor < self.now:
+                        stage['started_at'] = cursor.isoformat()
+                        finished = cursor + timedelta(days=float(stage_days[j, k]))
+                        if k < current and finished < self.now:
+                            stage['status'] = "completed"
+                            stage['completed_at'] = finished.isoformat()
+                            cursor = finished
+                        else:
+                            stage['status'] = "in_progress"
+                            cursor = self.now
+                    stages.append(stage)
+                completed = sum(1 for s in stages if s['status'] == "completed")
+                status = "concluido" if completed == len(stages) else STATUS_BY_STAGE[min(current, 5)]
+                municipality = self.municipality_docs[municipality_index[j]]
+                project_id = _uuid(self.rng)
+                self.project_ids.append(project_id)
+                priority = int(self.rng.integers(1, 6))
+                self._tally(municipality, types[j], status, priority)
+                batch.append({
+                    "id": project_id,
+                    "title": f"Projeto {start + j}",
+                    "description": "Projeto sintético",
+                    "project_type": types[j],
+                    "municipality_id": municipality['id'],
+                    "municipality_name": municipality['name'],
+                    "priority": priority,
+                    "complexity": complexities[j],
+                    "status": status,
+                    "assigned_team": [str(t) for t in self.rng.choice(technician_ids, size=2, replace=False)] if len(technician_ids) >= 2 and current >= 3 else [],
+                    "stages": stages,
+                    "progress_percent": completed / len(stages) * 100,
+                    "ipr_score": float(ipr[j]),
+                    "scoring_policy_version": self.scoring_policy_version,
+                    "impact_score": int(impact[j]),
+                    "urgency_score": int(urgency[j]),
+                    "cost_score": int(cost[j]),
+                    "desired_deadline": "medio",
+                    "attachments": [],
+                    "version": 1,
+                    "created_at": created_at.isoformat(),
+                    "updated_at": cursor.isoformat(),
+                })
+            yield batch
+
+    def iter_notification_batches(self, batch_size: int):
+        recipients = [m['id'] for m in self.municipality_docs] + [u['id'] for u in self.user_docs]
+        for start in range(0, self.notifications, batch_size):
+            n = min(batch_size, self.notifications - start)
+            recipient_index = self.rng.integers(0, len(recipients), n)
+            project_index = self.rng.integers(0, max(len(self.project_ids), 1), n)
+            age_seconds = self.rng.uniform(0, 365 * 86400, n)
+            read = self.rng.random(n) < 0.7
+            yield [
+                {
+                    "id": _uuid(self.rng),
+                    "user_id": recipients[recipient_index[j]],
+                    "title": "Etapa atualizada",
+                    "message": "Notificação sintética",
+                    "notification_type": "info",
+                    "read": bool(read[j]),
+                    "project_id": self.project_ids[project_index[j]] if self.project_ids else None,
+                    "created_at": (self.now - timedelta(seconds=float(age_seconds[j]))).isoformat(),
+                }
+                for j in range(n)
+            ]
+
+    def iter_batches(self, batch_size: int):
+        """
+        (collection, documents) pairs: projects reference users, notifications reference projects, and
+        municipalities come after the projects their counters are tallied from
+        """
+        self.build_municipalities()
+        yield "users", self.build_users()
+        for batch in self.iter_project_batches(batch_size):
+            yield "projects", batch
+        yield "municipalities", self.municipality_docs
+        for batch in self.iter_notification_batches(batch_size):
+            yield "notifications", batch
+
+
+async def _insert_batches(collection, batches, concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    inserted = 0
+
+    async def insert(batch):
+        nonlocal inserted
+        async with semaphore:
+            await collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+
+    pending = set()
+    batches = iter(batches)
+    while True:
+        # Generating (or reading) a batch is CPU work: a worker thread keeps the event loop serving requests
+        batch = await asyncio.to_thread(next, batches, None)
+        if batch is None:
+            break
+        pending.add(asyncio.ensure_future(insert(batch)))
+        if len(pending) >= concurrency * 2:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    if pending:
+        await asyncio.gather(*pending)
+    return inserted
+
+
+async def insert_dataset(db, dataset: SyntheticDataset, batch_size: int = 10_000, concurrency: int = 4) -> dict:
+    """Insert the dataset next to whatever the collections already hold, returning counts and timings"""
+    timings = {}
+
+    start = time.perf_counter()
+    dataset.build_municipalities()
+    await db.users.insert_many(dataset.build_users(), ordered=False)
+    timings['users'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    projects = await _insert_batches(db.projects, dataset.iter_project_batches(batch_size), concurrency)
+    timings['projects'] = time.perf_counter() - start
+
+    # After the projects: their star and project counters are tallied while they are generated
+    start = time.perf_counter()
+    if dataset.municipality_docs:
+        await db.municipalities.insert_many(dataset.municipality_docs, ordered=False)
+    timings['municipalities'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    notifications = await _insert_batches(db.notifications, dataset.iter_notification_batches(batch_size), concurrency)
+    timings['notifications'] = time.perf_counter() - start
+
+    return {
+        "municipalities": len(dataset.municipality_docs),
+        "users": len(dataset.user_docs),
+        "projects": projects,
+        "notifications": notifications,
+        "seconds": {k: round(v, 2) for k, v in timings.items()},
+    }
+
+
+async def seed_database(db, dataset: SyntheticDataset, batch_size: int = 10_000, concurrency: int = 4) -> dict:
+    """Drop and reload the collections the API reads"""
+    for name in SEEDED_COLLECTIONS + DERIVED_COLLECTIONS:
+        await db[name].drop()
+    return await insert_dataset(db, dataset, batch_size, concurrency)
+
+
+# ==================== OFFLINE FIXTURES ====================
+def write_fixtures(dataset: SyntheticDataset, directory: Path, batch_size: int = 10_000) -> dict:
+    """Write one JSONL file per collection; loadable with load_fixtures or mongoimport"""
+    directory.mkdir(parents=True, exist_ok=True)
+    files = {name: open(directory / f"{name}.jsonl", "w", encoding="utf-8") for name in SEEDED_COLLECTIONS}
+    counts = dict.fromkeys(SEEDED_COLLECTIONS, 0)
+    try:
+        for name, batch in dataset.iter_batches(batch_size):
+            files[name].writelines(json.dumps(doc, ensure_ascii=False) + "\n" for doc in batch)
+            counts[name] += len(batch)
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
+
+
+def _read_jsonl_batches(path: Path, batch_size: int):
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            batch.append(json.loads(line))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+async def load_fixtures(db, directory: Path, batch_size: int = 10_000, concurrency: int = 4) -> dict:
+    counts = {}
+    for name in SEEDED_COLLECTIONS:
+        path = directory / f"{name}.jsonl"
+        if not path.exists():
+            continue
+        if name == "projects":
+            for derived in DERIVED_COLLECTIONS:
+                await db[derived].drop()
+        await db[name].drop()
+        counts[name] = await _insert_batches(db[name], _read_jsonl_batches(path, batch_size), concurrency)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IntraAMVALI synthetic data seeder")
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default=os.environ.get('DB_NAME', 'intraamvali'))
+    parser.add_argument('--municipalities', type=int, default=100)
+    parser.add_argument('--projects', type=int, default=100_000)
+    parser.add_argument('--notifications', type=int, default=1_000_000)
+    parser.add_argument('--technicians', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=10_000)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--bcrypt-rounds', type=int, default=4, help="cost of the shared synthetic password hash")
+    parser.add_argument('--password-hash', default=os.environ.get('SEED_PASSWORD_HASH'),
+                        help="precomputed bcrypt hash for every synthetic account")
+    parser.add_argument('--append', action='store_true', help="keep existing documents instead of dropping the collections")
+    parser.add_argument('--output', type=Path, help="write JSONL fixtures to this directory instead of MongoDB")
+    parser.add_argument('--from-fixtures', type=Path, help="load JSONL fixtures from this directory")
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(
+        municipalities=args.municipalities, projects=args.projects, notifications=args.notifications,
+        technicians=args.technicians, seed=args.seed, bcrypt_rounds=args.bcrypt_rounds, password_hash=args.password_hash
+    )
+    start = time.perf_counter()
+    if args.output:
+        result = write_fixtures(dataset, args.output, args.batch_size)
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        db = AsyncIOMotorClient(args.mongo_url)[args.db_name]
+        if args.from_fixtures:
+            result = asyncio.run(load_fixtures(db, args.from_fixtures, args.batch_size, args.concurrency))
+        elif args.append:
+            result = asyncio.run(insert_dataset(db, dataset, args.batch_size, args.concurrency))
+        else:
+            result = asyncio.run(seed_database(db, dataset, args.batch_size, args.concurrency))
+    print(json.dumps(result, indent=2))
+    print(f"Done in {time.perf_counter() - start:.1f}s (password for synthetic accounts: {SEED_PASSWORD})")
+
+
+if __name__ == "__main__":
+    main()
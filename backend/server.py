@@ -1,41 +1,601 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo import monitoring
+from pymongo.read_preferences import SecondaryPreferred
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Callable, Awaitable, Tuple
+from contextlib import asynccontextmanager
+import contextvars
+import threading
 import uuid
+import time
+import json
+import asyncio
+import bisect
+import hashlib
+import zlib
+import heapq
 from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
+import numpy as np
 from enum import Enum
 
+from seeding import SyntheticDataset, insert_dataset
+from shared_state import create_shared_state
+from invalidation_bus import ChangeEvent, InvalidationBus, WatchedCollection
+from llm_gateway import JSONFieldStream, LLMGateway
+from prompt_budget import PromptBudget, estimate_tokens, join_limited, top_k
+from tabular_export import ExportColumn, csv_stream, xlsx_stream
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# ==================== METRICS ====================
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, Any] = {}
+
+    def _format_labels(self, labels: tuple, extra: str = "") -> str:
+        parts = [f'{n}="{_escape_label(v)}"' for n, v in zip(self.labelnames, labels)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.extend(self._render_value(labels, value))
+        return lines
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{self._format_labels(labels)} {value}"]
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._callback = callback
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        if self._callback:
+            for labels, value in self._callback():
+                self.set(value, *labels)
+        return super().render()
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{self._format_labels(labels)} {value}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, labels, value):
+        bucket_counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, bucket_counts):
+            cumulative += bucket_count
+            bucket_label = 'le="%s"' % bound
+            lines.append(f"{self.name}_bucket{self._format_labels(labels, bucket_label)} {cumulative}")
+        inf_label = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{self._format_labels(labels, inf_label)} {count}")
+        lines.append(f"{self.name}_sum{self._format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{self._format_labels(labels)} {count}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+HTTP_REQUEST_DURATION = metrics.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")))
+HTTP_REQUEST_MONGO_COMMANDS = metrics.register(Histogram(
+    "http_request_mongo_commands", "MongoDB round-trips per HTTP request", ("route",), buckets=COUNT_BUCKETS))
+MONGO_COMMAND_DURATION = metrics.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("command",)))
+MONGO_COMMAND_FAILURES = metrics.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("command",)))
+LLM_CALL_DURATION = metrics.register(Histogram(
+    "llm_call_duration_seconds", "LLM provider call latency by AI endpoint", ("endpoint", "outcome")))
+LLM_CALL_ERRORS = metrics.register(Counter(
+    "llm_call_errors_total", "LLM provider call errors by AI endpoint", ("endpoint",)))
+LLM_PROMPT_TOKENS = metrics.register(Histogram(
+    "llm_prompt_tokens", "Estimated prompt size (system + user) per LLM call", ("endpoint",), buckets=TOKEN_BUCKETS))
+LLM_PROMPT_TRUNCATIONS = metrics.register(Counter(
+    "llm_prompt_truncations_total", "Prompt fields cut to fit the prompt budget", ("endpoint", "field")))
+EVENT_LOOP_LAG = metrics.register(Gauge(
+    "event_loop_lag_seconds", "Delay of the last event-loop heartbeat"))
+EVENT_LOOP_LAG_HISTOGRAM = metrics.register(Histogram(
+    "event_loop_lag_histogram_seconds", "Distribution of event-loop heartbeat delays",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)))
+
+MONGO_COMMANDS_BY_ROUTE = metrics.register(Counter(
+    "mongo_commands_by_route_total", "MongoDB commands attributed to the originating route", ("route", "command")))
+
+def route_template(scope: dict) -> str:
+    # Route templates keep label cardinality bounded (no raw ids in labels)
+    return getattr(scope.get("route"), "path", "unmatched")
+
+class RequestProfile:
+    """Per-request Mongo accounting, shared by reference with the executor threads running pymongo"""
+    __slots__ = ("scope", "mongo_commands", "mongo_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.mongo_commands = 0
+        self.mongo_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_template(self.scope)
+
+_request_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar('request_profile', default=None)
+
+class MongoMetricsListener(monitoring.CommandListener):
+    def started(self, event):
+        profile = _request_profile.get()
+        if profile is not None:
+            profile.mongo_commands += 1
+            MONGO_COMMANDS_BY_ROUTE.inc(profile.route, event.command_name)
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+        MONGO_COMMAND_FAILURES.inc(event.command_name)
+
+    def _finished(self, event):
+        seconds = event.duration_micros / 1_000_000
+        MONGO_COMMAND_DURATION.observe(seconds, event.command_name)
+        profile = _request_profile.get()
+        if profile is not None:
+            profile.mongo_seconds += seconds
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: one latency observation and one Mongo round-trip count per request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = [500]
+        profile = RequestProfile(scope)
+        token = _request_profile.set(profile)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    total_ms = (time.perf_counter() - start) * 1000
+                    message.setdefault("headers", []).append((b"server-timing", (
+                        f'db;dur={profile.mongo_seconds * 1000:.1f};desc="{profile.mongo_commands} queries", '
+                        f'app;dur={total_ms:.1f}'
+                    ).encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_profile.reset(token)
+            route_path = route_template(scope)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, scope["method"], route_path, str(status_code[0]))
+            HTTP_REQUEST_MONGO_COMMANDS.observe(profile.mongo_commands, route_path)
+
+@asynccontextmanager
+async def observe_llm_call(endpoint: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        LLM_CALL_DURATION.observe(time.perf_counter() - start, endpoint, "error")
+        LLM_CALL_ERRORS.inc(endpoint)
+        raise
+    LLM_CALL_DURATION.observe(time.perf_counter() - start, endpoint, "ok")
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start - interval, 0.0)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+# ==================== QUERY PROFILER ====================
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() == 'true'
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = 300
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', 'false').lower() == 'true'
+EXPLAINABLE_COMMANDS = {"find": "filter", "count": "query", "aggregate": "pipeline", "distinct": "query"}
+SLOW_QUERIES = metrics.register(Counter(
+    "mongo_slow_queries_total", "MongoDB commands slower than SLOW_QUERY_MS", ("route", "command", "collscan")))
+
+def query_shape(value):
+    """Replace literal values with their type names so filters can be grouped and logged safely"""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return f"<{type(value).__name__}>"
+
+def _plan_stages(node, inside_winning_plan: bool = False) -> List[str]:
+    stages = []
+    if isinstance(node, dict):
+        if inside_winning_plan and isinstance(node.get('stage'), str):
+            stages.append(node['stage'])
+        for key, child in node.items():
+            stages.extend(_plan_stages(child, inside_winning_plan or key in ('winningPlan', 'queryPlan')))
+    elif isinstance(node, list):
+        for child in node:
+            stages.extend(_plan_stages(child, inside_winning_plan))
+    return stages
+
+class QueryProfilerListener(monitoring.CommandListener):
+    """
+    Logs Mongo commands slower than SLOW_QUERY_MS with their route and filter shape and, for reads,
+    an explain() summary that flags collection scans. Each shape is explained at most every few minutes.
+    """
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Dict[tuple, tuple] = {}
+        self._explained_at: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE_COMMANDS and event.command_name not in ("update", "delete", "findAndModify"):
+            return
+        profile = _request_profile.get()
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (
+                profile.route if profile else "background", event.database_name, event.command
+            )
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        with self._lock:
+            pending = self._pending.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < SLOW_QUERY_MS:
+            return
+
+        route, database_name, command = pending
+        collection = command.get(event.command_name)
+        filter_key = EXPLAINABLE_COMMANDS.get(event.command_name)
+        if filter_key:
+            shape = query_shape(command.get(filter_key, {}))
+        else:
+            statements = command.get('updates') or command.get('deletes') or [command]
+            shape = query_shape(statements[0].get('q', statements[0].get('query', {})))
+
+        shape_key = (collection, event.command_name, json.dumps(shape, sort_keys=True, default=str))
+        now = time.monotonic()
+        should_explain = (
+            SLOW_QUERY_EXPLAIN and filter_key and self.loop is not None
+            and now - self._explained_at.get(shape_key, float('-inf')) > SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS
+        )
+        if should_explain:
+            self._explained_at[shape_key] = now
+            self.loop.call_soon_threadsafe(lambda: asyncio.ensure_future(
+                self._explain_and_log(route, database_name, event.command_name, command, shape, duration_ms)
+            ))
+        else:
+            SLOW_QUERIES.inc(route, event.command_name, "unknown")
+            logger.warning(f"Slow query {duration_ms:.1f}ms route={route} {event.command_name} {collection} shape={shape}")
+
+    async def _explain_and_log(self, route: str, database_name: str, command_name: str, command: dict, shape, duration_ms: float):
+        explain_target = {k: v for k, v in command.items() if not k.startswith('$') and k not in ('lsid', 'cursor', 'batchSize')}
+        if command_name == "aggregate":
+            explain_target['cursor'] = {}
+        plan = "unavailable"
+        collscan = "unknown"
+        try:
+            explanation = await client[database_name].command({"explain": explain_target, "verbosity": "queryPlanner"})
+            stages = _plan_stages(explanation)
+            collscan = "true" if "COLLSCAN" in stages else "false"
+            plan = " <- ".join(stages) or "n/a"
+        except Exception as e:
+            plan = f"explain failed: {e}"
+        SLOW_QUERIES.inc(route, command_name, collscan)
+        logger.warning(
+            f"Slow query {duration_ms:.1f}ms route={route} {command_name} {command.get(command_name)} "
+            f"shape={shape} plan={plan}{' [COLLSCAN]' if collscan == 'true' else ''}"
+        )
+
+query_profiler = QueryProfilerListener()
+
+# ==================== MONGO POOL ====================
+MONGO_POOL_WAIT = metrics.register(Histogram(
+    "mongo_pool_wait_seconds", "Time spent waiting to check a connection out of the pool", ("address",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)))
+MONGO_POOL_CHECKOUT_FAILURES = metrics.register(Counter(
+    "mongo_pool_checkout_failures_total", "Connection checkouts that failed, by reason", ("address", "reason")))
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Pool occupancy and checkout wait times; checkout events fire on the thread that waits"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.waiting: Dict[str, int] = {}
+        self.in_use: Dict[str, int] = {}
+        self.open: Dict[str, int] = {}
+
+    def _add(self, counts: Dict[str, int], address, delta: int):
+        key = "%s:%s" % address
+        with self._lock:
+            counts[key] = counts.get(key, 0) + delta
+
+    def connection_check_out_started(self, event):
+        self._local.checkout_started = time.perf_counter()
+        self._add(self.waiting, event.address, 1)
+
+    def connection_checked_out(self, event):
+        self._add(self.waiting, event.address, -1)
+        self._add(self.in_use, event.address, 1)
+        started = getattr(self._local, 'checkout_started', None)
+        if started is not None:
+            MONGO_POOL_WAIT.observe(time.perf_counter() - started, "%s:%s" % event.address)
+
+    def connection_check_out_failed(self, event):
+        self._add(self.waiting, event.address, -1)
+        MONGO_POOL_CHECKOUT_FAILURES.inc("%s:%s" % event.address, event.reason)
+
+    def connection_checked_in(self, event):
+        self._add(self.in_use, event.address, -1)
+
+    def connection_created(self, event):
+        self._add(self.open, event.address, 1)
+
+    def connection_closed(self, event):
+        self._add(self.open, event.address, -1)
+
+    # Lifecycle events the metrics do not need
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def gauge(self, counts: Dict[str, int]):
+        with self._lock:
+            return [((address,), value) for address, value in counts.items()]
+
+pool_metrics = PoolMetricsListener()
+metrics.register(Gauge("mongo_pool_waiting", "Threads waiting for a pooled connection", ("address",),
+                       callback=lambda: pool_metrics.gauge(pool_metrics.waiting)))
+metrics.register(Gauge("mongo_pool_connections_in_use", "Pooled connections checked out", ("address",),
+                       callback=lambda: pool_metrics.gauge(pool_metrics.in_use)))
+metrics.register(Gauge("mongo_pool_connections_open", "Open pooled connections", ("address",),
+                       callback=lambda: pool_metrics.gauge(pool_metrics.open)))
+
+# Client options from the environment; anything unset keeps the driver default
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", int),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", int),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", int),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", int),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", int),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", int),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", int),
+    "maxConnecting": ("MONGO_MAX_CONNECTING", int),
+    "compressors": ("MONGO_COMPRESSORS", str),  # e.g. "zstd,snappy,zlib"; zstd/snappy need their extras installed
+}
+
+def mongo_client_options() -> Dict[str, Any]:
+    options = {}
+    for option, (env_name, parse) in MONGO_CLIENT_OPTIONS.items():
+        value = os.environ.get(env_name)
+        if value:
+            options[option] = parse(value)
+    return options
+
+# Heavy read endpoints (dashboards, listings) may be served by secondaries with bounded staleness;
+# writes, authentication and read-modify-write paths always use `db` (primary)
+MONGO_SECONDARY_READS = os.environ.get('MONGO_SECONDARY_READS', 'false').lower() == 'true'
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', '120'))  # the server requires >= 90
+
+# MongoDB connection, created by create_app(); Motor only connects on first use (or the startup warm-up)
+client: Optional[AsyncIOMotorClient] = None
+db = None
+read_db = None
+
+def configure_database():
+    global client, db, read_db
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], event_listeners=[MongoMetricsListener(), query_profiler, pool_metrics],
+                                **mongo_client_options())
+    db = client[os.environ['DB_NAME']]
+    # For uncached, staleness-tolerant reads only: anything that fills a SnapshotCache reads db
+    read_db = client.get_database(
+        os.environ['DB_NAME'],
+        read_preference=SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_SECONDS)
+    ) if MONGO_SECONDARY_READS else db
 
 # JWT Configuration
 JWT_SECRET = os.environ.get('JWT_SECRET', 'intraamvali-secret-key-2024')
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
-# Create the main app
-app = FastAPI(title="Portal IntraAMVALI", version="1.0.0")
+# Routers; the app itself is assembled by create_app()
 api_router = APIRouter(prefix="/api")
+metrics_router = APIRouter()
 security = HTTPBearer()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# ==================== QUERY FAN-OUT ====================
+QUERY_FANOUT_LIMIT = int(os.environ.get('QUERY_FANOUT_LIMIT', '8'))
+
+async def fan_out(limit: int = QUERY_FANOUT_LIMIT, **queries: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+    """Run independent reads concurrently and return their results by name.
+
+    Each query is a zero-argument callable so it only starts once one of the `limit` slots is free
+    (Motor hands work to its executor as soon as a call is made). The first failure cancels
+    the queries still pending and is re-raised.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(query):
+        async with semaphore:
+            return await query()
+
+    tasks = [asyncio.ensure_future(run(query)) for query in queries.values()]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return dict(zip(queries, results))
+
+# ==================== SHARED STATE ====================
+# Caches, counters and invalidation messages go through one backend so that every worker sees them.
+# Created by create_app() along with the LLM gateway, so an app never inherits one a previous app closed
+shared_state = None
+WORKER_ID = uuid.uuid4().hex
+
+RATE_LIMITED = metrics.register(Counter(
+    "rate_limited_requests_total", "Requests rejected by a rate limit", ("limit",)))
+
+class RateLimiter:
+    """Fixed-window limit per key, counted in the shared state so it holds across workers"""
+
+    def __init__(self, name: str, limit: int, window_seconds: int = 60):
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+
+    async def check(self, key: str):
+        if self.limit <= 0:
+            return
+        now = int(time.time())
+        window = now // self.window_seconds
+        count = await shared_state.incr(f"ratelimit:{self.name}:{key}:{window}", ttl=self.window_seconds * 2)
+        if count > self.limit:
+            self._reject(now)
+
+    async def ensure_allowed(self, key: str):
+        """Reject once `key` used up its window, without counting this request (see record)"""
+        if self.limit <= 0:
+            return
+        now = int(time.time())
+        count = await shared_state.get(f"ratelimit:{self.name}:{key}:{now // self.window_seconds}")
+        if count is not None and int(count) >= self.limit:
+            self._reject(now)
+
+    async def record(self, key: str):
+        """Count one request against `key`, for limits that only count some outcomes (failed logins)"""
+        if self.limit <= 0:
+            return
+        window = int(time.time()) // self.window_seconds
+        await shared_state.incr(f"ratelimit:{self.name}:{key}:{window}", ttl=self.window_seconds * 2)
+
+    def _reject(self, now: int):
+        RATE_LIMITED.inc(self.name)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, try again later",
+            headers={"Retry-After": str(self.window_seconds - now % self.window_seconds)}
+        )
+
+# Failed attempts per client IP and email: a guesser is slowed down without letting anyone who knows an
+# address lock its owner out from elsewhere
+login_rate_limit = RateLimiter("login", int(os.environ.get('LOGIN_RATE_LIMIT_PER_MINUTE', '20')))
+ai_rate_limit = RateLimiter("ai", int(os.environ.get('AI_RATE_LIMIT_PER_MINUTE', '30')))
+
 # ==================== ENUMS ====================
 class UserRole(str, Enum):
     MUNICIPAL = "municipal"
@@ -80,6 +640,10 @@ class InformationSufficiency(str, Enum):
     PARCIALMENTE_SUFICIENTE = "parcialmente_suficiente"
     INSUFICIENTE = "insuficiente"
 
+class BatchAction(str, Enum):
+    UPDATE = "update"
+    ALLOCATE = "allocate"
+
 # ==================== MODELS ====================
 class UserCreate(BaseModel):
     email: EmailStr
@@ -153,6 +717,7 @@ class Project(BaseModel):
     actual_deadline: Optional[datetime] = None
     progress_percent: float = 0.0
     ipr_score: float = 0.0
+    scoring_policy_version: Optional[int] = None
     impact_score: int = 1
     urgency_score: int = 1
     cost_score: int = 1
@@ -162,6 +727,9 @@ class Project(BaseModel):
     desired_deadline: DesiredDeadline = DesiredDeadline.MEDIO
     attachments: List[Dict[str, Any]] = []
     ai_analysis: Optional[Dict[str, Any]] = None
+    # Bumped by every write; sent back in If-Match for conditional updates. Documents written before
+    # versioning have none and count as 0, so that is what they report; new projects start at 1
+    version: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
@@ -212,6 +780,25 @@ class ProjectUpdate(BaseModel):
     cost_score: Optional[int] = None
     desired_deadline: Optional[DesiredDeadline] = None
 
+class BatchOperation(BaseModel):
+    project_id: str
+    action: BatchAction = BatchAction.UPDATE
+    changes: Optional[ProjectUpdate] = None
+    team_ids: Optional[List[str]] = None
+    expected_version: Optional[int] = None
+
+class ProjectBatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(..., min_length=1, max_length=1000)
+    ordered: bool = True
+
+class ScoringPolicyConfig(BaseModel):
+    weights: Dict[str, float] = {"impact": 3, "urgency": 2, "cost": 1}
+    complexity_divisors: Dict[str, float] = {"minima": 1, "media": 5, "alta": 10}
+    default_complexity_divisor: float = 5
+    priority_limits: Dict[str, int] = {"5": 1, "4": 2, "3": 3, "2": 4, "1": 5}  # {estrelas: projetos simultâneos}
+    max_stars_per_area: int = 5
+    description: Optional[str] = None
+
 class Notification(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -262,9 +849,300 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         raise HTTPException(status_code=401, detail="Invalid token")
 
 # ==================== IPR CALCULATION ====================
+SCORING_POLICY_REFRESH_SECONDS = float(os.environ.get('SCORING_POLICY_REFRESH_SECONDS', '30'))
+
+class ScoringPolicy:
+    """Scoring configuration compiled once into the lookups used on every IPR computation"""
+
+    def __init__(self, version: int, config: ScoringPolicyConfig):
+        if set(config.weights) != {"impact", "urgency", "cost"}:
+            raise ValueError("weights must define exactly impact, urgency and cost")
+        if any(d <= 0 for d in config.complexity_divisors.values()) or config.default_complexity_divisor <= 0:
+            raise ValueError("complexity divisors must be positive")
+        self.version = version
+        self.config = config
+        self.impact_weight = float(config.weights["impact"])
+        self.urgency_weight = float(config.weights["urgency"])
+        self.cost_weight = float(config.weights["cost"])
+        self.complexity_divisors = {level: float(d) for level, d in config.complexity_divisors.items()}
+        self.default_divisor = float(config.default_complexity_divisor)
+        self.priority_limits = {int(p): limit for p, limit in config.priority_limits.items()}
+        self.max_stars_per_area = config.max_stars_per_area
+
+    def score(self, impact: int, urgency: int, cost: int, complexity: Complexity) -> float:
+        divisor = self.complexity_divisors.get(complexity, self.default_divisor)
+        return (impact * self.impact_weight + urgency * self.urgency_weight + cost * self.cost_weight) / divisor
+
+    def score_many(self, impact: np.ndarray, urgency: np.ndarray, cost: np.ndarray, complexity: np.ndarray) -> np.ndarray:
+        """Same formula as score, applied to whole columns at once"""
+        divisor = np.full(len(complexity), self.default_divisor, dtype=np.float64)
+        for level, level_divisor in self.complexity_divisors.items():
+            divisor[complexity == level] = level_divisor
+        weighted = (
+            impact.astype(np.float64) * self.impact_weight
+            + urgency.astype(np.float64) * self.urgency_weight
+            + cost.astype(np.float64) * self.cost_weight
+        )
+        return weighted / divisor
+
+# Version 0 is the built-in policy, used until a policy is stored in scoring_policies
+_scoring_policy = ScoringPolicy(0, ScoringPolicyConfig())
+_scoring_policy_checked_at = float('-inf')
+
+async def get_scoring_policy(force_reload: bool = False) -> ScoringPolicy:
+    """Return the active compiled policy, re-reading the configuration at most every few seconds"""
+    global _scoring_policy, _scoring_policy_checked_at
+    if not force_reload and time.monotonic() - _scoring_policy_checked_at < SCORING_POLICY_REFRESH_SECONDS:
+        return _scoring_policy
+
+    doc = await db.scoring_policies.find_one({"active": True}, {"_id": 0}, sort=[("version", -1)])
+    _scoring_policy_checked_at = time.monotonic()
+    active_version = doc['version'] if doc else 0
+    if active_version != _scoring_policy.version:
+        try:
+            _scoring_policy = ScoringPolicy(active_version, ScoringPolicyConfig(**doc['config'])) if doc else ScoringPolicy(0, ScoringPolicyConfig())
+            logger.info(f"Scoring policy v{active_version} loaded")
+        except ValueError as e:
+            logger.error(f"Invalid scoring policy v{active_version}, keeping v{_scoring_policy.version}: {e}")
+    return _scoring_policy
+
 def calculate_ipr(impact: int, urgency: int, cost: int, complexity: Complexity) -> float:
-    complexity_divisor = {"minima": 1, "media": 5, "alta": 10}.get(complexity, 5)
-    return ((impact * 3) + (urgency * 2) + (cost * 1)) / complexity_divisor
+    return _scoring_policy.score(impact, urgency, cost, complexity)
+
+def calculate_ipr_vectorized(impact: np.ndarray, urgency: np.ndarray, cost: np.ndarray, complexity: np.ndarray) -> np.ndarray:
+    return _scoring_policy.score_many(impact, urgency, cost, complexity)
+
+def ipr_columns(projects: List[dict]):
+    """Extract the IPR inputs of a batch of project documents as NumPy columns"""
+    def column(field):
+        # Only a missing score defaults to 1, as in the scalar path: a stored 0 stays 0
+        return np.fromiter((1 if p.get(field) is None else p[field] for p in projects), dtype=np.int64, count=len(projects))
+
+    impact, urgency, cost = column('impact_score'), column('urgency_score'), column('cost_score')
+    complexity = np.array([p.get('complexity') or 'media' for p in projects], dtype=object)
+    return impact, urgency, cost, complexity
+
+RESCORE_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "status": 1, "priority": 1, "created_at": 1, "ipr_score": 1,
+    "impact_score": 1, "urgency_score": 1, "cost_score": 1, "complexity": 1, "scoring_policy_version": 1, "version": 1
+}
+
+def _queue_order(entries: List[dict], score_key: str) -> Dict[str, int]:
+    ordered = sorted(entries, key=lambda e: (-e[score_key], -e['priority'], e['created_at']))
+    return {e['id']: position for position, e in enumerate(ordered, start=1)}
+
+async def rescore_portfolio(batch_size: int = 5000, dry_run: bool = False, only_stale: bool = True,
+                            max_queue_changes: int = 100) -> dict:
+    """
+    Recompute the IPR of projects in batches, writing back only changed scores. Projects edited since they
+    were read are left alone and counted in `conflicts`; the edit already scored them with the active policy.
+    """
+    policy = await get_scoring_policy(force_reload=True)
+    query = {"scoring_policy_version": {"$ne": policy.version}} if only_stale else {}
+    scanned = 0
+    changed = 0
+    conflicts = 0
+    queue_entries = []
+    queue_statuses = {ProjectStatus.VALIDACAO.value, ProjectStatus.EXECUCAO.value}
+
+    async def flush(batch: List[dict]):
+        nonlocal changed, conflicts
+        new_scores = policy.score_many(*ipr_columns(batch))
+        old_scores = np.fromiter((p.get('ipr_score') or 0.0 for p in batch), dtype=np.float64, count=len(batch))
+        stale = ~np.isclose(old_scores, new_scores)
+        unversioned = np.fromiter((p.get('scoring_policy_version') != policy.version for p in batch), dtype=bool, count=len(batch))
+        if dry_run:
+            changed += int(stale.sum())
+
+        for project, old, new in zip(batch, old_scores.tolist(), new_scores.tolist()):
+            if project.get('status') in queue_statuses:
+                queue_entries.append({
+                    "id": project['id'], "title": project.get('title', ''), "priority": project.get('priority', 3),
+                    "created_at": project.get('created_at', ''), "old_ipr": old, "new_ipr": new
+                })
+
+        if not dry_run and (stale | unversioned).any():
+            now = datetime.now(timezone.utc).isoformat()
+            indexes = np.flatnonzero(stale | unversioned)
+            write_requests = []
+            for i in indexes:
+                # updated_at even for version-only writes: the version bump must reach /sync timestamp cursors too
+                fields = {"scoring_policy_version": policy.version, "updated_at": now}
+                if stale[i]:
+                    fields["ipr_score"] = float(new_scores[i])
+                # Only onto the version that was scored: a concurrent edit keeps its own inputs and IPR
+                write_requests.append((batch[i]['id'], batch[i].get('version', 0), {"$set": fields, "$inc": VERSION_BUMP}))
+            outcomes = await run_batch_writes(write_requests, False, now)
+            for i, (project_id, _, update), outcome in zip(indexes, write_requests, outcomes):
+                if outcome != "ok":
+                    conflicts += 1
+                    continue
+                changed += int(stale[i])
+                change_log.record(project_id, "rescore", diff_fields(batch[i], update["$set"]))
+
+    batch = []
+    async for project in db.projects.find(query, RESCORE_PROJECTION).batch_size(batch_size):
+        batch.append(project)
+        scanned += 1
+        if len(batch) >= batch_size:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+    if only_stale:
+        # Projects already on this policy keep their score, but still hold places in the queue
+        async for project in db.projects.find(
+            {"status": {"$in": list(queue_statuses)}, "scoring_policy_version": policy.version},
+            {"_id": 0, "id": 1, "title": 1, "priority": 1, "created_at": 1, "ipr_score": 1}
+        ).batch_size(batch_size):
+            ipr = project.get('ipr_score') or 0.0
+            queue_entries.append({
+                "id": project['id'], "title": project.get('title', ''), "priority": project.get('priority', 3),
+                "created_at": project.get('created_at', ''), "old_ipr": ipr, "new_ipr": ipr
+            })
+
+    old_order = _queue_order(queue_entries, 'old_ipr')
+    new_order = _queue_order(queue_entries, 'new_ipr')
+    queue_changes = [
+        {
+            "id": e['id'],
+            "title": e['title'],
+            "old_position": old_order[e['id']],
+            "new_position": new_order[e['id']],
+            "old_ipr": round(e['old_ipr'], 4),
+            "new_ipr": round(e['new_ipr'], 4)
+        }
+        for e in queue_entries if old_order[e['id']] != new_order[e['id']]
+    ]
+    queue_changes.sort(key=lambda c: c['new_position'])
+
+    return {
+        "dry_run": dry_run,
+        "scoring_policy_version": policy.version,
+        "scanned": scanned,
+        "changed": changed,
+        "conflicts": conflicts,
+        "queue_size": len(queue_entries),
+        "queue_moves": len(queue_changes),
+        "queue_changes": queue_changes[:max_queue_changes]
+    }
+
+# ==================== CHANGE LOG ====================
+CHANGE_LOG_BATCH_SIZE = int(os.environ.get('CHANGE_LOG_BATCH_SIZE', '500'))
+CHANGE_LOG_FLUSH_SECONDS = float(os.environ.get('CHANGE_LOG_FLUSH_SECONDS', '0.5'))
+# Bookkeeping fields that change on every write and are not worth a history entry
+CHANGE_LOG_IGNORED_FIELDS = {"_id", "updated_at"}
+
+def diff_fields(before: Optional[dict], after: dict) -> List[dict]:
+    """Field-level diff of the fields being written, as [{"field", "old", "new"}]"""
+    before = before or {}
+    return [
+        {"field": field, "old": before.get(field), "new": value}
+        for field, value in after.items()
+        if field not in CHANGE_LOG_IGNORED_FIELDS and before.get(field) != value
+    ]
+
+class ChangeLogWriter:
+    """
+    Buffers project change entries in memory and writes them to project_changes with insert_many,
+    either when the buffer is full or every CHANGE_LOG_FLUSH_SECONDS, so handlers never await the log.
+    """
+
+    def __init__(self, batch_size: int = CHANGE_LOG_BATCH_SIZE, flush_seconds: float = CHANGE_LOG_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self._buffer: List[dict] = []
+        self._seq = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, project_id: str, action: str, changes: List[dict], user_id: Optional[str] = None,
+               at: Optional[str] = None):
+        """`at` defaults to now; pass the write's own timestamp when the document carries one"""
+        if not changes and action != "create":
+            return
+        self._seq += 1
+        self._buffer.append({
+            "id": str(uuid.uuid4()),
+            "project_id": project_id,
+            "action": action,
+            "changes": changes,
+            "user_id": user_id,
+            "at": at or datetime.now(timezone.utc).isoformat(),
+            "seq": self._seq
+        })
+        if len(self._buffer) >= self.batch_size:
+            self._wake.set()
+
+    async def flush(self):
+        while self._buffer:
+            batch, self._buffer = self._buffer[:self.batch_size], self._buffer[self.batch_size:]
+            try:
+                await db.project_changes.insert_many(batch, ordered=False)
+            except Exception as e:
+                logger.error(f"Change log flush failed, {len(batch)} entries dropped: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+change_log = ChangeLogWriter()
+
+def _set_path(doc: dict, path: str, value):
+    *parents, leaf = path.split('.')
+    target = doc
+    for part in parents:
+        target = target[int(part)] if isinstance(target, list) else target.setdefault(part, {})
+    if isinstance(target, list):
+        target[int(leaf)] = value
+    else:
+        target[leaf] = value
+
+def undo_change(doc: dict, change: dict):
+    """Revert one change entry item on a project snapshot"""
+    op = change.get('op', 'set')
+    if op == 'push':
+        doc[change['field']] = [item for item in doc.get(change['field'], []) if item.get('id') != change['new'].get('id')]
+    elif op == 'pull':
+        doc.setdefault(change['field'], []).append(change['old'])
+    else:
+        _set_path(doc, change['field'], change['old'])
+
+async def reconstruct_project(project_id: str, at: datetime) -> Optional[dict]:
+    """Rebuild a project as it was at `at` by undoing newer change entries on the current document"""
+    await change_log.flush()
+    project = await find_project(project_id)
+    if not project:
+        return None
+    project.pop('archived', None)
+    async for entry in db.project_changes.find(
+        {"project_id": project_id, "at": {"$gt": at.isoformat()}}, {"_id": 0}
+    ).sort([("at", -1), ("seq", -1)]):
+        if entry['action'] == "create":
+            return None
+        for change in reversed(entry['changes']):
+            undo_change(project, change)
+    return project
 
 # ==================== AUTH ROUTES ====================
 @api_router.post("/auth/register")
@@ -282,16 +1160,23 @@ async def register(user_data: UserCreate):
     user_dict = user.model_dump()
     user_dict['password_hash'] = hash_password(user_data.password)
     user_dict['created_at'] = user_dict['created_at'].isoformat()
+    user_dict['updated_at'] = user_dict['created_at']
     
     await db.users.insert_one(user_dict)
+    if user.role == UserRole.TECNICO_AMVALI:
+        await invalidate_forecast()
+        await dashboard_stats_cache.invalidate()
     token = create_token(user.id, user.role)
     
     return {"token": token, "user": {"id": user.id, "email": user.email, "name": user.name, "role": user.role}}
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
+    limit_key = f"{request.client.host if request.client else 'unknown'}:{credentials.email.lower()}"
+    await login_rate_limit.ensure_allowed(limit_key)
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
     if not user or not verify_password(credentials.password, user.get('password_hash', '')):
+        await login_rate_limit.record(limit_key)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_token(user['id'], user['role'])
@@ -319,12 +1204,17 @@ async def create_municipality(data: MunicipalityCreate, current_user: dict = Dep
     municipality = Municipality(**data.model_dump())
     doc = municipality.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
+    doc['updated_at'] = doc['created_at']
     await db.municipalities.insert_one(doc)
+    await municipalities_cache.invalidate()
+    await dashboard_stats_cache.invalidate()
     return municipality
 
 @api_router.get("/municipalities", response_model=List[Municipality])
 async def list_municipalities(current_user: dict = Depends(get_current_user)):
-    municipalities = await db.municipalities.find({}, {"_id": 0}).to_list(1000)
+    municipalities = await municipalities_cache.get_or_compute(
+        "all", None, lambda: db.municipalities.find({}, {"_id": 0}).to_list(1000)
+    )
     for m in municipalities:
         if isinstance(m.get('created_at'), str):
             m['created_at'] = datetime.fromisoformat(m['created_at'])
@@ -347,35 +1237,263 @@ async def update_engagement(municipality_id: str, engagement_data: dict, current
         {"$set": {
             "engagement_score": engagement_data.get('engagement_score', 0),
             "meeting_participations": engagement_data.get('meeting_participations', 0),
-            "clarity_score": engagement_data.get('clarity_score', 0)
+            "clarity_score": engagement_data.get('clarity_score', 0),
+            "updated_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    await municipality_dashboard_cache.invalidate(municipality_id)
+    await municipalities_cache.invalidate()
     return {"message": "Engagement updated"}
 
+# ==================== IDEMPOTENCY ====================
+# Retried POSTs carrying the same Idempotency-Key replay the first response instead of running again.
+# Records expire through a TTL index on expires_at (a BSON date, unlike the ISO strings elsewhere):
+# a pending record only lives long enough to cover the request, a completed one for IDEMPOTENCY_TTL_SECONDS.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+IDEMPOTENCY_PENDING_SECONDS = int(os.environ.get('IDEMPOTENCY_PENDING_SECONDS', '60'))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+IDEMPOTENT_REPLAYS = metrics.register(Counter(
+    "idempotent_replays_total", "Requests answered from a stored Idempotency-Key response", ("operation",)))
+
+async def run_idempotent(idempotency_key: Optional[str], operation: str, current_user: dict, payload,
+                         handler: Callable[[], Awaitable]):
+    """
+    Run handler once per (user, operation, key). A retry is answered with one read by _id;
+    the same key with a different payload is rejected, and so is a retry while the first call is running.
+    """
+    if not idempotency_key:
+        return await handler()
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters")
+
+    record_id = f"{current_user['id']}:{operation}:{idempotency_key}"
+    fingerprint = hashlib.sha256(json.dumps(jsonable_encoder(payload), sort_keys=True).encode()).hexdigest()
+
+    existing = await db.idempotency_keys.find_one({"_id": record_id})
+    if existing is None:
+        now = datetime.now(timezone.utc)
+        try:
+            await db.idempotency_keys.insert_one({
+                "_id": record_id,
+                "fingerprint": fingerprint,
+                "state": "pending",
+                "expires_at": now + timedelta(seconds=IDEMPOTENCY_PENDING_SECONDS)
+            })
+        except DuplicateKeyError:
+            existing = await db.idempotency_keys.find_one({"_id": record_id}) or {"fingerprint": fingerprint, "state": "pending"}
+
+    if existing is not None:
+        if existing['fingerprint'] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key already used with a different request")
+        if existing['state'] != "done":
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                                headers={"Retry-After": "1"})
+        IDEMPOTENT_REPLAYS.inc(operation)
+        return existing['response']
+
+    try:
+        result = await handler()
+    except BaseException:
+        # Failed requests (including validation errors) leave nothing behind, so the client can retry them
+        await db.idempotency_keys.delete_one({"_id": record_id})
+        raise
+    await db.idempotency_keys.update_one(
+        {"_id": record_id},
+        {"$set": {
+            "state": "done",
+            "response": jsonable_encoder(result),
+            "expires_at": datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+        }}
+    )
+    return result
+
+# ==================== PROJECT VERSIONS ====================
+# Every write to a project increments `version`. Clients send the version they read in If-Match and the
+# write only lands if nobody changed the project since; otherwise it fails fast with 409.
+# Projects written before versioning have no field and count as version 0.
+VERSION_BUMP = {"version": 1}
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Expected version from an If-Match header ('"3"', 'W/"3"' or '3'); None when absent or '*'"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a project version")
+
+def project_filter(project_id: str, expected_version: Optional[int] = None) -> dict:
+    query = {"id": project_id}
+    if expected_version is not None:
+        query["version"] = expected_version if expected_version else {"$in": [0, None]}
+    return query
+
+def version_etag(version: int) -> str:
+    return f'"{version}"'
+
+async def raise_version_conflict(project_id: str):
+    """A conditional write matched nothing: 404 if the project is gone, 409 with its current version otherwise"""
+    current = await db.projects.find_one({"id": project_id}, {"_id": 0, "version": 1})
+    if current is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    version = current.get('version', 0)
+    raise HTTPException(
+        status_code=409,
+        detail=f"Project was modified by another request (current version {version})",
+        headers={"ETag": version_etag(version)}
+    )
+
+# ==================== PROJECT EXPORT ====================
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+EXPORT_DATE_FIELDS = ("created_at", "updated_at")
+EXPORT_COLUMNS = [
+    ExportColumn("id", "ID"),
+    ExportColumn("title", "Título"),
+    ExportColumn("municipality_name", "Município"),
+    ExportColumn("project_type", "Tipo"),
+    ExportColumn("status", "Status"),
+    ExportColumn("priority", "Prioridade", "number"),
+    ExportColumn("complexity", "Complexidade"),
+    ExportColumn("ipr_score", "IPR", "number"),
+    ExportColumn("progress_percent", "Progresso (%)", "number"),
+    ExportColumn("desired_deadline", "Prazo desejado"),
+    ExportColumn("estimated_deadline", "Prazo estimado", "date"),
+    ExportColumn("actual_deadline", "Prazo realizado", "date"),
+    ExportColumn("assigned_team", "Equipe"),
+    ExportColumn("created_at", "Criado em", "date"),
+    ExportColumn("updated_at", "Atualizado em", "date"),
+    ExportColumn("archived", "Arquivado"),
+]
+EXPORT_PROJECTION = {"_id": 0, **{column.field: 1 for column in EXPORT_COLUMNS if column.field != "archived"}}
+
+PROJECT_EXPORT_ROWS = metrics.register(Counter(
+    "project_export_rows_total", "Rows written by /projects/export", ("format",)))
+
+def parse_export_date(value: Optional[str], name: str, end: bool = False) -> Optional[str]:
+    """ISO bound comparable with the stored timestamps; a bare date as `end` covers that whole day"""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO date (YYYY-MM-DD)")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    if end and len(value) == 10:
+        moment += timedelta(days=1)
+    return moment.astimezone(timezone.utc).isoformat()
+
+def export_query(current_user: dict, municipality_id: Optional[str], status: Optional[str],
+                 project_type: Optional[str], date_field: str, date_from: Optional[str], date_to: Optional[str]) -> dict:
+    query = {}
+    if current_user['role'] == UserRole.MUNICIPAL:
+        # Municipal users only ever export their own portfolio
+        query['municipality_id'] = current_user.get('municipality_id')
+    elif municipality_id:
+        query['municipality_id'] = municipality_id
+    if status:
+        query['status'] = status
+    if project_type:
+        query['project_type'] = project_type
+    if date_field not in EXPORT_DATE_FIELDS:
+        raise HTTPException(status_code=400, detail=f"date_field must be one of: {', '.join(EXPORT_DATE_FIELDS)}")
+    bounds = {}
+    lower = parse_export_date(date_from, "date_from")
+    upper = parse_export_date(date_to, "date_to", end=True)
+    if lower:
+        bounds['$gte'] = lower
+    if upper:
+        bounds['$lt' if len(date_to) == 10 else '$lte'] = upper
+    if bounds:
+        query[date_field] = bounds
+    return query
+
+async def export_rows(query: dict, include_archived: bool):
+    """Live projects, then (optionally) archived summaries, read in cursor batches"""
+    sort = [("municipality_id", 1), ("created_at", 1)]
+    async for project in read_db.projects.find(query, EXPORT_PROJECTION, allow_disk_use=True) \
+            .sort(sort).batch_size(EXPORT_BATCH_SIZE):
+        yield project
+    if include_archived:
+        # Only the summary fields stay uncompressed in the archive; the other columns come out empty
+        async for project in read_db.projects_archive.find(query, EXPORT_PROJECTION, allow_disk_use=True) \
+                .sort(sort).batch_size(EXPORT_BATCH_SIZE):
+            project['archived'] = "sim"
+            yield project
+
+@api_router.get("/projects/export")
+async def export_projects(
+    format: str = "csv",
+    municipality_id: Optional[str] = None,
+    status: Optional[str] = None,
+    project_type: Optional[str] = None,
+    date_field: str = "created_at",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    include_archived: bool = False,
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Project portfolio as CSV or XLSX, streamed straight from the cursor: memory stays flat whatever
+    the number of rows, and nothing is capped. Filters combine like those of /projects.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    query = export_query(current_user, municipality_id, status, project_type, date_field, date_from, date_to)
+    rows = export_rows(query, include_archived)
+    if format == "xlsx":
+        body = xlsx_stream(EXPORT_COLUMNS, rows, sheet_name="Projetos", on_row=lambda: PROJECT_EXPORT_ROWS.inc(format))
+    else:
+        body = csv_stream(EXPORT_COLUMNS, rows, on_row=lambda: PROJECT_EXPORT_ROWS.inc(format))
+    filename = f"projetos-{datetime.now(timezone.utc):%Y%m%d-%H%M}.{format}"
+    return StreamingResponse(
+        body, media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"}
+    )
+
 # ==================== PROJECT ROUTES ====================
 @api_router.post("/projects", response_model=Project)
-async def create_project(data: ProjectCreate, current_user: dict = Depends(get_current_user)):
-    municipality = await db.municipalities.find_one({"id": data.municipality_id}, {"_id": 0})
+async def create_project(data: ProjectCreate, current_user: dict = Depends(get_current_user),
+                         idempotency_key: Optional[str] = Header(None)):
+    return await run_idempotent(idempotency_key, "create_project", current_user, data,
+                                lambda: insert_project(data, current_user))
+
+async def insert_project(data: ProjectCreate, current_user: dict) -> Project:
+    reads = await fan_out(
+        municipality=lambda: db.municipalities.find_one({"id": data.municipality_id}, {"_id": 0}),
+        policy=get_scoring_policy,
+        active_count=lambda: db.projects.count_documents({
+            "municipality_id": data.municipality_id,
+            "priority": data.priority,
+            "status": {"$nin": [ProjectStatus.CONCLUIDO, ProjectStatus.RASCUNHO]}
+        })
+    )
+    municipality = reads['municipality']
     if not municipality:
         raise HTTPException(status_code=404, detail="Municipality not found")
     
+    policy = reads['policy']
+
     # Check star limits
     area = data.project_type
     current_stars = municipality.get('active_stars', {}).get(area, 0)
-    if current_stars + data.priority > 5:
+    if current_stars + data.priority > policy.max_stars_per_area:
         raise HTTPException(
             status_code=400, 
-            detail=f"Star limit exceeded. Current: {current_stars}, Requested: {data.priority}, Max: 5"
+            detail=f"Star limit exceeded. Current: {current_stars}, Requested: {data.priority}, Max: {policy.max_stars_per_area}"
         )
     
     # Check simultaneous projects limit based on priority
-    priority_limits = {5: 1, 4: 2, 3: 3, 2: 4, 1: 5}
-    active_count = await db.projects.count_documents({
-        "municipality_id": data.municipality_id,
-        "priority": data.priority,
-        "status": {"$nin": [ProjectStatus.CONCLUIDO, ProjectStatus.RASCUNHO]}
-    })
-    if active_count >= priority_limits.get(data.priority, 5):
+    priority_limits = policy.priority_limits
+    if reads['active_count'] >= priority_limits.get(data.priority, 5):
         raise HTTPException(status_code=400, detail=f"Maximum simultaneous projects reached for priority {data.priority}")
     
     # Create default stages
@@ -402,7 +1520,8 @@ async def create_project(data: ProjectCreate, current_user: dict = Depends(get_c
         urgency_score=data.urgency_score,
         cost_score=data.cost_score,
         desired_deadline=data.desired_deadline,
-        stages=[s.model_dump() for s in default_stages]
+        stages=[s.model_dump() for s in default_stages],
+        version=1
     )
     
     doc = project.model_dump()
@@ -410,12 +1529,17 @@ async def create_project(data: ProjectCreate, current_user: dict = Depends(get_c
     doc['updated_at'] = doc['updated_at'].isoformat()
     
     await db.projects.insert_one(doc)
+    # Logged at created_at, so the history answers "as of created_at" with the new project
+    change_log.record(project.id, "create", [], current_user['id'], at=doc['created_at'])
     
     # Update municipality star count
     await db.municipalities.update_one(
         {"id": data.municipality_id},
-        {"$inc": {f"active_stars.{area}": data.priority, "total_projects": 1}}
+        {"$inc": {f"active_stars.{area}": data.priority, "total_projects": 1},
+         "$set": {"updated_at": doc['updated_at']}}
     )
+    # Only once both writes landed: a dashboard read in between would re-cache the old star counts
+    await invalidate_project_views(project.id, data.municipality_id)
     
     return project
 
@@ -433,7 +1557,7 @@ async def list_projects(
     elif current_user['role'] == UserRole.MUNICIPAL:
         query['municipality_id'] = current_user.get('municipality_id')
     
-    projects = await db.projects.find(query, {"_id": 0}).sort("ipr_score", -1).to_list(1000)
+    projects = await read_db.projects.find(query, {"_id": 0}).sort("ipr_score", -1).to_list(1000)
     for p in projects:
         if isinstance(p.get('created_at'), str):
             p['created_at'] = datetime.fromisoformat(p['created_at'])
@@ -442,43 +1566,284 @@ async def list_projects(
     return projects
 
 @api_router.get("/projects/{project_id}")
-async def get_project(project_id: str, current_user: dict = Depends(get_current_user)):
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+async def get_project(project_id: str, response: Response, current_user: dict = Depends(get_current_user)):
+    project = await find_project(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    response.headers["ETag"] = version_etag(project.get('version', 0))
     return project
 
 @api_router.put("/projects/{project_id}")
-async def update_project(project_id: str, data: ProjectUpdate, current_user: dict = Depends(get_current_user)):
+async def update_project(project_id: str, data: ProjectUpdate, response: Response,
+                         current_user: dict = Depends(get_current_user), if_match: Optional[str] = Header(None)):
+    expected_version = parse_if_match(if_match)
     update_data = {k: v for k, v in data.model_dump().items() if v is not None}
     update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
     
     # Recalculate IPR if relevant fields changed
     if any(k in update_data for k in ['impact_score', 'urgency_score', 'cost_score', 'complexity']):
-        project = await db.projects.find_one({"id": project_id}, {"_id": 0})
-        if project:
-            complexity = update_data.get('complexity', project.get('complexity', 'media'))
-            impact = update_data.get('impact_score', project.get('impact_score', 1))
-            urgency = update_data.get('urgency_score', project.get('urgency_score', 1))
-            cost = update_data.get('cost_score', project.get('cost_score', 1))
-            update_data['ipr_score'] = calculate_ipr(impact, urgency, cost, complexity)
+        project = await db.projects.find_one(
+            project_filter(project_id, expected_version),
+            {"_id": 0, "version": 1, "complexity": 1, "impact_score": 1, "urgency_score": 1, "cost_score": 1}
+        )
+        if project is None:
+            await raise_version_conflict(project_id)
+        # The score is computed from what was just read, so the write must not land on a newer version
+        expected_version = project.get('version', 0)
+        complexity = update_data.get('complexity', project.get('complexity', 'media'))
+        impact = update_data.get('impact_score', project.get('impact_score', 1))
+        urgency = update_data.get('urgency_score', project.get('urgency_score', 1))
+        cost = update_data.get('cost_score', project.get('cost_score', 1))
+        policy = await get_scoring_policy()
+        update_data['ipr_score'] = policy.score(impact, urgency, cost, complexity)
+        update_data['scoring_policy_version'] = policy.version
     
-    await db.projects.update_one({"id": project_id}, {"$set": update_data})
-    return await db.projects.find_one({"id": project_id}, {"_id": 0})
+    # The whole document comes back from the write itself, so no second read is needed for the response
+    before = await db.projects.find_one_and_update(
+        project_filter(project_id, expected_version),
+        {"$set": update_data, "$inc": VERSION_BUMP},
+        projection={"_id": 0},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is None:
+        await raise_version_conflict(project_id)
+    change_log.record(project_id, "update", diff_fields(before, update_data), current_user['id'])
+    await invalidate_project_views(project_id, before.get('municipality_id'))
+    project = {**before, **update_data, "version": before.get('version', 0) + 1}
+    response.headers["ETag"] = version_etag(project['version'])
+    return project
+
+async def run_batch_writes(write_requests: List[tuple], ordered: bool, written_at: str) -> List[str]:
+    """
+    Apply (project_id, expected_version, update) writes in one bulk_write. Each write is conditional on the
+    version it was computed from, so one that matches nothing (the project changed since it was read) is
+    reported as "conflict" instead of overwriting it. Later writes to the same project also require the
+    batch's own updated_at, so they only land on top of the earlier ones and are "skipped" once one fails.
+    Every write must $set updated_at to written_at. Returns "ok", "conflict", "skipped" or an error message per write.
+    """
+    outcomes = ["skipped"] * len(write_requests)
+    if not write_requests:
+        return outcomes
+
+    chains: Dict[str, List[int]] = {}
+    operations = []
+    for index, (project_id, expected_version, update) in enumerate(write_requests):
+        write_filter = project_filter(project_id, expected_version)
+        if project_id in chains:
+            write_filter["updated_at"] = written_at
+        chains.setdefault(project_id, []).append(index)
+        operations.append(UpdateOne(write_filter, update))
+
+    errors: Dict[int, str] = {}
+    attempted = len(write_requests)
+    try:
+        result = await db.projects.bulk_write(operations, ordered=ordered)
+        matched = result.matched_count
+    except BulkWriteError as e:
+        matched = e.details.get('nMatched', 0)
+        for error in e.details.get('writeErrors', []):
+            errors[error['index']] = error.get('errmsg') or "Write error"
+        if ordered and errors:
+            # An ordered bulk_write stops at its first error; nothing after it was attempted
+            attempted = min(errors)
+
+    # Which writes matched: bulk_write only reports a total, so unless every write matched, the stored
+    # versions tell how far each project's chain got
+    landed: Dict[str, int] = {}
+    chain_lengths = {project_id: len([i for i in indexes if i < attempted and i not in errors])
+                     for project_id, indexes in chains.items()}
+    if matched >= sum(chain_lengths.values()):
+        landed = chain_lengths
+    else:
+        stored = await db.projects.find(
+            {"id": {"$in": list(chains)}}, {"_id": 0, "id": 1, "version": 1, "updated_at": 1}
+        ).to_list(len(chains))
+        stored_by_id = {doc['id']: doc for doc in stored}
+        ambiguous = []
+        for project_id, indexes in chains.items():
+            first_version = write_requests[indexes[0]][1] or 0
+            doc = stored_by_id.get(project_id)
+            if doc is None or (doc.get('version') or 0) == first_version:
+                landed[project_id] = 0
+            elif doc.get('updated_at') == written_at:
+                landed[project_id] = min((doc.get('version') or 0) - first_version, chain_lengths[project_id])
+            else:
+                # Written by someone else after the batch: only the matched total can tell what landed
+                ambiguous.append(project_id)
+        remaining = matched - sum(landed.values())
+        for project_id in ambiguous:
+            landed[project_id] = min(max(remaining, 0), chain_lengths[project_id]) if len(ambiguous) == 1 else 0
+
+    for project_id, indexes in chains.items():
+        for position, index in enumerate(indexes):
+            if index >= attempted:
+                break
+            if position < landed[project_id]:
+                outcomes[index] = "ok"
+            else:
+                outcomes[index] = errors.get(index, "conflict")
+                break
+    return outcomes
+
+@api_router.post("/projects/batch")
+async def batch_update_projects(batch: ProjectBatchRequest, current_user: dict = Depends(get_current_user)):
+    """Apply many project updates/allocations in one request, each conditional on the version it was computed from"""
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
+        raise HTTPException(status_code=403, detail="Only AMVALI managers can run batch operations")
+
+    project_ids = list({op.project_id for op in batch.operations})
+    projects = await db.projects.find(
+        {"id": {"$in": project_ids}},
+        {"_id": 0, "id": 1, "municipality_id": 1, "scoring_policy_version": 1, "ipr_score": 1, "version": 1,
+         **{field: 1 for field in ProjectUpdate.model_fields}}
+    ).to_list(len(project_ids))
+    projects_by_id = {p['id']: p for p in projects}
+
+    policy = await get_scoring_policy()
+    now = datetime.now(timezone.utc).isoformat()
+    results = []
+    write_requests = []
+    request_result_index = []
+    notifications = []
+    changes = []
+    affected_technicians = set()
+
+    for index, op in enumerate(batch.operations):
+        project = projects_by_id.get(op.project_id)
+        if not project:
+            results.append({"index": index, "project_id": op.project_id, "status": "not_found"})
+            continue
+        if op.expected_version is not None and op.expected_version != project.get('version', 0):
+            results.append({"index": index, "project_id": op.project_id, "status": "conflict",
+                            "error": f"Current version is {project.get('version', 0)}"})
+            continue
+
+        if op.action == BatchAction.ALLOCATE:
+            if op.team_ids is None:
+                results.append({"index": index, "project_id": op.project_id, "status": "invalid", "error": "team_ids is required"})
+                continue
+            update_data = {"assigned_team": op.team_ids}
+        else:
+            update_data = {k: v for k, v in (op.changes.model_dump() if op.changes else {}).items() if v is not None}
+            if not update_data:
+                results.append({"index": index, "project_id": op.project_id, "status": "invalid", "error": "No changes provided"})
+                continue
+            if any(k in update_data for k in ['impact_score', 'urgency_score', 'cost_score', 'complexity']):
+                # Later operations on the same project see the values written by earlier ones
+                merged = {**project, **update_data}
+                update_data['ipr_score'] = policy.score(
+                    merged.get('impact_score', 1),
+                    merged.get('urgency_score', 1),
+                    merged.get('cost_score', 1),
+                    merged.get('complexity') or 'media'
+                )
+                update_data['scoring_policy_version'] = policy.version
+        update_data['updated_at'] = now
+
+        if 'assigned_team' in update_data:
+            affected_technicians.update(project.get('assigned_team', []))
+            affected_technicians.update(update_data['assigned_team'])
+        if update_data.get('status') and update_data['status'] != project.get('status'):
+            notifications.append((len(write_requests), Notification(
+                user_id=project.get('municipality_id', ''),
+                title=f"Status atualizado: {project['title']}",
+                message=f"O projeto '{project['title']}' teve o status alterado para '{update_data['status'].value}'",
+                notification_type="info",
+                project_id=project['id']
+            )))
+
+        changes.append(diff_fields(project, update_data))
+        # Each write only lands on the version its changes were computed from
+        expected_version = project.get('version', 0)
+        project.update(update_data)
+        # Later operations on the same project expect the version this one produces
+        project['version'] = project.get('version', 0) + 1
+        request_result_index.append(len(results))
+        results.append({"index": index, "project_id": op.project_id, "status": "pending", "version": project['version']})
+        write_requests.append((op.project_id, expected_version, {"$set": update_data, "$inc": VERSION_BUMP}))
+
+    outcomes = await run_batch_writes(write_requests, batch.ordered, now)
+    for request_index, result_index in enumerate(request_result_index):
+        outcome = outcomes[request_index]
+        if outcome == "ok" or outcome == "skipped":
+            results[result_index]['status'] = outcome
+        elif outcome == "conflict":
+            results[result_index].update(status="conflict", error="Project was modified by another request")
+        else:
+            results[result_index].update(status="error", error=outcome)
+
+    def applied(request_index):
+        return results[request_result_index[request_index]]['status'] == "ok"
+
+    landed = []
+    for request_index, result_index in enumerate(request_result_index):
+        if applied(request_index):
+            project_id = results[result_index]['project_id']
+            landed.append(project_id)
+            change_log.record(project_id, "batch", changes[request_index], current_user['id'])
+    if landed:
+        await invalidate_forecast(landed)
+        for municipality_id in {projects_by_id[p].get('municipality_id') for p in landed} - {None}:
+            await municipality_dashboard_cache.invalidate(municipality_id)
+        await dashboard_stats_cache.invalidate()
+        await technical_queue_cache.invalidate()
+
+    # Notify municipalities only about writes that actually landed
+    notif_docs = []
+    for request_index, notification in notifications:
+        if applied(request_index):
+            notif_doc = notification.model_dump()
+            notif_doc['created_at'] = notif_doc['created_at'].isoformat()
+            notif_docs.append(notif_doc)
+    if notif_docs:
+        await db.notifications.insert_many(notif_docs, ordered=False)
+
+    # Recount active projects for every technician touched by an allocation
+    if affected_technicians:
+        counts = await db.projects.aggregate([
+            {"$match": {"assigned_team": {"$in": list(affected_technicians)}, "status": {"$nin": [ProjectStatus.CONCLUIDO]}}},
+            {"$unwind": "$assigned_team"},
+            {"$match": {"assigned_team": {"$in": list(affected_technicians)}}},
+            {"$group": {"_id": "$assigned_team", "count": {"$sum": 1}}}
+        ]).to_list(len(affected_technicians))
+        count_by_tech = {c['_id']: c['count'] for c in counts}
+        await db.users.bulk_write(
+            [UpdateOne({"id": tid}, {"$set": {"active_projects": count_by_tech.get(tid, 0), "updated_at": now}})
+             for tid in affected_technicians],
+            ordered=False
+        )
+
+    succeeded = sum(1 for r in results if r['status'] == "ok")
+    return {
+        "results": results,
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "notifications_created": len(notif_docs)
+    }
 
 @api_router.put("/projects/{project_id}/stage")
-async def update_project_stage(project_id: str, stage_data: dict, current_user: dict = Depends(get_current_user)):
+async def update_project_stage(project_id: str, stage_data: dict, response: Response,
+                               current_user: dict = Depends(get_current_user), if_match: Optional[str] = Header(None)):
     stage_index = stage_data.get('stage_index')
     new_status = stage_data.get('status')
+    expected_version = parse_if_match(if_match)
     
     project = await db.projects.find_one({"id": project_id}, {"_id": 0})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
+    version = project.get('version', 0)
+    if expected_version is not None and expected_version != version:
+        raise HTTPException(status_code=409, detail=f"Project was modified by another request (current version {version})",
+                            headers={"ETag": version_etag(version)})
     
     stages = project.get('stages', [])
     if stage_index < 0 or stage_index >= len(stages):
         raise HTTPException(status_code=400, detail="Invalid stage index")
     
+    previous_status = stages[stage_index].get('status')
+    previous_started_at = stages[stage_index].get('started_at')
+    previous_completed_at = stages[stage_index].get('completed_at')
     stages[stage_index]['status'] = new_status
     if new_status == 'in_progress' and not stages[stage_index].get('started_at'):
         stages[stage_index]['started_at'] = datetime.now(timezone.utc).isoformat()
@@ -502,15 +1867,36 @@ async def update_project_stage(project_id: str, stage_data: dict, current_user:
     if completed == len(stages):
         new_project_status = ProjectStatus.CONCLUIDO
     
-    await db.projects.update_one(
-        {"id": project_id},
+    # stages is rewritten whole, so only write over the version it was read from
+    written = await db.projects.update_one(
+        project_filter(project_id, version),
         {"$set": {
             "stages": stages,
             "progress_percent": progress,
             "status": new_project_status,
             "updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        }, "$inc": VERSION_BUMP}
     )
+    if written.matched_count == 0:
+        await raise_version_conflict(project_id)
+    await invalidate_project_views(project_id, project.get('municipality_id'))
+    await record_stage_event(project, stage_index, stages[stage_index], previous_status, current_user['id'])
+    change_log.record(project_id, "stage", diff_fields(
+        {
+            f"stages.{stage_index}.status": previous_status,
+            f"stages.{stage_index}.started_at": previous_started_at,
+            f"stages.{stage_index}.completed_at": previous_completed_at,
+            "progress_percent": project.get('progress_percent'),
+            "status": project.get('status')
+        },
+        {
+            f"stages.{stage_index}.status": new_status,
+            f"stages.{stage_index}.started_at": stages[stage_index].get('started_at'),
+            f"stages.{stage_index}.completed_at": stages[stage_index].get('completed_at'),
+            "progress_percent": progress,
+            "status": new_project_status
+        }
+    ), current_user['id'])
     
     # Create notification
     notification = Notification(
@@ -524,18 +1910,33 @@ async def update_project_stage(project_id: str, stage_data: dict, current_user:
     notif_doc['created_at'] = notif_doc['created_at'].isoformat()
     await db.notifications.insert_one(notif_doc)
     
-    return {"message": "Stage updated", "progress": progress}
+    response.headers["ETag"] = version_etag(version + 1)
+    return {"message": "Stage updated", "progress": progress, "version": version + 1}
 
 # ==================== QUEUE ROUTES ====================
 @api_router.get("/queue")
 async def get_technical_queue(current_user: dict = Depends(get_current_user)):
-    projects = await db.projects.find(
+    projects = await technical_queue_cache.get_or_compute("all", None, lambda: db.projects.find(
         {"status": {"$in": [ProjectStatus.VALIDACAO, ProjectStatus.EXECUCAO]}},
         {"_id": 0}
-    ).sort([("ipr_score", -1), ("priority", -1), ("created_at", 1)]).to_list(100)
+    ).sort([("ipr_score", -1), ("priority", -1), ("created_at", 1)]).to_list(100))
     
     return {"queue": projects, "total": len(projects)}
 
+@api_router.post("/queue/rescore")
+async def rescore_queue(dry_run: bool = True, batch_size: int = 5000, only_stale: bool = True,
+                        current_user: dict = Depends(get_current_user)):
+    """Re-score the whole portfolio with the current IPR formula (dry run by default)"""
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
+        raise HTTPException(status_code=403, detail="Only AMVALI managers can re-score the portfolio")
+    if batch_size < 1 or batch_size > 50000:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 50000")
+
+    result = await rescore_portfolio(batch_size=batch_size, dry_run=dry_run, only_stale=only_stale)
+    if not dry_run and result['changed']:
+        await invalidate_project_views()
+    return result
+
 @api_router.post("/queue/reorder")
 async def reorder_queue(order_data: dict, current_user: dict = Depends(get_current_user)):
     if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
@@ -544,6 +1945,582 @@ async def reorder_queue(order_data: dict, current_user: dict = Depends(get_curre
     # Manual reorder logic here
     return {"message": "Queue reordered"}
 
+# ==================== SCORING POLICY ROUTES ====================
+@api_router.get("/scoring-policies")
+async def list_scoring_policies(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI, UserRole.TECNICO_AMVALI]:
+        raise HTTPException(status_code=403, detail="Access denied")
+
+    policies = await db.scoring_policies.find({}, {"_id": 0}).sort("version", -1).to_list(100)
+    active = await get_scoring_policy(force_reload=True)
+    return {
+        "policies": policies,
+        "active_version": active.version,
+        "active_config": active.config.model_dump()
+    }
+
+SCORING_POLICY_INSERT_ATTEMPTS = 5
+
+@api_router.post("/scoring-policies")
+async def create_scoring_policy(config: ScoringPolicyConfig, current_user: dict = Depends(get_current_user)):
+    """Store a new policy version and activate it; running workers pick it up on their next refresh"""
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
+        raise HTTPException(status_code=403, detail="Only AMVALI managers can change scoring policies")
+
+    try:
+        ScoringPolicy(1, config)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # The unique index on version settles concurrent creations: the loser takes the next number
+    for _ in range(SCORING_POLICY_INSERT_ATTEMPTS):
+        latest = await db.scoring_policies.find_one({}, {"_id": 0, "version": 1}, sort=[("version", -1)])
+        version = (latest['version'] if latest else 0) + 1
+        try:
+            await db.scoring_policies.insert_one({
+                "version": version,
+                "config": config.model_dump(),
+                "active": True,
+                "created_by": current_user['id'],
+                "created_at": datetime.now(timezone.utc).isoformat()
+            })
+            break
+        except DuplicateKeyError:
+            continue
+    else:
+        raise HTTPException(status_code=409, detail="Scoring policy version taken concurrently, try again")
+    # Deactivate the others only now: readers take the highest active version, so there is never a moment
+    # without an active policy (which would fall back to the built-in one)
+    await db.scoring_policies.update_many({"active": True, "version": {"$ne": version}}, {"$set": {"active": False}})
+    await get_scoring_policy(force_reload=True)
+    return {"message": "Scoring policy activated", "version": version}
+
+@api_router.post("/scoring-policies/{version}/activate")
+async def activate_scoring_policy(version: int, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
+        raise HTTPException(status_code=403, detail="Only AMVALI managers can change scoring policies")
+
+    if version != 0 and not await db.scoring_policies.find_one({"version": version}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Scoring policy not found")
+
+    if version != 0:
+        await db.scoring_policies.update_one({"version": version}, {"$set": {"active": True}})
+    await db.scoring_policies.update_many({"active": True, "version": {"$ne": version}}, {"$set": {"active": False}})
+    await get_scoring_policy(force_reload=True)
+    return {"message": "Scoring policy activated", "version": version}
+
+# ==================== ALLOCATION OPTIMIZER ====================
+TEAM_SIZE_BY_COMPLEXITY = {"minima": 1, "media": 2, "alta": 3}
+HOURS_PER_PROJECT = 8
+SPECIALTY_MISMATCH_COST = 1.5
+OVERLOAD_COST = 4.0
+PRIORITY_LOAD_RELIEF = 0.05
+
+async def get_technician_loads() -> Dict[str, int]:
+    """Active (non-concluded) project count per technician, in one aggregation"""
+    counts = await db.projects.aggregate([
+        {"$match": {"status": {"$nin": [ProjectStatus.CONCLUIDO]}, "assigned_team.0": {"$exists": True}}},
+        {"$unwind": "$assigned_team"},
+        {"$group": {"_id": "$assigned_team", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    return {c['_id']: c['count'] for c in counts}
+
+def plan_allocations(projects: List[dict], technicians: List[dict], load: Dict[str, int],
+                     team_size: Optional[int] = None) -> List[dict]:
+    """
+    Greedy min-cost assignment of technicians to projects.
+
+    Projects are served in the given order (queue order); each picks the technicians with the lowest
+    marginal cost, and the chosen technicians' load is bumped before the next project is planned, so
+    the plan spreads work instead of piling every project on the least busy person.
+    """
+    if not technicians:
+        return [{"project_id": p.get('id'), "title": p.get('title'), "team_ids": [], "team": [], "ranking": [],
+                 "workload_impact": "Nenhum técnico disponível"} for p in projects]
+
+    ids = [t['id'] for t in technicians]
+    names = [t.get('name', '') for t in technicians]
+    specialties = [set(t.get('specialties') or []) for t in technicians]
+    capacity = np.array([max(t.get('workload_hours') or 40, HOURS_PER_PROJECT) / HOURS_PER_PROJECT for t in technicians])
+    active = np.array([load.get(tid, 0) for tid in ids], dtype=np.float64)
+
+    plans = []
+    for project in projects:
+        project_type = project.get('project_type')
+        mismatch = np.array([0.0 if project_type in s else 1.0 for s in specialties])
+        utilisation_after = (active + 1) / capacity
+        cost = (
+            utilisation_after
+            + SPECIALTY_MISMATCH_COST * mismatch
+            + OVERLOAD_COST * np.maximum(utilisation_after - 1.0, 0.0)
+            # High-priority projects accept slightly busier specialists
+            - PRIORITY_LOAD_RELIEF * (project.get('priority') or 3) * (1 - mismatch) * (utilisation_after <= 1.0)
+        )
+        already = set(project.get('assigned_team') or [])
+        size = team_size or TEAM_SIZE_BY_COMPLEXITY.get(project.get('complexity') or 'media', 2)
+        size = max(1, min(int(size), len(ids)))
+
+        order = np.argsort(cost, kind="stable")
+        chosen = [i for i in order if ids[i] not in already][:size]
+        for i in chosen:
+            active[i] += 1
+
+        def entry(i):
+            return {
+                "id": ids[i],
+                "name": names[i],
+                "score": round(float(-cost[i]), 4),
+                "specialty_match": bool(mismatch[i] == 0),
+                "active_projects": int(active[i] - (1 if i in chosen else 0)),
+                "capacity_percent_after": round(float((active[i] + (0 if i in chosen else 1)) / capacity[i] * 100), 1)
+            }
+
+        overloaded = [names[i] for i in chosen if active[i] > capacity[i]]
+        plans.append({
+            "project_id": project.get('id'),
+            "title": project.get('title'),
+            "team_ids": [ids[i] for i in chosen],
+            # The ranking also lists people already on the project, whom `chosen` skips
+            "team": [entry(i) for i in chosen],
+            "ranking": [entry(i) for i in order[:max(10, size)]],
+            "workload_impact": (
+                f"Sobrecarga prevista para: {', '.join(overloaded)}" if overloaded
+                else "Equipe sugerida permanece dentro da capacidade"
+            )
+        })
+    return plans
+
+def describe_allocation(plan: dict) -> str:
+    chosen = plan['team']
+    if not chosen:
+        return "Nenhum técnico disponível para alocação."
+    parts = [
+        f"{t['name']} ({'especialidade compatível' if t['specialty_match'] else 'sem especialidade no tipo'}, "
+        f"{t['active_projects']} projetos ativos)"
+        for t in chosen
+    ]
+    return "Equipe escolhida por menor custo de alocação: " + "; ".join(parts) + "."
+
+# ==================== STAGE ANALYTICS ====================
+def parse_datetime(value) -> Optional[datetime]:
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+ROLLUP_GRANULARITIES = {"all": None, "month": "%Y-%m", "day": "%Y-%m-%d"}
+
+def _rollup_key(granularity: str, at: datetime, project: dict, stage_index: int) -> dict:
+    date_format = ROLLUP_GRANULARITIES[granularity]
+    return {
+        "granularity": granularity,
+        "bucket": at.strftime(date_format) if date_format else "all",
+        "municipality_id": project.get('municipality_id'),
+        "project_type": project.get('project_type'),
+        "stage_index": stage_index
+    }
+
+def _rollup_updates(project: dict, stage_index: int, stage_name: str, completed_at: datetime, duration_seconds: float) -> List[UpdateOne]:
+    return [
+        UpdateOne(
+            _rollup_key(granularity, completed_at, project, stage_index),
+            {
+                "$inc": {"count": 1, "total_seconds": duration_seconds},
+                "$min": {"min_seconds": duration_seconds},
+                "$max": {"max_seconds": duration_seconds},
+                "$setOnInsert": {"stage_name": stage_name}
+            },
+            upsert=True
+        )
+        for granularity in ROLLUP_GRANULARITIES
+    ]
+
+async def record_stage_event(project: dict, stage_index: int, stage: dict, previous_status: Optional[str], user_id: Optional[str]):
+    """Append a stage transition to stage_events and fold completed durations into the rollups"""
+    now = datetime.now(timezone.utc)
+    started_at = parse_datetime(stage.get('started_at'))
+    duration_seconds = None
+    if stage.get('status') == 'completed' and previous_status != 'completed' and started_at:
+        duration_seconds = max((now - started_at).total_seconds(), 0.0)
+
+    await db.stage_events.insert_one({
+        "id": str(uuid.uuid4()),
+        "project_id": project['id'],
+        "municipality_id": project.get('municipality_id'),
+        "project_type": project.get('project_type'),
+        "stage_index": stage_index,
+        "stage_name": stage.get('name'),
+        "from_status": previous_status,
+        "to_status": stage.get('status'),
+        "duration_seconds": duration_seconds,
+        "user_id": user_id,
+        "created_at": now.isoformat()
+    })
+    if duration_seconds is not None:
+        await db.stage_duration_rollups.bulk_write(
+            _rollup_updates(project, stage_index, stage.get('name'), now, duration_seconds), ordered=False
+        )
+
+async def rebuild_stage_rollups(batch_size: int = 1000) -> dict:
+    """Recompute the rollups from the stages arrays (one-off backfill for history before stage_events)"""
+    await db.stage_duration_rollups.delete_many({})
+    totals: Dict[tuple, dict] = {}
+    scanned = 0
+    async for project in db.projects.find(
+        {"stages.completed_at": {"$type": "string"}},
+        {"_id": 0, "id": 1, "municipality_id": 1, "project_type": 1, "stages": 1}
+    ).batch_size(batch_size):
+        scanned += 1
+        for stage_index, stage in enumerate(project.get('stages') or []):
+            started_at = parse_datetime(stage.get('started_at'))
+            completed_at = parse_datetime(stage.get('completed_at'))
+            if not started_at or not completed_at:
+                continue
+            duration = max((completed_at - started_at).total_seconds(), 0.0)
+            for granularity in ROLLUP_GRANULARITIES:
+                key = _rollup_key(granularity, completed_at, project, stage_index)
+                entry = totals.setdefault(tuple(key.values()), {
+                    **key, "stage_name": stage.get('name'), "count": 0, "total_seconds": 0.0,
+                    "min_seconds": duration, "max_seconds": duration
+                })
+                entry['count'] += 1
+                entry['total_seconds'] += duration
+                entry['min_seconds'] = min(entry['min_seconds'], duration)
+                entry['max_seconds'] = max(entry['max_seconds'], duration)
+
+    rollups = list(totals.values())
+    for i in range(0, len(rollups), batch_size):
+        await db.stage_duration_rollups.insert_many(rollups[i:i + batch_size], ordered=False)
+    return {"projects_scanned": scanned, "rollups": len(rollups)}
+
+# ==================== DEADLINE FORECAST ====================
+# Fallback stage durations (days) when there is not enough history, scaled by complexity
+DEFAULT_STAGE_DAYS = [5, 7, 10, 7, 30, 7]
+COMPLEXITY_DURATION_FACTOR = {"minima": 0.6, "media": 1.0, "alta": 1.8}
+FORECAST_MIN_SAMPLES = 3
+FORECAST_STATS_TTL_SECONDS = float(os.environ.get('FORECAST_STATS_TTL_SECONDS', '3600'))
+FORECAST_INACTIVE_STATUSES = [ProjectStatus.CONCLUIDO, ProjectStatus.RASCUNHO, ProjectStatus.PAUSADO]
+FORECAST_PROJECTION = {
+    "_id": 0, "id": 1, "title": 1, "status": 1, "stages": 1, "priority": 1, "ipr_score": 1,
+    "created_at": 1, "project_type": 1, "complexity": 1, "estimated_deadline": 1, "municipality_id": 1
+}
+
+async def load_stage_duration_stats() -> Dict[tuple, float]:
+    """Average days per (stage_index, project_type) and per stage_index (project_type None)"""
+    rows = await db.stage_duration_rollups.aggregate([
+        {"$match": {"granularity": "all"}},
+        {"$facet": {
+            "by_type": [{"$group": {"_id": {"stage": "$stage_index", "type": "$project_type"},
+                                    "total_seconds": {"$sum": "$total_seconds"}, "count": {"$sum": "$count"}}}],
+            "overall": [{"$group": {"_id": {"stage": "$stage_index", "type": None},
+                                    "total_seconds": {"$sum": "$total_seconds"}, "count": {"$sum": "$count"}}}]
+        }}
+    ]).to_list(1)
+    stats = {}
+    for row in (rows[0]['by_type'] + rows[0]['overall']) if rows else []:
+        if row['count'] >= FORECAST_MIN_SAMPLES:
+            stats[(row['_id']['stage'], row['_id']['type'])] = row['total_seconds'] / row['count'] / 86400
+    return stats
+
+class DeadlineForecaster:
+    """
+    List-scheduling simulation of the active pipeline over the team's parallel project slots.
+
+    Projects are simulated in queue order; the slot heap is checkpointed every CHECKPOINT_INTERVAL
+    positions so that a change to one project only re-simulates the queue from that project onwards.
+    """
+    CHECKPOINT_INTERVAL = 64
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.reset()
+
+    def reset(self):
+        self.order: List[tuple] = []
+        self.inputs: Dict[str, dict] = {}
+        self.results: Dict[str, dict] = {}
+        self.checkpoints: List[List[float]] = []
+        self.stats: Dict[tuple, float] = {}
+        self.slots = 1
+        self.base_time = datetime.now(timezone.utc)
+        self.stats_loaded_at = float('-inf')
+        self.dirty: set = set()
+        self.needs_rebuild = True
+
+    def invalidate(self, project_id: Optional[str] = None):
+        """Mark one project (or, without an id, everything) as changed since the last simulation"""
+        if project_id is None:
+            self.needs_rebuild = True
+        else:
+            self.dirty.add(project_id)
+
+    def _stage_days(self, index: int, project: dict) -> float:
+        days = self.stats.get((index, project.get('project_type')), self.stats.get((index, None)))
+        if days is None:
+            default = DEFAULT_STAGE_DAYS[index] if index < len(DEFAULT_STAGE_DAYS) else DEFAULT_STAGE_DAYS[-1]
+            days = default * COMPLEXITY_DURATION_FACTOR.get(project.get('complexity') or 'media', 1.0)
+        return days
+
+    def _simulation_input(self, project: dict) -> dict:
+        remaining = 0.0
+        started = False
+        for index, stage in enumerate(project.get('stages') or []):
+            if stage.get('status') == 'completed':
+                started = True
+                continue
+            days = self._stage_days(index, project)
+            if stage.get('status') == 'in_progress':
+                started = True
+                stage_start = parse_datetime(stage.get('started_at'))
+                if stage_start:
+                    elapsed = (self.base_time - stage_start).total_seconds() / 86400
+                    # An overrunning stage still needs some time to finish
+                    days = max(days - elapsed, days * 0.1)
+            remaining += days
+        created_at = project.get('created_at')
+        return {
+            "id": project['id'],
+            "title": project.get('title', ''),
+            "status": project.get('status'),
+            "municipality_id": project.get('municipality_id'),
+            "remaining_days": remaining,
+            "estimated_deadline": parse_datetime(project.get('estimated_deadline')),
+            "key": (
+                0 if started else 1,
+                -(project.get('ipr_score') or 0.0),
+                -(project.get('priority') or 3),
+                created_at.isoformat() if isinstance(created_at, datetime) else (created_at or ''),
+                project['id']
+            )
+        }
+
+    def _simulate_from(self, position: int):
+        checkpoint = min(position // self.CHECKPOINT_INTERVAL, len(self.checkpoints) - 1) if self.checkpoints else 0
+        if self.checkpoints:
+            slots_free_at = list(self.checkpoints[checkpoint])
+        else:
+            slots_free_at = [0.0] * self.slots
+        del self.checkpoints[checkpoint:]
+        heapq.heapify(slots_free_at)
+
+        for index in range(checkpoint * self.CHECKPOINT_INTERVAL, len(self.order)):
+            if index % self.CHECKPOINT_INTERVAL == 0:
+                self.checkpoints.append(list(slots_free_at))
+            item = self.inputs[self.order[index][-1]]
+            start = heapq.heappop(slots_free_at)
+            finish = start + item['remaining_days']
+            heapq.heappush(slots_free_at, finish)
+            completion = self.base_time + timedelta(days=finish)
+            self.results[item['id']] = {
+                "project_id": item['id'],
+                "title": item['title'],
+                "status": item['status'],
+                "municipality_id": item['municipality_id'],
+                "queue_position": index + 1,
+                "forecast_start": (self.base_time + timedelta(days=start)).isoformat(),
+                "forecast_completion": completion.isoformat(),
+                "remaining_days": round(item['remaining_days'], 1),
+                "estimated_deadline": item['estimated_deadline'].isoformat() if item['estimated_deadline'] else None,
+                "at_risk": bool(item['estimated_deadline'] and completion > item['estimated_deadline'])
+            }
+
+    async def _rebuild(self):
+        self.reset()
+        self.stats = await load_stage_duration_stats()
+        self.stats_loaded_at = time.monotonic()
+        team = await db.users.find({"role": UserRole.TECNICO_AMVALI}, {"_id": 0, "workload_hours": 1}).to_list(None)
+        self.slots = max(1, int(sum((t.get('workload_hours') or 40) for t in team) // HOURS_PER_PROJECT))
+
+        async for project in db.projects.find({"status": {"$nin": FORECAST_INACTIVE_STATUSES}}, FORECAST_PROJECTION):
+            item = self._simulation_input(project)
+            self.inputs[item['id']] = item
+        self.order = sorted(item['key'] for item in self.inputs.values())
+        self._simulate_from(0)
+        self.needs_rebuild = False
+
+    async def _apply_changes(self):
+        dirty, self.dirty = self.dirty, set()
+        changed = await db.projects.find({"id": {"$in": list(dirty)}}, FORECAST_PROJECTION).to_list(None)
+        changed_by_id = {p['id']: p for p in changed}
+        first_affected = len(self.order)
+
+        for project_id in dirty:
+            previous = self.inputs.pop(project_id, None)
+            if previous:
+                position = bisect.bisect_left(self.order, previous['key'])
+                del self.order[position]
+                self.results.pop(project_id, None)
+                first_affected = min(first_affected, position)
+            project = changed_by_id.get(project_id)
+            if project and project.get('status') not in FORECAST_INACTIVE_STATUSES:
+                item = self._simulation_input(project)
+                self.inputs[project_id] = item
+                position = bisect.bisect_left(self.order, item['key'])
+                self.order.insert(position, item['key'])
+                first_affected = min(first_affected, position)
+
+        if first_affected < len(self.order):
+            self._simulate_from(first_affected)
+        else:
+            del self.checkpoints[len(self.order) // self.CHECKPOINT_INTERVAL + 1:]
+
+    async def refresh(self) -> "DeadlineForecaster":
+        async with self._lock:
+            if self.needs_rebuild or time.monotonic() - self.stats_loaded_at > FORECAST_STATS_TTL_SECONDS:
+                await self._rebuild()
+            elif self.dirty:
+                await self._apply_changes()
+        return self
+
+    def queue(self) -> List[dict]:
+        return [self.results[key[-1]] for key in self.order]
+
+deadline_forecaster = DeadlineForecaster()
+
+# ==================== CACHES ====================
+class SnapshotCache:
+    """
+    TTL cache of computed JSON responses in the shared state, grouped by namespace for targeted invalidation.
+
+    Invalidation replaces a generation token instead of deleting keys, so it is a single command on
+    any backend; entries of older generations are never read again and simply expire.
+    """
+
+    def __init__(self, name: str, ttl_seconds: float = 300):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        CACHES.append(self)
+
+    def _generation_keys(self, namespace: str) -> List[str]:
+        return [f"cache:{self.name}:generation", f"cache:{self.name}:generation:{namespace}"]
+
+    async def get_or_compute(self, namespace: str, key: Any, compute: Callable[[], Awaitable[Any]]):
+        # The generations are read before computing: an invalidation that lands meanwhile makes the
+        # stored value unreachable instead of letting it overwrite fresher data
+        generations = await shared_state.get_many(self._generation_keys(namespace))
+        entry_key = f"cache:{self.name}:{generations[0] or 0}:{namespace}:{generations[1] or 0}:{key!r}"
+        cached = await shared_state.get(entry_key)
+        if cached is not None:
+            self.hits += 1
+            return json.loads(cached)
+        self.misses += 1
+        value = await compute()
+        await shared_state.set(entry_key, json.dumps(jsonable_encoder(value)), ttl=self.ttl_seconds)
+        return value
+
+    async def invalidate(self, namespace: Optional[str] = None):
+        generation_keys = self._generation_keys(namespace)
+        await shared_state.set(generation_keys[0] if namespace is None else generation_keys[1], uuid.uuid4().hex)
+
+CACHES: List[SnapshotCache] = []
+
+def _cache_stats(attribute: str):
+    return lambda: [((cache.name,), getattr(cache, attribute)) for cache in CACHES]
+
+metrics.register(Gauge("cache_hits", "Snapshot cache hits since start", ("cache",), callback=_cache_stats('hits')))
+metrics.register(Gauge("cache_misses", "Snapshot cache misses since start", ("cache",), callback=_cache_stats('misses')))
+
+municipality_dashboard_cache = SnapshotCache(
+    "municipality_dashboard", ttl_seconds=float(os.environ.get('MUNICIPALITY_DASHBOARD_CACHE_SECONDS', '300'))
+)
+dashboard_stats_cache = SnapshotCache(
+    "dashboard_stats", ttl_seconds=float(os.environ.get('DASHBOARD_STATS_CACHE_SECONDS', '60'))
+)
+technical_queue_cache = SnapshotCache(
+    "technical_queue", ttl_seconds=float(os.environ.get('TECHNICAL_QUEUE_CACHE_SECONDS', '60'))
+)
+municipalities_cache = SnapshotCache(
+    "municipalities", ttl_seconds=float(os.environ.get('MUNICIPALITIES_CACHE_SECONDS', '300'))
+)
+
+# The forecaster's simulation is process-local; other workers learn about changes through pub/sub
+FORECAST_INVALIDATION_CHANNEL = "forecast-invalidations"
+
+def _apply_forecast_invalidation(project_ids: Optional[List[str]]):
+    if project_ids is None:
+        deadline_forecaster.invalidate()
+    for project_id in project_ids or []:
+        deadline_forecaster.invalidate(project_id)
+
+async def invalidate_forecast(project_ids: Optional[List[str]] = None):
+    """Mark projects (or, without ids, everything) as changed in this worker and announce it to the others"""
+    _apply_forecast_invalidation(project_ids)
+    await shared_state.publish(FORECAST_INVALIDATION_CHANNEL, json.dumps({"origin": WORKER_ID, "project_ids": project_ids}))
+
+async def listen_for_forecast_invalidations():
+    while True:
+        try:
+            async for message in shared_state.subscribe(FORECAST_INVALIDATION_CHANNEL):
+                event = json.loads(message)
+                if event['origin'] != WORKER_ID:
+                    _apply_forecast_invalidation(event['project_ids'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Messages may have been missed while disconnected: rebuild rather than serve a stale forecast
+            logger.error(f"Forecast invalidation subscription failed, retrying: {e}")
+            deadline_forecaster.invalidate()
+            await asyncio.sleep(1)
+
+async def invalidate_project_views(project_id: Optional[str] = None, municipality_id: Optional[str] = None):
+    """Drop derived views after a project write, in every worker; without arguments everything is invalidated"""
+    await invalidate_forecast(None if project_id is None else [project_id])
+    if project_id is None or municipality_id is not None:
+        await municipality_dashboard_cache.invalidate(municipality_id)
+    await dashboard_stats_cache.invalidate()
+    await technical_queue_cache.invalidate()
+
+# Writes from other workers, /seed, scripts or the mongo shell reach the caches through the bus. Handlers
+# above still invalidate explicitly so a client reads its own write without waiting for the event.
+INVALIDATION_BUS_MODE = os.environ.get('INVALIDATION_BUS_MODE', 'auto')
+INVALIDATION_POLL_SECONDS = float(os.environ.get('INVALIDATION_POLL_SECONDS', '2'))
+# Polling re-reads this far behind its watermark, like SYNC_TIMESTAMP_OVERLAP_SECONDS does for /sync cursors
+INVALIDATION_POLL_OVERLAP_SECONDS = float(os.environ.get('INVALIDATION_POLL_OVERLAP_SECONDS', '5'))
+invalidation_bus: Optional[InvalidationBus] = None
+
+async def on_project_change(event: ChangeEvent):
+    # Every worker runs its own bus, so the process-local forecaster is only updated locally
+    _apply_forecast_invalidation(None if event.document_id is None else [event.document_id])
+    await municipality_dashboard_cache.invalidate((event.document or {}).get('municipality_id'))
+    await dashboard_stats_cache.invalidate()
+    await technical_queue_cache.invalidate()
+
+async def on_municipality_change(event: ChangeEvent):
+    await municipality_dashboard_cache.invalidate(event.document_id)
+    await municipalities_cache.invalidate()
+    await dashboard_stats_cache.invalidate()
+
+async def on_user_change(event: ChangeEvent):
+    # Team capacity in the stats and the forecaster's technician pool
+    await dashboard_stats_cache.invalidate()
+    if event.document is None or event.document.get('role') == UserRole.TECNICO_AMVALI:
+        _apply_forecast_invalidation(None)
+
+def create_invalidation_bus() -> InvalidationBus:
+    bus = InvalidationBus(
+        db,
+        [
+            WatchedCollection("projects", fields=("municipality_id",)),
+            WatchedCollection("municipalities"),
+            WatchedCollection("users", fields=("role",)),
+        ],
+        mode=INVALIDATION_BUS_MODE,
+        poll_interval=INVALIDATION_POLL_SECONDS,
+        overlap=INVALIDATION_POLL_OVERLAP_SECONDS,
+    )
+    bus.subscribe("projects", on_project_change)
+    bus.subscribe("municipalities", on_municipality_change)
+    bus.subscribe("users", on_user_change)
+    return bus
+
+metrics.register(Gauge("invalidation_bus_events_delivered", "Change events delivered to cache subscribers since start",
+                       callback=lambda: [((), invalidation_bus.events_delivered if invalidation_bus else 0)]))
+
 # ==================== TEAM ROUTES ====================
 @api_router.get("/team")
 async def get_team(current_user: dict = Depends(get_current_user)):
@@ -555,13 +2532,25 @@ async def get_team(current_user: dict = Depends(get_current_user)):
         {"_id": 0, "password_hash": 0}
     ).to_list(100)
     
+    # One count aggregation and one project query for the whole team, not a round-trip per technician
+    tech_ids = [tech['id'] for tech in technicians]
+    results = await fan_out(
+        loads=get_technician_loads,
+        projects=lambda: db.projects.find(
+            {"assigned_team": {"$in": tech_ids}, "status": {"$nin": [ProjectStatus.CONCLUIDO]}},
+            {"_id": 0, "id": 1, "title": 1, "priority": 1, "status": 1, "assigned_team": 1}
+        ).to_list(None)
+    )
+    assigned_by_tech = {tech_id: [] for tech_id in tech_ids}
+    for project in results['projects']:
+        for tech_id in project.pop('assigned_team', None) or []:
+            assigned = assigned_by_tech.get(tech_id)
+            if assigned is not None and len(assigned) < 20:
+                assigned.append(project)
+
     team_members = []
     for tech in technicians:
-        # Get assigned projects
-        assigned = await db.projects.find(
-            {"assigned_team": tech['id'], "status": {"$nin": [ProjectStatus.CONCLUIDO]}},
-            {"_id": 0, "id": 1, "title": 1, "priority": 1, "status": 1}
-        ).to_list(20)
+        assigned = assigned_by_tech[tech['id']]
         
         capacity = min(100, (tech.get('active_projects', 0) / max(tech.get('workload_hours', 40) / 8, 1)) * 100)
         
@@ -571,7 +2560,7 @@ async def get_team(current_user: dict = Depends(get_current_user)):
             "email": tech['email'],
             "specialties": tech.get('specialties', []),
             "workload_hours": tech.get('workload_hours', 40),
-            "active_projects": len(assigned),
+            "active_projects": results['loads'].get(tech['id'], 0),
             "capacity_percent": capacity,
             "assigned_projects": assigned
         })
@@ -586,10 +2575,14 @@ async def allocate_team(allocation_data: dict, current_user: dict = Depends(get_
     project_id = allocation_data.get('project_id')
     team_ids = allocation_data.get('team_ids', [])
     
-    await db.projects.update_one(
+    before = await db.projects.find_one_and_update(
         {"id": project_id},
-        {"$set": {"assigned_team": team_ids, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"assigned_team": team_ids, "updated_at": datetime.now(timezone.utc).isoformat()}, "$inc": VERSION_BUMP},
+        projection={"_id": 0, "assigned_team": 1, "municipality_id": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    if before is not None:
+        change_log.record(project_id, "allocate", diff_fields(before, {"assigned_team": team_ids}), current_user['id'])
     
     # Update team member active projects count
     for tid in team_ids:
@@ -597,133 +2590,621 @@ async def allocate_team(allocation_data: dict, current_user: dict = Depends(get_
             "assigned_team": tid,
             "status": {"$nin": [ProjectStatus.CONCLUIDO]}
         })
-        await db.users.update_one({"id": tid}, {"$set": {"active_projects": count}})
+        await db.users.update_one({"id": tid}, {"$set": {"active_projects": count, "updated_at": datetime.now(timezone.utc).isoformat()}})
+    await invalidate_project_views(project_id, before.get('municipality_id') if before else None)
     
     return {"message": "Team allocated"}
 
+# ==================== PROJECT ARCHIVE ====================
+# Projects concluded (last written) more than ARCHIVE_AFTER_DAYS ago move to projects_archive, so the hot
+# collection only holds work in progress. Archived documents keep their summary fields queryable and pack
+# the rest as zlib-compressed JSON. Per-scope counters in archive_counters keep dashboard totals whole
+# without scanning the archive.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '180'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '500'))
+ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', '24'))  # 0 disables the periodic job
+# Uncounted copies older than this belong to a run that died mid-batch; the next run finishes counting them
+ARCHIVE_RECOVERY_MINUTES = int(os.environ.get('ARCHIVE_RECOVERY_MINUTES', '10'))
+ARCHIVE_APPLIED_TOKENS = 1000  # batch tokens each counter document remembers, to apply every batch only once
+ARCHIVE_SUMMARY_FIELDS = (
+    "id", "title", "project_type", "municipality_id", "municipality_name", "status", "priority", "complexity",
+    "ipr_score", "version", "created_at", "updated_at"
+)
+
+PROJECTS_ARCHIVED = metrics.register(Counter(
+    "projects_archived_total", "Projects moved from projects to projects_archive"))
+
+def compress_project(project: dict) -> dict:
+    archived = {field: project.get(field) for field in ARCHIVE_SUMMARY_FIELDS}
+    details = {k: v for k, v in project.items() if k not in ARCHIVE_SUMMARY_FIELDS and k != "_id"}
+    archived['compressed'] = zlib.compress(json.dumps(jsonable_encoder(details)).encode(), 6)
+    archived['archived_at'] = datetime.now(timezone.utc).isoformat()
+    return archived
+
+def decompress_project(archived: dict) -> dict:
+    project = {k: v for k, v in archived.items() if k not in ("_id", "compressed", "counted", "count_token")}
+    project.update(json.loads(zlib.decompress(archived['compressed'])))
+    project['archived'] = True
+    return project
+
+async def find_project(project_id: str) -> Optional[dict]:
+    """The hot document, or the decompressed archived one (marked archived: true)"""
+    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    if project is not None:
+        return project
+    archived = await db.projects_archive.find_one({"id": project_id}, {"_id": 0})
+    return decompress_project(archived) if archived else None
+
+async def apply_archive_counts(token: str, projects: List[dict]):
+    """
+    Add a batch of archived copies to the counters, then mark the copies counted. Each counter document
+    remembers the last batch tokens it applied, so a retry of the same batch (after a crash between the
+    two steps, or by two recovering workers) never counts twice.
+    """
+    increments: Dict[str, Dict[str, int]] = {}
+    for project in projects:
+        for scope in ("all", f"municipality:{project.get('municipality_id')}"):
+            inc = increments.setdefault(scope, {})
+            for key in ("total", f"by_status.{project.get('status')}", f"by_type.{project.get('project_type')}"):
+                inc[key] = inc.get(key, 0) + 1
+    if increments:
+        # Create missing scopes first, so the guarded $inc never has to upsert past its own filter
+        await db.archive_counters.bulk_write([
+            UpdateOne({"_id": scope}, {"$setOnInsert": {"total": 0}}, upsert=True) for scope in increments
+        ], ordered=False)
+        await db.archive_counters.bulk_write([
+            UpdateOne({"_id": scope, "applied": {"$ne": token}},
+                      {"$inc": inc, "$push": {"applied": {"$each": [token], "$slice": -ARCHIVE_APPLIED_TOKENS}}})
+            for scope, inc in increments.items()
+        ], ordered=False)
+    await db.projects_archive.update_many(
+        {"count_token": token, "id": {"$in": [p['id'] for p in projects]}}, {"$set": {"counted": True}}
+    )
+
+async def settle_archive_batch(token: str, ids: List[str]) -> List[dict]:
+    """Drop the batch's copies of projects that are still hot, count the rest; returns the counted copies"""
+    hot = {p['id'] for p in await db.projects.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(len(ids))}
+    if hot:
+        # Written to after being copied (or never deleted): no longer archivable, the copy is stale
+        await db.projects_archive.delete_many({"count_token": token, "counted": False, "id": {"$in": list(hot)}})
+    copies = await db.projects_archive.find(
+        {"count_token": token, "counted": False, "id": {"$in": [i for i in ids if i not in hot]}},
+        {"_id": 0, "id": 1, "municipality_id": 1, "status": 1, "project_type": 1}
+    ).to_list(len(ids))
+    await apply_archive_counts(token, copies)
+    return copies
+
+async def recover_uncounted_copies() -> int:
+    """Finish the batches of runs that died between copying and counting"""
+    stale = (datetime.now(timezone.utc) - timedelta(minutes=ARCHIVE_RECOVERY_MINUTES)).isoformat()
+    recovered = 0
+    for token in await db.projects_archive.distinct("count_token", {"counted": False, "archived_at": {"$lt": stale}}):
+        ids = [c['id'] for c in await db.projects_archive.find(
+            {"count_token": token, "counted": False}, {"_id": 0, "id": 1}
+        ).to_list(None)]
+        recovered += len(await settle_archive_batch(token, ids))
+    if recovered:
+        logger.warning(f"Counted {recovered} archived projects left uncounted by an interrupted run")
+    return recovered
+
+async def get_archive_counters(scope: str) -> dict:
+    counters = await db.archive_counters.find_one({"_id": scope}, {"_id": 0, "applied": 0})
+    return counters or {"total": 0, "by_status": {}, "by_type": {}}
+
+def merge_counts(hot: Dict[str, int], archived: Dict[str, int]) -> Dict[str, int]:
+    merged = dict(hot)
+    for key, count in archived.items():
+        if count:
+            merged[key] = merged.get(key, 0) + count
+    return merged
+
+async def archive_concluded_projects(older_than_days: int = ARCHIVE_AFTER_DAYS, dry_run: bool = False) -> dict:
+    """
+    Copy, delete, then count, one batch at a time. Copies are written with counted: false and a batch token;
+    only the run that inserted a copy counts it, and copies a crashed run left uncounted are picked up by a
+    later run. A project written to after it was copied stays hot and loses its copy.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    query = {"status": ProjectStatus.CONCLUIDO, "updated_at": {"$lt": cutoff}}
+    if dry_run:
+        return {"dry_run": True, "cutoff": cutoff, "eligible": await db.projects.count_documents(query)}
+
+    archived = await recover_uncounted_copies()
+    municipalities = set()
+    while True:
+        batch = await db.projects.find(query).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not batch:
+            break
+        token = str(uuid.uuid4())
+        duplicates = set()
+        try:
+            await db.projects_archive.insert_many(
+                [{**compress_project(p), "counted": False, "count_token": token} for p in batch], ordered=False
+            )
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != 11000 for error in errors):
+                raise
+            duplicates = {error['index'] for error in errors}
+
+        # Only projects whose copy this run wrote leave the hot collection. Another run's copy is settled by
+        # that run, or by recovery if it died (which drops the copy while the project is still hot).
+        ids = [p['id'] for i, p in enumerate(batch) if i not in duplicates]
+        await db.projects.delete_many({"id": {"$in": ids}, **query})
+        counted = await settle_archive_batch(token, ids)
+        archived += len(counted)
+        municipalities.update(p.get('municipality_id') for p in counted)
+        if len(batch) < ARCHIVE_BATCH_SIZE or not counted:
+            break
+
+    PROJECTS_ARCHIVED.inc(amount=archived)
+    if archived:
+        await invalidate_project_views()
+    logger.info(f"Archived {archived} projects concluded before {cutoff}")
+    return {"dry_run": False, "cutoff": cutoff, "archived": archived, "municipalities": len(municipalities - {None})}
+
+async def run_archive_job():
+    while True:
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 3600)
+        try:
+            await archive_concluded_projects()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Project archive job failed: {e}")
+
+@api_router.post("/admin/archive")
+async def archive_projects(older_than_days: int = ARCHIVE_AFTER_DAYS, dry_run: bool = False,
+                           current_user: dict = Depends(get_current_user)):
+    """Move long-concluded projects to the archive now instead of waiting for the periodic job"""
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
+        raise HTTPException(status_code=403, detail="Only AMVALI managers can archive projects")
+    if older_than_days < 0:
+        raise HTTPException(status_code=400, detail="older_than_days must be zero or positive")
+    return await archive_concluded_projects(older_than_days, dry_run)
+
 # ==================== DASHBOARD ROUTES ====================
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats(current_user: dict = Depends(get_current_user)):
-    # Total projects
-    total_projects = await db.projects.count_documents({})
-    active_projects = await db.projects.count_documents({"status": {"$nin": [ProjectStatus.CONCLUIDO, ProjectStatus.RASCUNHO]}})
-    completed_projects = await db.projects.count_documents({"status": ProjectStatus.CONCLUIDO})
-    
-    # Projects by status
-    pipeline = [
-        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
-    ]
-    status_counts = await db.projects.aggregate(pipeline).to_list(20)
-    
-    # Projects by type
-    type_pipeline = [
-        {"$group": {"_id": "$project_type", "count": {"$sum": 1}}}
-    ]
-    type_counts = await db.projects.aggregate(type_pipeline).to_list(10)
-    
+    # The same for every user; the short TTL also bounds how late the 30-day overdue window moves
+    return await dashboard_stats_cache.get_or_compute("all", None, compute_dashboard_stats)
+
+async def compute_dashboard_stats() -> dict:
+    # Cache fill: read the primary, a lagging secondary would pin pre-write numbers for the whole TTL
+    # Overdue projects (simplified - projects in execution for > 30 days)
+    thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
+
+    results = await fan_out(
+        total_projects=lambda: db.projects.count_documents({}),
+        active_projects=lambda: db.projects.count_documents({"status": {"$nin": [ProjectStatus.CONCLUIDO, ProjectStatus.RASCUNHO]}}),
+        completed_projects=lambda: db.projects.count_documents({"status": ProjectStatus.CONCLUIDO}),
+        status_counts=lambda: db.projects.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}]).to_list(20),
+        type_counts=lambda: db.projects.aggregate([{"$group": {"_id": "$project_type", "count": {"$sum": 1}}}]).to_list(10),
+        team=lambda: db.users.find({"role": UserRole.TECNICO_AMVALI}, {"_id": 0}).to_list(100),
+        municipalities_count=lambda: db.municipalities.count_documents({}),
+        overdue=lambda: db.projects.count_documents({
+            "status": ProjectStatus.EXECUCAO,
+            "created_at": {"$lt": thirty_days_ago}
+        }),
+        queue_size=lambda: db.projects.count_documents({"status": {"$in": [ProjectStatus.VALIDACAO, ProjectStatus.EXECUCAO]}}),
+        archived=lambda: get_archive_counters("all")
+    )
+    archived = results['archived']
+
     # Team capacity
-    team = await db.users.find({"role": UserRole.TECNICO_AMVALI}, {"_id": 0}).to_list(100)
+    team = results['team']
     total_capacity = sum(t.get('workload_hours', 40) for t in team)
     used_capacity = sum(t.get('active_projects', 0) * 8 for t in team)
     capacity_percent = (used_capacity / max(total_capacity, 1)) * 100
     
-    # Municipalities count
-    municipalities_count = await db.municipalities.count_documents({})
-    
-    # Overdue projects (simplified - projects in execution for > 30 days)
-    thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).isoformat()
-    overdue = await db.projects.count_documents({
-        "status": ProjectStatus.EXECUCAO,
-        "created_at": {"$lt": thirty_days_ago}
-    })
-    
     return {
-        "total_projects": total_projects,
-        "active_projects": active_projects,
-        "completed_projects": completed_projects,
-        "projects_by_status": {s['_id']: s['count'] for s in status_counts},
-        "projects_by_type": {t['_id']: t['count'] for t in type_counts},
+        "total_projects": results['total_projects'] + archived['total'],
+        "active_projects": results['active_projects'],
+        "completed_projects": results['completed_projects'] + archived['by_status'].get(ProjectStatus.CONCLUIDO, 0),
+        "archived_projects": archived['total'],
+        "projects_by_status": merge_counts({s['_id']: s['count'] for s in results['status_counts']}, archived['by_status']),
+        "projects_by_type": merge_counts({t['_id']: t['count'] for t in results['type_counts']}, archived['by_type']),
         "team_capacity_percent": round(capacity_percent, 1),
-        "municipalities_count": municipalities_count,
-        "overdue_projects": overdue,
-        "queue_size": await db.projects.count_documents({"status": {"$in": [ProjectStatus.VALIDACAO, ProjectStatus.EXECUCAO]}})
+        "municipalities_count": results['municipalities_count'],
+        "overdue_projects": results['overdue'],
+        "queue_size": results['queue_size']
     }
 
+MUNICIPALITY_PROJECT_SUMMARY = {
+    "_id": 0, "id": 1, "title": 1, "project_type": 1, "municipality_name": 1, "status": 1, "priority": 1,
+    "complexity": 1, "progress_percent": 1, "ipr_score": 1, "assigned_team": 1, "created_at": 1, "updated_at": 1
+}
+
 @api_router.get("/dashboard/municipality/{municipality_id}")
-async def get_municipality_dashboard(municipality_id: str, current_user: dict = Depends(get_current_user)):
-    municipality = await db.municipalities.find_one({"id": municipality_id}, {"_id": 0})
-    if not municipality:
+async def get_municipality_dashboard(municipality_id: str, limit: int = 20, offset: int = 0,
+                                     current_user: dict = Depends(get_current_user)):
+    limit = max(1, min(limit, 100))
+    offset = max(offset, 0)
+    return await municipality_dashboard_cache.get_or_compute(
+        municipality_id, (limit, offset), lambda: build_municipality_dashboard(municipality_id, limit, offset)
+    )
+
+async def build_municipality_dashboard(municipality_id: str, limit: int, offset: int) -> dict:
+    # Counts, status breakdown and one page of project summaries in a single round-trip; from the primary,
+    # since the result is cached and must not predate the write that invalidated the previous snapshot
+    rows = await db.municipalities.aggregate([
+        {"$match": {"id": municipality_id}},
+        {"$project": {"_id": 0}},
+        {"$lookup": {
+            "from": "projects",
+            "localField": "id",
+            "foreignField": "municipality_id",
+            "pipeline": [{"$facet": {
+                "counts": [{"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "active": {"$sum": {"$cond": [{"$in": ["$status", [ProjectStatus.CONCLUIDO, ProjectStatus.RASCUNHO]]}, 0, 1]}},
+                    "completed": {"$sum": {"$cond": [{"$eq": ["$status", ProjectStatus.CONCLUIDO]}, 1, 0]}}
+                }}],
+                "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+                "projects": [
+                    {"$sort": {"ipr_score": -1, "created_at": -1}},
+                    {"$skip": offset},
+                    {"$limit": limit},
+                    {"$project": MUNICIPALITY_PROJECT_SUMMARY}
+                ]
+            }}],
+            "as": "project_stats"
+        }}
+    ]).to_list(1)
+    if not rows:
         raise HTTPException(status_code=404, detail="Municipality not found")
-    
-    projects = await db.projects.find({"municipality_id": municipality_id}, {"_id": 0}).to_list(100)
-    
-    active = [p for p in projects if p['status'] not in [ProjectStatus.CONCLUIDO, ProjectStatus.RASCUNHO]]
-    completed = [p for p in projects if p['status'] == ProjectStatus.CONCLUIDO]
-    
-    return {
+    archived = await get_archive_counters(f"municipality:{municipality_id}")
+
+    municipality = rows[0]
+    stats = municipality.pop('project_stats')[0]
+    counts = stats['counts'][0] if stats['counts'] else {"total": 0, "active": 0, "completed": 0}
+
+    dashboard = {
         "municipality": municipality,
-        "total_projects": len(projects),
-        "active_projects": len(active),
-        "completed_projects": len(completed),
-        "projects": projects,
+        "total_projects": counts['total'] + archived['total'],
+        "active_projects": counts['active'],
+        "completed_projects": counts['completed'] + archived['by_status'].get(ProjectStatus.CONCLUIDO, 0),
+        "archived_projects": archived['total'],
+        "projects_by_status": merge_counts({s['_id']: s['count'] for s in stats['by_status']}, archived['by_status']),
+        # The page lists hot projects only; archived ones are still reachable by id
+        "projects": stats['projects'],
+        "pagination": {"limit": limit, "offset": offset, "total": counts['total']},
         "engagement_score": municipality.get('engagement_score', 0),
         "active_stars": municipality.get('active_stars', {})
     }
+    return dashboard
+
+# ==================== ANALYTICS ROUTES ====================
+@api_router.get("/analytics/stage-durations")
+async def get_stage_durations(
+    granularity: str = "all",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    municipality_id: Optional[str] = None,
+    project_type: Optional[str] = None,
+    stage_index: Optional[int] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Average time per stage and municipality, answered from the pre-aggregated rollups"""
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of: {', '.join(ROLLUP_GRANULARITIES)}")
+    if current_user['role'] == UserRole.MUNICIPAL:
+        municipality_id = current_user.get('municipality_id')
+
+    match = {"granularity": granularity}
+    if granularity != "all" and (since or until):
+        # Buckets are ISO prefixes, so they compare correctly as strings
+        bucket_length = len(datetime.now(timezone.utc).strftime(ROLLUP_GRANULARITIES[granularity]))
+        match['bucket'] = {}
+        if since:
+            match['bucket']['$gte'] = since[:bucket_length]
+        if until:
+            match['bucket']['$lte'] = until[:bucket_length]
+    if municipality_id:
+        match['municipality_id'] = municipality_id
+    if project_type:
+        match['project_type'] = project_type
+    if stage_index is not None:
+        match['stage_index'] = stage_index
+
+    group_id = {"municipality_id": "$municipality_id", "stage_index": "$stage_index"}
+    if granularity != "all":
+        group_id['bucket'] = "$bucket"
+    rows = await db.stage_duration_rollups.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": group_id,
+            "stage_name": {"$first": "$stage_name"},
+            "count": {"$sum": "$count"},
+            "total_seconds": {"$sum": "$total_seconds"},
+            "min_seconds": {"$min": "$min_seconds"},
+            "max_seconds": {"$max": "$max_seconds"}
+        }},
+        {"$sort": {"_id.municipality_id": 1, "_id.stage_index": 1, "_id.bucket": 1}}
+    ]).to_list(None)
+
+    return {
+        "granularity": granularity,
+        "durations": [
+            {
+                **row['_id'],
+                "stage_name": row['stage_name'],
+                "count": row['count'],
+                "avg_days": round(row['total_seconds'] / row['count'] / 86400, 2),
+                "min_days": round(row['min_seconds'] / 86400, 2),
+                "max_days": round(row['max_seconds'] / 86400, 2)
+            }
+            for row in rows if row['count']
+        ]
+    }
+
+@api_router.post("/analytics/stage-durations/rebuild")
+async def rebuild_stage_durations(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
+        raise HTTPException(status_code=403, detail="Only AMVALI managers can rebuild analytics")
+
+    result = await rebuild_stage_rollups()
+    await invalidate_forecast()
+    return result
+
+# ==================== FORECAST ROUTES ====================
+@api_router.get("/forecast/queue")
+async def get_queue_forecast(limit: int = 100, offset: int = 0, current_user: dict = Depends(get_current_user)):
+    """Forecast start/completion dates for the whole active pipeline, in simulated order"""
+    forecaster = await deadline_forecaster.refresh()
+    queue = forecaster.queue()
+    if current_user['role'] == UserRole.MUNICIPAL:
+        queue = [f for f in queue if f['municipality_id'] == current_user.get('municipality_id')]
+
+    return {
+        "computed_at": forecaster.base_time.isoformat(),
+        "capacity_slots": forecaster.slots,
+        "total": len(queue),
+        "at_risk": sum(1 for f in queue if f['at_risk']),
+        "projects": queue[offset:offset + limit]
+    }
+
+@api_router.get("/forecast/projects/{project_id}")
+async def get_project_forecast(project_id: str, current_user: dict = Depends(get_current_user)):
+    forecaster = await deadline_forecaster.refresh()
+    forecast = forecaster.results.get(project_id)
+    if not forecast:
+        raise HTTPException(status_code=404, detail="Project is not in the active pipeline")
+    return forecast
 
 # ==================== NOTIFICATION ROUTES ====================
 @api_router.get("/notifications")
 async def get_notifications(current_user: dict = Depends(get_current_user)):
-    query = {"user_id": current_user['id']}
-    if current_user['role'] == UserRole.MUNICIPAL:
-        query = {"$or": [
-            {"user_id": current_user['id']},
-            {"user_id": current_user.get('municipality_id', '')}
-        ]}
-    
+    query = notification_scope(current_user)
     notifications = await db.notifications.find(query, {"_id": 0}).sort("created_at", -1).to_list(50)
     return notifications
 
+def notification_scope(current_user: dict) -> dict:
+    if current_user['role'] == UserRole.MUNICIPAL:
+        return {"user_id": {"$in": [current_user['id'], current_user.get('municipality_id', '')]}}
+    return {"user_id": current_user['id']}
+
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user)):
-    await db.notifications.update_one({"id": notification_id}, {"$set": {"read": True}})
+    await db.notifications.update_one(
+        {"id": notification_id},
+        {"$set": {"read": True, "read_at": datetime.now(timezone.utc).isoformat()}}
+    )
     return {"message": "Notification marked as read"}
 
+# ==================== SYNC ====================
+# GET /sync?since=<cursor> returns only the projects, municipalities and notifications changed after the
+# cursor. With a replica set the cursor is a change stream resume token; on a standalone server (no change
+# streams) it falls back to a timestamp over updated_at / created_at / read_at. Without `since` (or with a
+# cursor that can no longer be resumed) the response is a full snapshot with `reset: true`.
+SYNC_MODE = os.environ.get('SYNC_MODE', 'auto')  # auto | change_stream | timestamp
+SYNC_MAX_CHANGES = int(os.environ.get('SYNC_MAX_CHANGES', '1000'))
+SYNC_AWAIT_MS = int(os.environ.get('SYNC_AWAIT_MS', '50'))
+# Timestamp cursors step back this far so writes stamped just before the cursor but committed after it,
+# or stamped by a worker with a slightly late clock, are not missed; clients apply results by id
+SYNC_TIMESTAMP_OVERLAP_SECONDS = float(os.environ.get('SYNC_TIMESTAMP_OVERLAP_SECONDS', '5'))
+SYNC_COLLECTIONS = ("projects", "municipalities", "notifications")
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}  # not a replica set / unrecognized $changeStream stage
+CHANGE_STREAM_HISTORY_LOST = 286
+
+_change_streams_supported: Optional[bool] = None
+
+SYNC_REQUESTS = metrics.register(Counter(
+    "sync_requests_total", "Delta sync requests by cursor mode and outcome", ("mode", "outcome")))
+
+def sync_scopes(current_user: dict) -> Dict[str, dict]:
+    projects = {}
+    if current_user['role'] == UserRole.MUNICIPAL:
+        projects['municipality_id'] = current_user.get('municipality_id')
+    return {"projects": projects, "municipalities": {}, "notifications": notification_scope(current_user)}
+
+async def sync_snapshot(scopes: Dict[str, dict]) -> Dict[str, list]:
+    """Same documents the list endpoints return"""
+    return await fan_out(
+        projects=lambda: db.projects.find(scopes['projects'], {"_id": 0}).sort("ipr_score", -1).to_list(1000),
+        municipalities=lambda: db.municipalities.find({}, {"_id": 0}).to_list(1000),
+        notifications=lambda: db.notifications.find(scopes['notifications'], {"_id": 0}).sort("created_at", -1).to_list(50)
+    )
+
+def _sync_pipeline() -> list:
+    return [
+        {"$match": {"ns.coll": {"$in": list(SYNC_COLLECTIONS)}}},
+        {"$project": {"ns.coll": 1, "operationType": 1, "documentKey": 1}}
+    ]
+
+async def change_stream_cursor() -> str:
+    """Resume token for "now", taken before a snapshot so nothing written during it is missed"""
+    async with db.watch(_sync_pipeline(), max_await_time_ms=1) as stream:
+        await stream.try_next()
+        return "cs." + stream.resume_token['_data']
+
+async def read_change_stream(resume_data: str, scopes: Dict[str, dict]) -> Optional[dict]:
+    """Changed documents since the token, fetched by _id in one query per collection; None if a reset is needed"""
+    changed = {name: [] for name in SYNC_COLLECTIONS}
+    count = 0
+    async with db.watch(_sync_pipeline(), resume_after={"_data": resume_data}, max_await_time_ms=SYNC_AWAIT_MS) as stream:
+        while count < SYNC_MAX_CHANGES:
+            change = await stream.try_next()
+            if change is None:
+                break
+            # Deletes only carry the Mongo _id (gone with the document) and drops end the stream:
+            # both mean the client's copy can no longer be patched
+            if change['operationType'] not in ("insert", "update", "replace"):
+                return None
+            changed[change['ns']['coll']].append(change['documentKey']['_id'])
+            count += 1
+        cursor = "cs." + stream.resume_token['_data']
+
+    async def fetch(name):
+        if not changed[name]:
+            return []
+        return await db[name].find({"_id": {"$in": list(set(changed[name]))}, **scopes[name]}, {"_id": 0}).to_list(None)
+
+    results = await fan_out(**{name: (lambda name=name: fetch(name)) for name in SYNC_COLLECTIONS})
+    return {"cursor": cursor, "has_more": count >= SYNC_MAX_CHANGES, **results}
+
+def parse_timestamp_cursor(value: str) -> Tuple[str, str]:
+    """"<timestamp>" or "<timestamp>|<id>"; the id resumes inside a run of documents sharing the timestamp"""
+    at, _, after_id = value.partition("|")
+    return at, after_id
+
+def after_key(field: str, at: str, after_id: str) -> dict:
+    """Documents after (at, after_id) in (field, id) order"""
+    if not after_id:
+        return {field: {"$gt": at}}
+    return {"$or": [{field: {"$gt": at}}, {field: at, "id": {"$gt": after_id}}]}
+
+async def read_since_timestamp(since: str, scopes: Dict[str, dict]) -> dict:
+    at, after_id = parse_timestamp_cursor(since)
+    cursor_at = (datetime.now(timezone.utc) - timedelta(seconds=SYNC_TIMESTAMP_OVERLAP_SECONDS)).isoformat()
+    queries = {
+        "projects": (after_key("updated_at", at, after_id), "updated_at"),
+        "municipalities": (after_key("updated_at", at, after_id), "updated_at"),
+        "notifications": ({"$or": [after_key("created_at", at, after_id), {"read_at": {"$gt": at}}]}, "created_at"),
+    }
+
+    def fetch(name):
+        query, order = queries[name]
+        return lambda: db[name].find({**query, **scopes[name]}, {"_id": 0}).sort([(order, 1), ("id", 1)]).to_list(SYNC_MAX_CHANGES)
+
+    results = await fan_out(**{name: fetch(name) for name in SYNC_COLLECTIONS})
+    # A full page means more is waiting: resume from the smallest (timestamp, id) page end so no collection
+    # skips anything, and a page made entirely of one timestamp (a bulk rescore) still moves forward
+    full_pages = [(docs[-1].get(queries[name][1]) or "", docs[-1].get("id") or "")
+                  for name, docs in results.items() if len(docs) >= SYNC_MAX_CHANGES]
+    cursor = cursor_at
+    if full_pages:
+        cursor = "|".join(min(full_pages))
+    return {"cursor": "ts." + cursor, "has_more": bool(full_pages), **results}
+
+async def change_streams_supported() -> bool:
+    global _change_streams_supported
+    if SYNC_MODE != "auto":
+        return SYNC_MODE == "change_stream"
+    if _change_streams_supported is None:
+        try:
+            await change_stream_cursor()
+            _change_streams_supported = True
+        except OperationFailure as e:
+            if e.code not in CHANGE_STREAM_UNSUPPORTED:
+                raise
+            logger.info("Change streams unavailable, /sync uses timestamp cursors")
+            _change_streams_supported = False
+    return _change_streams_supported
+
+@api_router.get("/sync")
+async def sync_changes(since: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Projects, municipalities and notifications changed after `since`; pass back `cursor` on the next call"""
+    scopes = sync_scopes(current_user)
+    use_change_streams = await change_streams_supported()
+    mode = "change_stream" if use_change_streams else "timestamp"
+
+    delta = None
+    if since and use_change_streams and since.startswith("cs."):
+        try:
+            delta = await read_change_stream(since[3:], scopes)
+        except OperationFailure as e:
+            if e.code != CHANGE_STREAM_HISTORY_LOST:
+                raise
+    elif since and not use_change_streams and since.startswith("ts."):
+        delta = await read_since_timestamp(since[3:], scopes)
+    if delta is not None:
+        SYNC_REQUESTS.inc(mode, "delta")
+        return {"mode": mode, "reset": False, **delta}
+
+    # No cursor, a cursor from the other mode, or history the server no longer has: start over
+    if use_change_streams:
+        cursor = await change_stream_cursor()
+    else:
+        cursor = "ts." + (datetime.now(timezone.utc) - timedelta(seconds=SYNC_TIMESTAMP_OVERLAP_SECONDS)).isoformat()
+    SYNC_REQUESTS.inc(mode, "snapshot")
+    return {"mode": mode, "reset": True, "cursor": cursor, "has_more": False, **await sync_snapshot(scopes)}
+
 # ==================== AI ROUTES ====================
+# Every provider call goes through the gateway: concurrency limits, timeout and circuit breaker.
+# Gateway errors land in each handler's existing fallback response.
+prompt_budget = PromptBudget.from_env()
+PROMPT_TEXT_FIELDS = ("title", "description", "location", "scope", "purpose")
+
+def report_prompt_size(endpoint: str, system: str, prompt: str):
+    tokens = estimate_tokens(system) + estimate_tokens(prompt)
+    LLM_PROMPT_TOKENS.observe(tokens, endpoint)
+    logger.debug(f"LLM prompt for {endpoint}: ~{tokens} tokens")
+
+def budget_project_fields(endpoint: str, project_data: dict) -> dict:
+    """Copy of project_data with its free-text fields fitted to the prompt budget"""
+    fields = {name: str(project_data[name]) for name in PROMPT_TEXT_FIELDS if project_data.get(name)}
+    fitted, truncated = prompt_budget.fit(fields)
+    for name in truncated:
+        LLM_PROMPT_TRUNCATIONS.inc(endpoint, name)
+    return {**project_data, **fitted}
+
+llm_gateway: Optional[LLMGateway] = None  # created by create_app()
+
+def llm_municipality(current_user: dict) -> Optional[str]:
+    """
+    Whose per-municipality LLM slots a call uses: a municipal user's own municipality (never one named in
+    the request body); AMVALI staff act for the whole association and are only bound by the global limit.
+    """
+    if current_user['role'] == UserRole.MUNICIPAL:
+        return current_user.get('municipality_id')
+    return None
+
+metrics.register(Gauge("llm_circuit_open", "1 while the LLM circuit breaker rejects calls",
+                       callback=lambda: [((), 1 if llm_gateway and llm_gateway.breaker.state == "open" else 0)]))
+
 @api_router.post("/ai/diagnose-complexity")
 async def diagnose_complexity(project_data: dict, current_user: dict = Depends(get_current_user)):
     """Use Claude AI to diagnose project complexity"""
+    await ai_rate_limit.check(current_user['id'])
     try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        
-        api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not api_key:
+        if not llm_gateway.configured:
             return {"complexity": "media", "diagnosis": "AI não disponível - classificação padrão", "confidence": 0.5}
         
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"diagnosis-{project_data.get('project_id', 'new')}",
-            system_message="""Você é um especialista em análise de projetos de engenharia e infraestrutura para a AMVALI.
+        system_message = """Você é um especialista em análise de projetos de engenharia e infraestrutura para a AMVALI.
             Analise os dados do projeto e classifique sua complexidade em: 'minima', 'media' ou 'alta'.
             Considere: escopo, localização, tipo de projeto, finalidade, impacto regional.
             Responda em JSON: {"complexity": "minima|media|alta", "justification": "...", "confidence": 0.0-1.0, "recommendations": [...]}"""
-        ).with_model("anthropic", "claude-sonnet-4-5-20250929")
         
-        message = UserMessage(
-            text=f"""Analise este projeto:
-            - Título: {project_data.get('title', 'N/A')}
+        fields = budget_project_fields("diagnose-complexity", project_data)
+        prompt = f"""Analise este projeto:
+            - Título: {fields.get('title', 'N/A')}
             - Tipo: {project_data.get('project_type', 'N/A')}
-            - Descrição: {project_data.get('description', 'N/A')}
-            - Localização: {project_data.get('location', 'N/A')}
-            - Escopo: {project_data.get('scope', 'N/A')}
-            - Finalidade: {project_data.get('purpose', 'N/A')}
+            - Descrição: {fields.get('description', 'N/A')}
+            - Localização: {fields.get('location', 'N/A')}
+            - Escopo: {fields.get('scope', 'N/A')}
+            - Finalidade: {fields.get('purpose', 'N/A')}
             - Impacto (1-10): {project_data.get('impact_score', 5)}
             - Urgência (1-10): {project_data.get('urgency_score', 5)}
             """
-        )
         
-        response = await chat.send_message(message)
+        response = await llm_gateway.complete(
+            "diagnose-complexity", system_message, prompt,
+            session_id=f"diagnosis-{project_data.get('project_id', 'new')}",
+            municipality_id=llm_municipality(current_user)
+        )
         
-        import json
         try:
             result = json.loads(response)
         except:
@@ -731,21 +3212,29 @@ async def diagnose_complexity(project_data: dict, current_user: dict = Depends(g
         
         # Update project if ID provided
         if project_data.get('project_id'):
-            ipr = calculate_ipr(
+            policy = await get_scoring_policy()
+            ipr = policy.score(
                 project_data.get('impact_score', 1),
                 project_data.get('urgency_score', 1),
                 project_data.get('cost_score', 1),
                 result.get('complexity', 'media')
             )
-            await db.projects.update_one(
+            diagnosis_update = {
+                "complexity": result.get('complexity', 'media'),
+                "ai_diagnosis": result.get('justification', ''),
+                "ipr_score": ipr,
+                "scoring_policy_version": policy.version,
+                "updated_at": datetime.now(timezone.utc).isoformat()
+            }
+            before = await db.projects.find_one_and_update(
                 {"id": project_data['project_id']},
-                {"$set": {
-                    "complexity": result.get('complexity', 'media'),
-                    "ai_diagnosis": result.get('justification', ''),
-                    "ipr_score": ipr,
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }}
+                {"$set": diagnosis_update, "$inc": VERSION_BUMP},
+                projection={"_id": 0, "municipality_id": 1, **{k: 1 for k in diagnosis_update}},
+                return_document=ReturnDocument.BEFORE
             )
+            if before is not None:
+                change_log.record(project_data['project_id'], "ai_diagnosis", diff_fields(before, diagnosis_update), current_user['id'])
+                await invalidate_project_views(project_data['project_id'], before.get('municipality_id'))
         
         return result
         
@@ -753,44 +3242,13 @@ async def diagnose_complexity(project_data: dict, current_user: dict = Depends(g
         logger.error(f"AI diagnosis error: {e}")
         return {"complexity": "media", "diagnosis": str(e), "confidence": 0.5}
 
-@api_router.post("/ai/municipal-analysis")
-async def municipal_ai_analysis(project_data: dict, current_user: dict = Depends(get_current_user)):
-    """
-    IA Orientativa para Módulo Municipal - Análise informacional sem poder decisório.
-    Avalia suficiência de informações, complexidade estimada e compatibilidade de prazo.
-    """
-    try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        import json
-        
-        api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not api_key:
-            return {
-                "information_sufficiency": "parcialmente_suficiente",
-                "missing_documents": ["Não foi possível avaliar - IA indisponível"],
-                "estimated_complexity": "media",
-                "deadline_compatibility": "indefinido",
-                "suggested_deadline_days": 60,
-                "technical_explanation": "Análise automática indisponível. A solicitação será avaliada pela equipe técnica.",
-                "disclaimer": "Esta análise é meramente orientativa e não constitui aprovação ou compromisso."
-            }
-        
-        # Document requirements by project type
-        required_docs = {
-            "pavimentacao": ["Levantamento topográfico", "Matrícula do imóvel", "Projeto geométrico", "Memorial descritivo"],
-            "edificacao": ["Planta de situação", "Projeto arquitetônico", "Matrícula do terreno", "Estudo de viabilidade"],
-            "infraestrutura": ["Levantamento planialtimétrico", "Estudo hidrológico", "Memorial técnico", "ART/RRT"]
-        }
-        
-        project_type = project_data.get('project_type', 'edificacao')
-        attachments = project_data.get('attachments', [])
-        attachment_names = [a.get('filename', '') for a in attachments] if attachments else []
-        desired_deadline = project_data.get('desired_deadline', 'medio')
-        
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"municipal-analysis-{project_data.get('project_id', str(uuid.uuid4())[:8])}",
-            system_message="""Você é um assistente técnico orientativo da AMVALI. Sua função é EXCLUSIVAMENTE CONSULTIVA e EDUCATIVA.
+MUNICIPAL_ANALYSIS_REQUIRED_DOCS = {
+    "pavimentacao": ["Levantamento topográfico", "Matrícula do imóvel", "Projeto geométrico", "Memorial descritivo"],
+    "edificacao": ["Planta de situação", "Projeto arquitetônico", "Matrícula do terreno", "Estudo de viabilidade"],
+    "infraestrutura": ["Levantamento planialtimétrico", "Estudo hidrológico", "Memorial técnico", "ART/RRT"]
+}
+
+MUNICIPAL_ANALYSIS_SYSTEM_MESSAGE = """Você é um assistente técnico orientativo da AMVALI. Sua função é EXCLUSIVAMENTE CONSULTIVA e EDUCATIVA.
 
 IMPORTANTE: Você NÃO tem poder para:
 - Aprovar ou reprovar solicitações
@@ -815,26 +3273,31 @@ Responda SEMPRE em JSON com o formato:
     "technical_explanation": "explicação objetiva e educativa sobre a análise",
     "recommendations": ["recomendações para melhorar a solicitação"]
 }"""
-        ).with_model("anthropic", "claude-sonnet-4-5-20250929")
-        
-        message = UserMessage(
-            text=f"""Analise esta solicitação municipal de forma ORIENTATIVA (sem aprovar ou reprovar):
+
+def build_municipal_analysis_prompt(project_data: dict) -> str:
+    project_type = project_data.get('project_type', 'edificacao')
+    attachments = project_data.get('attachments', [])
+    attachment_names = [a.get('filename', '') for a in attachments] if attachments else []
+    desired_deadline = project_data.get('desired_deadline', 'medio')
+    fields = budget_project_fields("municipal-analysis", project_data)
+
+    return f"""Analise esta solicitação municipal de forma ORIENTATIVA (sem aprovar ou reprovar):
 
 DADOS DO PROJETO:
-- Título: {project_data.get('title', 'Não informado')}
+- Título: {fields.get('title', 'Não informado')}
 - Tipo: {project_type}
-- Descrição: {project_data.get('description', 'Não informado')}
-- Localização: {project_data.get('location', 'Não informado')}
-- Escopo: {project_data.get('scope', 'Não informado')}
-- Finalidade: {project_data.get('purpose', 'Não informado')}
+- Descrição: {fields.get('description', 'Não informado')}
+- Localização: {fields.get('location', 'Não informado')}
+- Escopo: {fields.get('scope', 'Não informado')}
+- Finalidade: {fields.get('purpose', 'Não informado')}
 - Impacto estimado: {project_data.get('impact_score', 5)}/10
 - Urgência indicada: {project_data.get('urgency_score', 5)}/10
 - Prazo desejado pelo solicitante: {desired_deadline} (baixo/médio/alto)
 
-ARQUIVOS ANEXADOS: {', '.join(attachment_names) if attachment_names else 'Nenhum anexo'}
+ARQUIVOS ANEXADOS: {join_limited(attachment_names, prompt_budget.max_list_items) if attachment_names else 'Nenhum anexo'}
 
 DOCUMENTOS USUALMENTE NECESSÁRIOS PARA {project_type.upper()}:
-{', '.join(required_docs.get(project_type, []))}
+{', '.join(MUNICIPAL_ANALYSIS_REQUIRED_DOCS.get(project_type, []))}
 
 Forneça análise ORIENTATIVA considerando:
 1. As informações estão suficientes para uma análise técnica preliminar?
@@ -844,60 +3307,149 @@ Forneça análise ORIENTATIVA considerando:
 5. Qual seria um prazo referencial razoável (em dias)?
 
 LEMBRE-SE: Esta análise é apenas ORIENTATIVA e será validada por responsável técnico humano."""
-        )
-        
-        response = await chat.send_message(message)
-        
-        try:
-            result = json.loads(response)
-        except:
-            # Parse response if not valid JSON
-            result = {
-                "information_sufficiency": "parcialmente_suficiente",
-                "missing_documents": required_docs.get(project_type, []),
-                "estimated_complexity": "media",
-                "deadline_compatibility": "parcialmente_compativel",
-                "suggested_deadline_days": 45,
-                "technical_explanation": response,
-                "recommendations": []
-            }
-        
-        # Add mandatory disclaimer
-        result["disclaimer"] = "IMPORTANTE: Esta análise possui caráter MERAMENTE REFERENCIAL e ORIENTATIVO. Não constitui aprovação, compromisso ou definição oficial. A solicitação será validada por responsável técnico humano."
-        result["analysis_type"] = "orientativo"
-        result["ai_role"] = "consultivo_educativo"
-        
-        # Save analysis to project if ID provided
-        if project_data.get('project_id'):
-            await db.projects.update_one(
-                {"id": project_data['project_id']},
-                {"$set": {
-                    "ai_analysis": result,
-                    "complexity": result.get('estimated_complexity', 'media'),
-                    "updated_at": datetime.now(timezone.utc).isoformat()
-                }}
-            )
-        
-        return result
-        
-    except Exception as e:
-        logger.error(f"Municipal AI analysis error: {e}")
-        return {
+
+def municipal_analysis_session(project_data: dict) -> str:
+    return f"municipal-analysis-{project_data.get('project_id', str(uuid.uuid4())[:8])}"
+
+def municipal_analysis_unavailable() -> dict:
+    return {
+        "information_sufficiency": "parcialmente_suficiente",
+        "missing_documents": ["Não foi possível avaliar - IA indisponível"],
+        "estimated_complexity": "media",
+        "deadline_compatibility": "indefinido",
+        "suggested_deadline_days": 60,
+        "technical_explanation": "Análise automática indisponível. A solicitação será avaliada pela equipe técnica.",
+        "disclaimer": "Esta análise é meramente orientativa e não constitui aprovação ou compromisso."
+    }
+
+def municipal_analysis_error(e: Exception) -> dict:
+    return {
+        "information_sufficiency": "parcialmente_suficiente",
+        "missing_documents": [],
+        "estimated_complexity": "media",
+        "deadline_compatibility": "indefinido",
+        "suggested_deadline_days": 45,
+        "technical_explanation": f"Erro na análise automática: {str(e)}. A solicitação será avaliada pela equipe técnica.",
+        "disclaimer": "Esta análise é meramente orientativa.",
+        "error": True
+    }
+
+def finalize_municipal_analysis(response: str, project_data: dict) -> dict:
+    """Parse the model's answer (falling back to a prose result) and attach the mandatory disclaimer"""
+    try:
+        result = json.loads(response)
+    except:
+        # Parse response if not valid JSON
+        project_type = project_data.get('project_type', 'edificacao')
+        result = {
             "information_sufficiency": "parcialmente_suficiente",
-            "missing_documents": [],
+            "missing_documents": MUNICIPAL_ANALYSIS_REQUIRED_DOCS.get(project_type, []),
             "estimated_complexity": "media",
-            "deadline_compatibility": "indefinido",
+            "deadline_compatibility": "parcialmente_compativel",
             "suggested_deadline_days": 45,
-            "technical_explanation": f"Erro na análise automática: {str(e)}. A solicitação será avaliada pela equipe técnica.",
-            "disclaimer": "Esta análise é meramente orientativa.",
-            "error": True
+            "technical_explanation": response,
+            "recommendations": []
         }
 
+    # Add mandatory disclaimer
+    result["disclaimer"] = "IMPORTANTE: Esta análise possui caráter MERAMENTE REFERENCIAL e ORIENTATIVO. Não constitui aprovação, compromisso ou definição oficial. A solicitação será validada por responsável técnico humano."
+    result["analysis_type"] = "orientativo"
+    result["ai_role"] = "consultivo_educativo"
+    return result
+
+async def save_municipal_analysis(project_data: dict, result: dict, current_user: dict):
+    """Save analysis to project if ID provided"""
+    if not project_data.get('project_id'):
+        return
+    analysis_update = {
+        "ai_analysis": result,
+        "complexity": result.get('estimated_complexity', 'media'),
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    before = await db.projects.find_one_and_update(
+        {"id": project_data['project_id']},
+        {"$set": analysis_update, "$inc": VERSION_BUMP},
+        projection={"_id": 0, "municipality_id": 1, **{k: 1 for k in analysis_update}},
+        return_document=ReturnDocument.BEFORE
+    )
+    if before is not None:
+        change_log.record(project_data['project_id'], "ai_analysis", diff_fields(before, analysis_update), current_user['id'])
+        await invalidate_project_views(project_data['project_id'], before.get('municipality_id'))
+
+@api_router.post("/ai/municipal-analysis")
+async def municipal_ai_analysis(project_data: dict, current_user: dict = Depends(get_current_user)):
+    """
+    IA Orientativa para Módulo Municipal - Análise informacional sem poder decisório.
+    Avalia suficiência de informações, complexidade estimada e compatibilidade de prazo.
+    """
+    await ai_rate_limit.check(current_user['id'])
+    try:
+        if not llm_gateway.configured:
+            return municipal_analysis_unavailable()
+
+        response = await llm_gateway.complete(
+            "municipal-analysis", MUNICIPAL_ANALYSIS_SYSTEM_MESSAGE, build_municipal_analysis_prompt(project_data),
+            session_id=municipal_analysis_session(project_data),
+            municipality_id=llm_municipality(current_user)
+        )
+        result = finalize_municipal_analysis(response, project_data)
+        await save_municipal_analysis(project_data, result, current_user)
+        return result
+
+    except Exception as e:
+        logger.error(f"Municipal AI analysis error: {e}")
+        return municipal_analysis_error(e)
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@api_router.post("/ai/municipal-analysis/stream")
+async def municipal_ai_analysis_stream(project_data: dict, current_user: dict = Depends(get_current_user)):
+    """
+    Same analysis as /ai/municipal-analysis, streamed as Server-Sent Events: `token` for raw text,
+    `field` as each top-level JSON field completes, then one `result` (or `error`) carrying exactly
+    what the non-streaming route returns and persists.
+    """
+    await ai_rate_limit.check(current_user['id'])
+
+    async def events():
+        if not llm_gateway.configured:
+            yield sse("result", municipal_analysis_unavailable())
+            return
+        parser = JSONFieldStream()
+        chunks = []
+        try:
+            async for chunk in llm_gateway.stream(
+                "municipal-analysis", MUNICIPAL_ANALYSIS_SYSTEM_MESSAGE, build_municipal_analysis_prompt(project_data),
+                session_id=municipal_analysis_session(project_data),
+                municipality_id=llm_municipality(current_user)
+            ):
+                chunks.append(chunk)
+                yield sse("token", {"text": chunk})
+                for name, value in parser.feed(chunk):
+                    yield sse("field", {"name": name, "value": value})
+            result = finalize_municipal_analysis("".join(chunks), project_data)
+            await save_municipal_analysis(project_data, result, current_user)
+            yield sse("result", result)
+        except Exception as e:
+            logger.error(f"Municipal AI analysis stream error: {e}")
+            yield sse("error", municipal_analysis_error(e))
+
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ==================== ATTACHMENT ROUTES ====================
 @api_router.post("/projects/{project_id}/attachments")
-async def upload_attachment(project_id: str, attachment_data: dict, current_user: dict = Depends(get_current_user)):
+async def upload_attachment(project_id: str, attachment_data: dict, current_user: dict = Depends(get_current_user),
+                            idempotency_key: Optional[str] = Header(None)):
     """Upload attachment metadata to project (file stored externally)"""
-    project = await db.projects.find_one({"id": project_id}, {"_id": 0})
+    return await run_idempotent(idempotency_key, f"attachment:{project_id}", current_user, attachment_data,
+                                lambda: add_attachment(project_id, attachment_data, current_user))
+
+async def add_attachment(project_id: str, attachment_data: dict, current_user: dict) -> dict:
+    project = await db.projects.find_one({"id": project_id}, {"_id": 1})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -921,9 +3473,12 @@ async def upload_attachment(project_id: str, attachment_data: dict, current_user
         {"id": project_id},
         {
             "$push": {"attachments": attachment},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()},
+            "$inc": VERSION_BUMP
         }
     )
+    change_log.record(project_id, "attachment_add", [{"field": "attachments", "op": "push", "old": None, "new": attachment}], current_user['id'])
+    await invalidate_project_views(project_id)
     
     return {"message": "Attachment added", "attachment": attachment}
 
@@ -938,85 +3493,167 @@ async def get_attachments(project_id: str, current_user: dict = Depends(get_curr
 @api_router.delete("/projects/{project_id}/attachments/{attachment_id}")
 async def delete_attachment(project_id: str, attachment_id: str, current_user: dict = Depends(get_current_user)):
     """Delete an attachment from project"""
-    await db.projects.update_one(
-        {"id": project_id},
+    before = await db.projects.find_one_and_update(
+        {"id": project_id, "attachments.id": attachment_id},
         {
             "$pull": {"attachments": {"id": attachment_id}},
-            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
-        }
+            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()},
+            "$inc": VERSION_BUMP
+        },
+        projection={"_id": 0, "attachments": {"$elemMatch": {"id": attachment_id}}},
+        return_document=ReturnDocument.BEFORE
     )
+    if before and before.get('attachments'):
+        change_log.record(project_id, "attachment_delete", [{"field": "attachments", "op": "pull", "old": before['attachments'][0], "new": None}], current_user['id'])
+        await invalidate_project_views(project_id)
     return {"message": "Attachment deleted"}
 
+# ==================== HISTORY ROUTES ====================
+@api_router.get("/projects/{project_id}/history")
+async def get_project_history(project_id: str, limit: int = 100, current_user: dict = Depends(get_current_user)):
+    """Field-level change history of a project, newest first"""
+    await change_log.flush()
+    entries = await db.project_changes.find(
+        {"project_id": project_id}, {"_id": 0}
+    ).sort([("at", -1), ("seq", -1)]).to_list(limit)
+    return {"history": entries, "total": len(entries)}
+
+@api_router.get("/projects/{project_id}/history/at")
+async def get_project_at(project_id: str, timestamp: datetime, current_user: dict = Depends(get_current_user)):
+    """Reconstruct a project as it was at the given timestamp"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    project = await reconstruct_project(project_id, timestamp)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project did not exist at this timestamp")
+    return project
+
 @api_router.post("/ai/suggest-allocation")
 async def suggest_allocation(project_data: dict, current_user: dict = Depends(get_current_user)):
-    """Use Claude AI to suggest team allocation"""
-    try:
-        from emergentintegrations.llm.chat import LlmChat, UserMessage
-        
-        api_key = os.environ.get('EMERGENT_LLM_KEY')
-        if not api_key:
-            return {"suggestions": [], "message": "AI não disponível"}
-        
-        # Get available team
-        team = await db.users.find({"role": UserRole.TECNICO_AMVALI}, {"_id": 0, "password_hash": 0}).to_list(50)
-        
-        team_info = []
-        for t in team:
-            active = await db.projects.count_documents({
-                "assigned_team": t['id'],
-                "status": {"$nin": [ProjectStatus.CONCLUIDO]}
-            })
-            team_info.append({
-                "id": t['id'],
-                "name": t['name'],
-                "specialties": t.get('specialties', []),
-                "active_projects": active,
-                "capacity": t.get('workload_hours', 40)
-            })
-        
-        chat = LlmChat(
-            api_key=api_key,
-            session_id=f"allocation-{project_data.get('project_id', 'new')}",
-            system_message="""Você é um especialista em gestão de equipes técnicas da AMVALI.
-            Sugira a melhor alocação de equipe considerando especialidades, carga de trabalho e complexidade do projeto.
-            Responda em JSON: {"suggested_team": ["id1", "id2"], "reasoning": "...", "workload_impact": "..."}"""
-        ).with_model("anthropic", "claude-sonnet-4-5-20250929")
-        
-        message = UserMessage(
-            text=f"""Projeto:
-            - Título: {project_data.get('title', 'N/A')}
-            - Tipo: {project_data.get('project_type', 'N/A')}
-            - Complexidade: {project_data.get('complexity', 'media')}
-            - Prioridade: {project_data.get('priority', 3)} estrelas
-            
-            Equipe disponível:
-            {json.dumps(team_info, indent=2, ensure_ascii=False)}
-            """
+    """Suggest team allocation with the local optimizer; Claude only explains the result when asked"""
+    project = {
+        "id": project_data.get('project_id', 'new'),
+        "project_type": project_data.get('project_type'),
+        "complexity": project_data.get('complexity') or 'media',
+        "priority": project_data.get('priority', 3),
+        "assigned_team": project_data.get('assigned_team', [])
+    }
+    if project_data.get('project_id'):
+        stored = await db.projects.find_one(
+            {"id": project_data['project_id']},
+            {"_id": 0, "id": 1, "title": 1, "project_type": 1, "complexity": 1, "priority": 1, "assigned_team": 1}
         )
-        
-        import json
-        response = await chat.send_message(message)
-        
+        if stored:
+            project.update({k: v for k, v in stored.items() if v is not None})
+
+    technicians = await db.users.find(
+        {"role": UserRole.TECNICO_AMVALI},
+        {"_id": 0, "id": 1, "name": 1, "specialties": 1, "workload_hours": 1}
+    ).to_list(2000)
+    load = await get_technician_loads()
+    plan = plan_allocations([project], technicians, load, team_size=project_data.get('team_size'))[0]
+
+    result = {
+        "suggested_team": plan['team_ids'],
+        "ranking": plan['ranking'][:10],
+        "reasoning": describe_allocation(plan),
+        "workload_impact": plan['workload_impact'],
+        "engine": "optimizer"
+    }
+
+    if project_data.get('explain'):
+        await ai_rate_limit.check(current_user['id'])
         try:
-            result = json.loads(response)
-        except:
-            result = {"suggested_team": [], "reasoning": response, "workload_impact": "N/A"}
-        
-        return result
-        
-    except Exception as e:
-        logger.error(f"AI allocation error: {e}")
-        return {"suggestions": [], "message": str(e)}
+            if llm_gateway.configured:
+                system_message = """Você é um especialista em gestão de equipes técnicas da AMVALI.
+                    Explique em linguagem simples, em até 5 frases, por que a equipe sugerida é adequada ao projeto."""
+                team = top_k(plan['team'], prompt_budget.team_top_k,
+                             key=lambda t: (t['specialty_match'], t['score']))
+                team = [{k: t[k] for k in ("name", "specialty_match", "active_projects", "capacity_percent_after")} for t in team]
+                fields = budget_project_fields("suggest-allocation", {"title": project_data.get('title', project.get('title', 'N/A'))})
+                prompt = f"""Projeto:
+                    - Título: {fields['title']}
+                    - Tipo: {project.get('project_type', 'N/A')}
+                    - Complexidade: {project['complexity']}
+                    - Prioridade: {project['priority']} estrelas
+
+                    Equipe sugerida pelo otimizador:
+                    {json.dumps(team, ensure_ascii=False)}
+                    """
+                result['explanation'] = await llm_gateway.complete(
+                    "suggest-allocation", system_message, prompt,
+                    session_id=f"allocation-{project['id']}",
+                    municipality_id=llm_municipality(current_user)
+                )
+        except Exception as e:
+            logger.error(f"AI allocation explanation error: {e}")
+
+    return result
+
+@api_router.get("/team/allocation-plan")
+async def get_allocation_plan(limit: int = 50, current_user: dict = Depends(get_current_user)):
+    """Suggest teams for every unallocated project in the technical queue, in queue order"""
+    if current_user['role'] not in [UserRole.GESTOR_AMVALI]:
+        raise HTTPException(status_code=403, detail="Only AMVALI managers can plan allocations")
+
+    projects = await db.projects.find(
+        {"status": {"$in": [ProjectStatus.VALIDACAO, ProjectStatus.EXECUCAO]}, "assigned_team": {"$size": 0}},
+        {"_id": 0, "id": 1, "title": 1, "project_type": 1, "complexity": 1, "priority": 1, "assigned_team": 1}
+    ).sort([("ipr_score", -1), ("priority", -1), ("created_at", 1)]).to_list(limit)
+    technicians = await db.users.find(
+        {"role": UserRole.TECNICO_AMVALI},
+        {"_id": 0, "id": 1, "name": 1, "specialties": 1, "workload_hours": 1}
+    ).to_list(2000)
+    load = await get_technician_loads()
+
+    plans = plan_allocations(projects, technicians, load)
+    return {
+        "plan": [
+            {"project_id": plan['project_id'], "title": plan.get('title'), "suggested_team": plan['team_ids'],
+             "workload_impact": plan['workload_impact']}
+            for plan in plans
+        ],
+        "total": len(plans)
+    }
 
 # ==================== SEED DATA ====================
+# Synthetic volume is off by default: /seed is unauthenticated (it bootstraps the first accounts), so the
+# HTTP route only takes small volumes. Large ones belong to the seeding.py command line.
+SEED_SYNTHETIC_ENABLED = os.environ.get('SEED_SYNTHETIC_ENABLED', 'false').lower() == 'true'
+SEED_MAX_MUNICIPALITIES = int(os.environ.get('SEED_MAX_MUNICIPALITIES', '50'))
+SEED_MAX_PROJECTS = int(os.environ.get('SEED_MAX_PROJECTS', '10000'))
+SEED_MAX_NOTIFICATIONS = int(os.environ.get('SEED_MAX_NOTIFICATIONS', '50000'))
+
 @api_router.post("/seed")
-async def seed_data():
-    """Seed initial data for testing"""
+async def seed_data(
+    synthetic_municipalities: int = 0,
+    synthetic_projects: int = 0,
+    synthetic_notifications: int = 0,
+    seed: int = 42
+):
+    """Seed initial data for testing, optionally followed by a deterministic synthetic volume"""
+    if (synthetic_municipalities or synthetic_projects or synthetic_notifications) and not SEED_SYNTHETIC_ENABLED:
+        raise HTTPException(status_code=403, detail="Synthetic seeding is disabled; use seeding.py")
+    if not (0 <= synthetic_municipalities <= SEED_MAX_MUNICIPALITIES and 0 <= synthetic_projects <= SEED_MAX_PROJECTS
+            and 0 <= synthetic_notifications <= SEED_MAX_NOTIFICATIONS):
+        raise HTTPException(status_code=400, detail="Synthetic volume out of range")
+    if synthetic_projects and not synthetic_municipalities:
+        raise HTTPException(status_code=400, detail="Synthetic projects need at least one synthetic municipality")
+    policy = await get_scoring_policy(force_reload=True)
+
     # Clear existing data
     await db.users.delete_many({})
     await db.municipalities.delete_many({})
     await db.projects.delete_many({})
     await db.notifications.delete_many({})
+    await db.projects_archive.delete_many({})
+    await db.archive_counters.delete_many({})
+    await db.stage_events.delete_many({})
+    await db.stage_duration_rollups.delete_many({})
+    # History and cached idempotent responses would point at projects that no longer exist
+    await change_log.flush()
+    await db.project_changes.delete_many({})
+    await db.idempotency_keys.delete_many({})
     
     # Create municipalities
     municipalities_data = [
@@ -1028,12 +3665,15 @@ async def seed_data():
     ]
     
     municipalities = []
+    municipality_docs = []
     for m_data in municipalities_data:
         m = Municipality(**m_data, engagement_score=round(50 + (hash(m_data['name']) % 50), 1))
         doc = m.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
-        await db.municipalities.insert_one(doc)
+        doc['updated_at'] = doc['created_at']
+        municipality_docs.append(doc)
         municipalities.append(m)
+    await db.municipalities.insert_many(municipality_docs)
     
     # Create users
     users_data = [
@@ -1045,14 +3685,21 @@ async def seed_data():
         {"email": "municipal@guaramirim.sc.gov.br", "name": "Maria Secretária", "role": UserRole.MUNICIPAL, "password": "municipal123", "municipality_id": municipalities[1].id},
     ]
     
+    # bcrypt is deliberately slow: hash each distinct password once
+    password_hashes = {}
+    user_docs = []
     for u_data in users_data:
         password = u_data.pop('password')
         specialties = u_data.pop('specialties', [])
         user = User(**u_data, specialties=specialties)
         doc = user.model_dump()
-        doc['password_hash'] = hash_password(password)
+        if password not in password_hashes:
+            password_hashes[password] = hash_password(password)
+        doc['password_hash'] = password_hashes[password]
         doc['created_at'] = doc['created_at'].isoformat()
-        await db.users.insert_one(doc)
+        doc['updated_at'] = doc['created_at']
+        user_docs.append(doc)
+    await db.users.insert_many(user_docs)
     
     # Create sample projects
     projects_data = [
@@ -1132,6 +3779,7 @@ async def seed_data():
         {"name": "Entrega e Encerramento", "status": "pending"}
     ]
     
+    project_docs = []
     for p_data in projects_data:
         municipality = next((m for m in municipalities if m.id == p_data['municipality_id']), None)
         stages = default_stages.copy()
@@ -1151,7 +3799,7 @@ async def seed_data():
         if status_index < len(stages):
             stages[status_index]['status'] = 'in_progress'
         
-        ipr = calculate_ipr(p_data['impact_score'], p_data['urgency_score'], p_data['cost_score'], p_data['complexity'])
+        ipr = policy.score(p_data['impact_score'], p_data['urgency_score'], p_data['cost_score'], p_data['complexity'])
         
         project = Project(
             title=p_data['title'],
@@ -1167,32 +3815,173 @@ async def seed_data():
             urgency_score=p_data['urgency_score'],
             cost_score=p_data['cost_score'],
             ipr_score=ipr,
-            stages=stages
+            scoring_policy_version=policy.version,
+            stages=stages,
+            version=1
         )
         
         doc = project.model_dump()
         doc['created_at'] = doc['created_at'].isoformat()
         doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.projects.insert_one(doc)
-    
-    return {"message": "Seed data created successfully", "municipalities": len(municipalities), "projects": len(projects_data)}
+        project_docs.append(doc)
+    await db.projects.insert_many(project_docs)
+
+    result = {"message": "Seed data created successfully", "municipalities": len(municipalities), "projects": len(projects_data)}
+    if synthetic_municipalities or synthetic_projects or synthetic_notifications:
+        dataset = SyntheticDataset(
+            municipalities=synthetic_municipalities, projects=synthetic_projects,
+            notifications=synthetic_notifications, technicians=0, seed=seed,
+            score=policy.score_many, scoring_policy_version=policy.version,
+            password_hash=os.environ.get('SEED_PASSWORD_HASH')
+        )
+        result['synthetic'] = await insert_dataset(db, dataset)
+
+    await invalidate_project_views()
+    return result
 
 # ==================== ROOT ====================
 @api_router.get("/")
 async def root():
     return {"message": "Portal IntraAMVALI API", "version": "1.0.0"}
 
-# Include router and middleware
-app.include_router(api_router)
+@metrics_router.get("/metrics", include_in_schema=False)
+async def get_metrics(credentials: Optional[HTTPAuthorizationCredentials] = Depends(HTTPBearer(auto_error=False))):
+    """Prometheus text exposition; protected by METRICS_TOKEN when it is set"""
+    metrics_token = os.environ.get('METRICS_TOKEN')
+    if metrics_token and (not credentials or credentials.credentials != metrics_token):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# ==================== APP LIFECYCLE ====================
+MONGO_WARMUP_CONNECTIONS = int(os.environ.get('MONGO_WARMUP_CONNECTIONS', '4'))
+
+STARTUP_DURATION = metrics.register(Gauge(
+    "app_startup_seconds", "Time spent in each startup phase", ("phase",)))
+
+async def ensure_indexes():
+    await db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+    await db.scoring_policies.create_index("version", unique=True)
+    await db.projects.create_index([("updated_at", 1), ("id", 1)])
+    await db.municipalities.create_index([("updated_at", 1), ("id", 1)])
+    await db.users.create_index("updated_at")
+    await db.projects.create_index([("status", 1), ("updated_at", 1)])
+    await db.projects.create_index([("municipality_id", 1), ("created_at", 1)])
+    await db.projects_archive.create_index("id", unique=True)
+    await db.projects_archive.create_index([("municipality_id", 1), ("updated_at", -1)])
+    await db.projects_archive.create_index([("counted", 1), ("archived_at", 1)])
+    await db.projects_archive.create_index("count_token")
+    await db.notifications.create_index([("user_id", 1), ("created_at", 1)])
+    await db.notifications.create_index([("user_id", 1), ("read_at", 1)])
+    await db.project_changes.create_index([("project_id", 1), ("at", 1), ("seq", 1)])
+    await db.stage_events.create_index([("project_id", 1), ("created_at", 1)])
+    await db.stage_duration_rollups.create_index(
+        [("granularity", 1), ("bucket", 1), ("municipality_id", 1), ("project_type", 1), ("stage_index", 1)],
+        unique=True
+    )
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def warm_up():
+    """Pay the first-request costs during startup: pool connections, the scoring policy and the LLM import"""
+    start = time.perf_counter()
+    # Concurrent pings make the pool open several connections instead of one
+    await asyncio.gather(*(client.admin.command('ping') for _ in range(max(MONGO_WARMUP_CONNECTIONS, 1))))
+    await get_scoring_policy(force_reload=True)
+    STARTUP_DURATION.set(time.perf_counter() - start, "mongo")
+
+    if llm_gateway.configured:
+        start = time.perf_counter()
+        try:
+            await llm_gateway.warm_up()
+        except ImportError as e:
+            logger.warning(f"LLM client unavailable, AI endpoints will use their fallbacks: {e}")
+        STARTUP_DURATION.set(time.perf_counter() - start, "llm")
+
+def configure_clients():
+    """Shared state and the LLM gateway hold connections that lifespan closes, so each app gets new ones"""
+    global shared_state, llm_gateway
+    shared_state = create_shared_state(os.environ.get('SHARED_STATE_URL', 'memory://'))
+    llm_gateway = LLMGateway.from_env(observe=observe_llm_call, on_prompt=report_prompt_size)
+
+# The app whose lifespan is running; handlers use the module-level clients, so only one app may serve
+_serving_app: Optional[FastAPI] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _serving_app
+    if app.state.client is not client:
+        raise RuntimeError("This app was superseded by a later create_app() call; serve the most recent one")
+    if _serving_app is not None:
+        raise RuntimeError("Another app from create_app() is already serving in this process")
+    _serving_app = app
+    start = time.perf_counter()
+    await ensure_indexes()
+    STARTUP_DURATION.set(time.perf_counter() - start, "indexes")
+    await warm_up()
+
+    query_profiler.attach(asyncio.get_running_loop())
+    change_log.start()
+    global invalidation_bus
+    invalidation_bus = create_invalidation_bus()
+    background_tasks = [
+        asyncio.create_task(monitor_event_loop_lag()),
+        asyncio.create_task(listen_for_forecast_invalidations()),
+        asyncio.create_task(invalidation_bus.run()),
+    ]
+    if ARCHIVE_INTERVAL_HOURS > 0:
+        background_tasks.append(asyncio.create_task(run_archive_job()))
+    STARTUP_DURATION.set(time.perf_counter() - start, "total")
+    logger.info(f"Startup completed in {time.perf_counter() - start:.2f}s")
+    try:
+        yield
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        _serving_app = None
+        await change_log.stop()
+        # This app's own connections, even if create_app() has been called again since
+        await app.state.llm_gateway.close()
+        await app.state.shared_state.close()
+        app.state.client.close()
+
+def create_app() -> FastAPI:
+    """
+    Assemble the ASGI app. Handlers use module-level clients, which every call replaces, so this is
+    single-use per serving period: call it again only once the previous app has shut down (tests, reload).
+    Only the most recently created app can start, and each app closes only the connections made for it.
+    """
+    if _serving_app is not None:
+        raise RuntimeError("create_app() called while another app is serving; shut it down first")
+    configure_database()
+    configure_clients()
+    app = FastAPI(title="Portal IntraAMVALI", version="1.0.0", lifespan=lifespan)
+    app.state.client = client
+    app.state.llm_gateway = llm_gateway
+    app.state.shared_state = shared_state
+    app.include_router(api_router)
+    app.include_router(metrics_router)
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Content-Disposition"],
+    )
+    return app
+
+class _DeferredApp:
+    """
+    `server:app` for setups that still import the app object. Run `uvicorn server:create_app --factory`
+    instead: this shim only calls create_app() on its first ASGI event (the lifespan startup), so importing
+    the module reads no settings and opens no clients.
+    """
+
+    def __init__(self):
+        self._app: Optional[FastAPI] = None
+
+    async def __call__(self, scope, receive, send):
+        if self._app is None:
+            self._app = create_app()
+        await self._app(scope, receive, send)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+app = _DeferredApp()
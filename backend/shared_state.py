@@ -0,0 +1,166 @@
+"""
+Estado compartilhado entre workers: chave/valor com TTL, contadores e pub/sub.
+
+O backend é escolhido por SHARED_STATE_URL:
+
+    memory://               dicionário em processo (padrão; testes e um único worker)
+    redis://host:6379/0     Redis ou compatível (Valkey, KeyDB, Dragonfly) - requer o pacote redis
+    fakeredis://            fakeredis em processo, só para testes e benchmarks (pip install fakeredis)
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+
+class SharedState:
+    """Operations every backend provides; values are strings (callers serialise to JSON)"""
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Atomically add to a counter; `ttl` is applied when the counter is created"""
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: str):
+        raise NotImplementedError
+
+    def subscribe(self, channel: str) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemorySharedState(SharedState):
+    """Process-local backend with the same semantics; LRU-bounded so it cannot grow without limit"""
+
+    def __init__(self, max_keys: int = 10_000):
+        self.max_keys = max_keys
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def _live(self, key: str):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, expires_at: Optional[float], value):
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._live(key)
+        return None if entry is None else entry[1]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return [await self.get(key) for key in keys]
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._store(key, time.monotonic() + ttl if ttl else None, value)
+
+    async def delete(self, key: str):
+        self._data.pop(key, None)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        entry = self._live(key)
+        if entry is None:
+            entry = (time.monotonic() + ttl if ttl else None, "0")
+        value = int(entry[1]) + amount
+        self._store(key, entry[0], str(value))
+        return value
+
+    async def publish(self, channel: str, message: str):
+        for queue in self._subscribers.get(channel, ()):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].discard(queue)
+
+
+class RedisSharedState(SharedState):
+    """Backend over a redis.asyncio-compatible client (real Redis or fakeredis)"""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.client.get(key)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        return await self.client.mget(keys)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None):
+        await self.client.set(key, value, px=int(ttl * 1000) if ttl else None)
+
+    async def delete(self, key: str):
+        await self.client.delete(key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if not ttl:
+            return await self.client.incrby(key, amount)
+        # Create the counter with its expiry first (SET NX PX), then add: INCRBY keeps the TTL, and one
+        # MULTI round trip means there is never a counter without an expiry
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(key, 0, nx=True, px=int(ttl * 1000))
+            pipe.incrby(key, amount)
+            _, value = await pipe.execute()
+        return value
+
+    async def publish(self, channel: str, message: str):
+        await self.client.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message['type'] == 'message':
+                    yield message['data']
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    async def close(self):
+        await self.client.close()
+
+
+def create_shared_state(url: str) -> SharedState:
+    if not url or url.startswith("memory://"):
+        return MemorySharedState()
+    if url.startswith("fakeredis://"):
+        try:
+            from fakeredis import aioredis as fake_aioredis
+        except ImportError:
+            raise RuntimeError("SHARED_STATE_URL=fakeredis:// is for tests and benchmarks: pip install fakeredis")
+        return RedisSharedState(fake_aioredis.FakeRedis(decode_responses=True))
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("A redis:// SHARED_STATE_URL requires the redis package")
+        return RedisSharedState(redis_asyncio.from_url(url, decode_responses=True))
+    raise ValueError(f"Unsupported SHARED_STATE_URL scheme: {url.split('://')[0]}")
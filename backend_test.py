@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 
 import requests
+import os
 import sys
+import io
 import json
+import zipfile
 from datetime import datetime
+from urllib.parse import quote
 
 class IntraAMVALITester:
     def __init__(self, base_url="https://projeto-gestao-1.preview.emergentagent.com"):
@@ -13,12 +17,14 @@ class IntraAMVALITester:
         self.tests_passed = 0
         self.failed_tests = []
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, token=None):
+    def run_test(self, name, method, endpoint, expected_status, data=None, token=None, extra_headers=None):
         """Run a single API test"""
         url = f"{self.base_url}/api/{endpoint}"
         headers = {'Content-Type': 'application/json'}
         if token:
             headers['Authorization'] = f'Bearer {token}'
+        if extra_headers:
+            headers.update(extra_headers)
 
         self.tests_run += 1
         print(f"\n🔍 Testing {name}...")
@@ -257,6 +263,267 @@ class IntraAMVALITester:
         
         return success, response
 
+    def test_idempotent_attachment(self, token, project_id):
+        """A retried upload with the same Idempotency-Key returns the first attachment instead of adding another"""
+        key = {"Idempotency-Key": f"retry-{datetime.now().timestamp()}"}
+        attachment_data = {"filename": "memorial_descritivo.pdf", "file_size": 1024, "file_url": "https://example.com/m.pdf"}
+
+        success, first = self.run_test("Upload With Idempotency-Key", "POST", f"projects/{project_id}/attachments",
+                                       200, data=attachment_data, token=token, extra_headers=key)
+        if not success:
+            return False
+        success, retry = self.run_test("Retried Upload (Replayed)", "POST", f"projects/{project_id}/attachments",
+                                       200, data=attachment_data, token=token, extra_headers=key)
+        if success and retry.get('attachment', {}).get('id') != first['attachment']['id']:
+            print("❌ Retry created a second attachment")
+            self.failed_tests.append({"test": "Retried Upload (Replayed)", "error": "attachment duplicated"})
+            return False
+
+        self.run_test("Idempotency-Key Reused With Other Payload", "POST", f"projects/{project_id}/attachments",
+                      422, data={**attachment_data, "filename": "outro.pdf"}, token=token, extra_headers=key)
+        return success
+
+    def test_optimistic_concurrency(self, token, project_id):
+        """A write with a stale If-Match version is rejected with 409 instead of overwriting"""
+        success, project = self.run_test("Get Project Version", "GET", f"projects/{project_id}", 200, token=token)
+        if not success:
+            return False
+        version = {"If-Match": f'"{project.get("version", 0)}"'}
+
+        success, updated = self.run_test("Conditional Update (Current Version)", "PUT", f"projects/{project_id}",
+                                         200, data={"scope": "Escopo revisado"}, token=token, extra_headers=version)
+        if success and updated.get('version') != project.get('version', 0) + 1:
+            print(f"❌ Expected version {project.get('version', 0) + 1}, got {updated.get('version')}")
+            self.failed_tests.append({"test": "Conditional Update (Current Version)", "error": "version not bumped"})
+            return False
+
+        success, _ = self.run_test("Conditional Update (Stale Version)", "PUT", f"projects/{project_id}",
+                                   409, data={"scope": "Escopo sobrescrito"}, token=token, extra_headers=version)
+        return success
+
+    def test_delta_sync(self, token, project_id):
+        """After a snapshot, /sync?since=<cursor> returns the project changed in between"""
+        success, snapshot = self.run_test("Sync Snapshot", "GET", "sync", 200, token=token)
+        if not success or not snapshot.get('reset') or not snapshot.get('cursor'):
+            return False
+
+        self.run_test("Change Project For Sync", "PUT", f"projects/{project_id}", 200,
+                      data={"purpose": "Finalidade revisada para sync"}, token=token)
+        success, delta = self.run_test("Sync Delta", "GET", f"sync?since={quote(snapshot['cursor'])}", 200, token=token)
+        if success:
+            changed = [p['id'] for p in delta.get('projects', [])]
+            if delta.get('reset') or project_id not in changed:
+                print(f"❌ Delta ({delta.get('mode')}) did not contain the changed project")
+                self.failed_tests.append({"test": "Sync Delta", "error": "changed project missing"})
+                return False
+            print(f"   {delta.get('mode')}: {len(changed)} project(s) changed since the cursor")
+        return success
+
+    def test_archive(self, token):
+        """Archiving runs for managers; dashboard totals keep counting archived projects"""
+        success, dry_run = self.run_test("Archive Dry Run", "POST", "admin/archive?dry_run=true", 200, token=token)
+        if success:
+            print(f"   {dry_run.get('eligible')} project(s) concluded before {dry_run.get('cutoff')}")
+        success, stats = self.run_test("Dashboard Counts Archived Projects", "GET", "dashboard/stats", 200, token=token)
+        if success and 'archived_projects' not in stats:
+            print("❌ Dashboard stats missing archived_projects")
+            self.failed_tests.append({"test": "Dashboard Counts Archived Projects", "error": "archived_projects missing"})
+            return False
+        return success
+
+    def test_export(self, token):
+        """/projects/export streams every matching project as CSV and as a readable XLSX"""
+        headers = {'Authorization': f'Bearer {token}'}
+        self.tests_run += 1
+        print("\n🔍 Testing Project Export...")
+        try:
+            _, projects = self.run_test("Projects For Export", "GET", "projects?status=solicitacao", 200, token=token)
+            with requests.get(f"{self.base_url}/api/projects/export", params={"format": "csv", "status": "solicitacao"},
+                              headers=headers, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                content = b"".join(response.iter_content(64 * 1024)).decode("utf-8-sig")
+            rows = len(content.splitlines()) - 1
+            response = requests.get(f"{self.base_url}/api/projects/export", params={"format": "xlsx"},
+                                    headers=headers, timeout=60)
+            response.raise_for_status()
+            with zipfile.ZipFile(io.BytesIO(response.content)) as workbook:
+                sheet = workbook.read("xl/worksheets/sheet1.xml")
+            if rows < len(projects) or b"<sheetData>" not in sheet:
+                raise AssertionError(f"CSV has {rows} rows for {len(projects)} projects")
+            self.tests_passed += 1
+            print(f"✅ Passed - {rows} CSV row(s), XLSX sheet of {len(sheet)} bytes")
+            return True
+        except Exception as e:
+            print(f"❌ Failed - Error: {e}")
+            self.failed_tests.append({"test": "Project Export", "error": str(e)})
+            return False
+
+    def test_batch_projects(self, token, project_ids):
+        """Test batch project operations endpoint"""
+        batch_data = {
+            "ordered": False,
+            "operations": [
+                {"project_id": pid, "action": "update", "changes": {"priority": 3, "urgency_score": 5}}
+                for pid in project_ids
+            ] + [{"project_id": "missing-project", "action": "update", "changes": {"priority": 1}}]
+        }
+
+        success, response = self.run_test(
+            "Batch Project Operations",
+            "POST",
+            "projects/batch",
+            200,
+            data=batch_data,
+            token=token
+        )
+
+        if success and response:
+            statuses = [r['status'] for r in response.get('results', [])]
+            if statuses[-1] != "not_found" or response.get('succeeded') != len(project_ids):
+                print(f"   ⚠️ Unexpected batch results: {statuses}")
+                return False, response
+            print(f"   ✅ Batch applied: {response.get('succeeded')}/{response.get('total')}")
+
+        return success, response
+
+    def test_suggest_allocation(self, token, project):
+        """Test optimizer-based allocation suggestion"""
+        success, response = self.run_test(
+            "Suggest Allocation (Optimizer)",
+            "POST",
+            "ai/suggest-allocation",
+            200,
+            data={"project_id": project['id'], "project_type": project['project_type'], "complexity": "alta"},
+            token=token
+        )
+
+        if success and response:
+            if response.get('engine') != "optimizer" or len(response.get('suggested_team', [])) > 3:
+                print(f"   ⚠️ Unexpected allocation response: {response}")
+                return False, response
+            print(f"   ✅ Suggested team: {response.get('suggested_team')}")
+
+        return success, response
+
+    def test_queue_forecast(self, token):
+        """Test pipeline deadline forecast endpoint"""
+        success, response = self.run_test(
+            "Queue Deadline Forecast",
+            "GET",
+            "forecast/queue",
+            200,
+            token=token
+        )
+
+        if success and response:
+            positions = [p['queue_position'] for p in response.get('projects', [])]
+            if positions != sorted(positions) or any('forecast_completion' not in p for p in response.get('projects', [])):
+                print("   ⚠️ Forecast not ordered or incomplete")
+                return False, response
+            print(f"   ✅ Forecast for {response.get('total')} projects over {response.get('capacity_slots')} slots")
+
+        return success, response
+
+    def test_stage_durations(self, token, project_id):
+        """Test stage transitions feeding the stage-duration rollups"""
+        for status in ("in_progress", "completed"):
+            success, _ = self.run_test(
+                f"Stage 0 -> {status}",
+                "PUT",
+                f"projects/{project_id}/stage",
+                200,
+                data={"stage_index": 0, "status": status},
+                token=token
+            )
+            if not success:
+                return False, {}
+
+        success, response = self.run_test(
+            "Stage Duration Analytics",
+            "GET",
+            "analytics/stage-durations?stage_index=0",
+            200,
+            token=token
+        )
+
+        if success and response:
+            if not any(d['count'] >= 1 for d in response.get('durations', [])):
+                print("   ⚠️ Completed stage missing from rollups")
+                return False, response
+            print(f"   ✅ Rollup rows: {len(response.get('durations', []))}")
+
+        return success, response
+
+    def test_project_history(self, token, project):
+        """Test change history and time-travel reconstruction"""
+        success, response = self.run_test(
+            "Project Change History",
+            "GET",
+            f"projects/{project['id']}/history",
+            200,
+            token=token
+        )
+        if not success:
+            return success, response
+
+        actions = [entry['action'] for entry in response.get('history', [])]
+        if "create" not in actions or "stage" not in actions:
+            print(f"   ⚠️ Unexpected history actions: {actions}")
+            return False, response
+
+        success, snapshot = self.run_test(
+            "Project At Creation Time",
+            "GET",
+            f"projects/{project['id']}/history/at?timestamp={quote(project['created_at'])}",
+            200,
+            token=token
+        )
+        if success and snapshot.get('stages', [{}])[0].get('status') != "pending":
+            print("   ⚠️ Reconstructed stage 0 should be pending")
+            return False, snapshot
+
+        return success, snapshot
+
+    def test_municipality_dashboard(self, token, municipality_id):
+        """Test paginated municipality dashboard"""
+        success, response = self.run_test(
+            "Municipality Dashboard",
+            "GET",
+            f"dashboard/municipality/{municipality_id}?limit=2",
+            200,
+            token=token
+        )
+
+        if success and response:
+            if len(response.get('projects', [])) > 2 or 'description' in (response.get('projects') or [{}])[0]:
+                print("   ⚠️ Dashboard should return at most 2 summary projects")
+                return False, response
+            print(f"   ✅ {response.get('total_projects')} projects, {response.get('active_projects')} active")
+
+        return success, response
+
+    def test_synthetic_seed(self):
+        """Test seeding with a small synthetic volume on top of the demo data"""
+        # Run the tests with the server's SEED_SYNTHETIC_ENABLED value; the route refuses the volume without it
+        enabled = os.environ.get('SEED_SYNTHETIC_ENABLED', 'false').lower() == 'true'
+        success, response = self.run_test(
+            "Synthetic Seed",
+            "POST",
+            "seed?synthetic_municipalities=3&synthetic_projects=50&synthetic_notifications=200",
+            200 if enabled else 403
+        )
+
+        if success and not enabled:
+            print("   ✅ Synthetic seeding rejected while SEED_SYNTHETIC_ENABLED is off")
+        elif success and response:
+            synthetic = response.get('synthetic', {})
+            if synthetic.get('projects') != 50 or synthetic.get('notifications') != 200:
+                print(f"   ⚠️ Unexpected synthetic counts: {synthetic}")
+                return False, response
+            print(f"   ✅ Synthetic volume inserted in {synthetic.get('seconds')}")
+
+        return success, response
+
 def main():
     print("🚀 Starting IntraAMVALI API Tests")
     print("=" * 50)
@@ -299,10 +566,17 @@ def main():
         
         # Queue
         tester.test_queue(gestor_token)
+        tester.test_queue_forecast(gestor_token)
         
         # Team
         tester.test_team(gestor_token)
+        tester.test_archive(gestor_token)
+        tester.test_export(gestor_token)
         
+        # Batch operations over the listed projects
+        if projects:
+            tester.test_batch_projects(gestor_token, [p['id'] for p in projects[:3]])
+
         # Municipalities
         success, municipalities = tester.test_municipalities(gestor_token)
         
@@ -329,6 +603,18 @@ def main():
                 
                 # Test project attachments
                 tester.test_project_attachments(gestor_token, project['id'])
+                tester.test_idempotent_attachment(gestor_token, project['id'])
+                tester.test_optimistic_concurrency(gestor_token, project['id'])
+                tester.test_delta_sync(gestor_token, project['id'])
+
+                # Test allocation optimizer
+                tester.test_suggest_allocation(gestor_token, project)
+
+                # Test stage events and duration rollups
+                tester.test_stage_durations(gestor_token, project['id'])
+
+                # Test change history
+                tester.test_project_history(gestor_token, project)
     
     # Test with Técnico token
     tecnico_token = tester.tokens.get("tecnico")
@@ -344,6 +630,8 @@ def main():
         print("\n🏛️ Testing with Municipal permissions...")
         tester.test_dashboard_stats(municipal_token)
         tester.test_projects_list(municipal_token)
+        if users["municipal"].get('municipality_id'):
+            tester.test_municipality_dashboard(municipal_token, users["municipal"]['municipality_id'])
         
         # Municipal users should NOT have access to team endpoint
         success, _ = tester.run_test(
@@ -354,6 +642,10 @@ def main():
             token=municipal_token
         )
     
+    # Seed last: it replaces the data the checks above ran against
+    print("\n🌱 Testing synthetic seeding...")
+    tester.test_synthetic_seed()
+
     # Print results
     print("\n" + "=" * 50)
     print(f"📊 Test Results: {tester.tests_passed}/{tester.tests_run} passed")
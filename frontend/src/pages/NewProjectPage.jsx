@@ -36,6 +36,8 @@ function NewProjectPage() {
   const [costScore, setCostScore] = useState(5);
   const [desiredDeadline, setDesiredDeadline] = useState('medio');
   const [attachments, setAttachments] = useState([]);
+  // One key per form: a resubmit after a dropped response replays the project instead of creating another
+  const [submitKey] = useState(function() { return (window.crypto && window.crypto.randomUUID) ? window.crypto.randomUUID() : String(Date.now()) + Math.random(); });
 
   useEffect(function loadData() {
     getMunicipalities().then(function(res) {
@@ -82,7 +84,7 @@ function NewProjectPage() {
 
   function submit() {
     setLoading(true);
-    createProject({ title: title, description: description, project_type: projectType, municipality_id: municipalityId, priority: priority, location: location, scope: scope, purpose: purpose, impact_score: impactScore, urgency_score: urgencyScore, cost_score: costScore, desired_deadline: desiredDeadline }).then(function(res) {
+    createProject({ title: title, description: description, project_type: projectType, municipality_id: municipalityId, priority: priority, location: location, scope: scope, purpose: purpose, impact_score: impactScore, urgency_score: urgencyScore, cost_score: costScore, desired_deadline: desiredDeadline }, submitKey).then(function(res) {
       toast.success('Solicitação criada!');
       navigate('/projects/' + res.data.id);
     }).catch(function(e) {
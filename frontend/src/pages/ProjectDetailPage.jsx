@@ -66,12 +66,18 @@ function ProjectDetailPage() {
 
   const handleStageUpdate = async (newStatus) => {
     try {
-      await updateProjectStage(project.id, { stage_index: stageDialog.index, status: newStatus });
+      await updateProjectStage(project.id, { stage_index: stageDialog.index, status: newStatus }, project.version);
       toast.success('Etapa atualizada com sucesso');
       setStageDialog({ open: false, index: null, stage: null });
       loadProject();
     } catch (error) {
-      toast.error('Erro ao atualizar etapa');
+      if (error.response && error.response.status === 409) {
+        toast.error('O projeto foi alterado por outra pessoa. Dados recarregados, tente novamente.');
+        setStageDialog({ open: false, index: null, stage: null });
+        loadProject();
+      } else {
+        toast.error('Erro ao atualizar etapa');
+      }
     }
   };
 
@@ -5,7 +5,8 @@ import {
   Search, 
   Filter, 
   Loader2,
-  FolderKanban 
+  FolderKanban,
+  Download
 } from 'lucide-react';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
@@ -19,7 +20,7 @@ import {
 } from '../components/ui/select';
 import ProjectCard from '../components/custom/ProjectCard';
 import { useAuth } from '../contexts/AuthContext';
-import { getProjects } from '../services/api';
+import { getProjects, exportProjects } from '../services/api';
 
 const ProjectsPage = () => {
   const { isMunicipal } = useAuth();
@@ -28,6 +29,7 @@ const ProjectsPage = () => {
   const [searchTerm, setSearchTerm] = useState('');
   const [statusFilter, setStatusFilter] = useState('all');
   const [typeFilter, setTypeFilter] = useState('all');
+  const [exporting, setExporting] = useState(false);
 
   useEffect(() => {
     loadProjects();
@@ -44,6 +46,28 @@ const ProjectsPage = () => {
     }
   };
 
+  const handleExport = async () => {
+    setExporting(true);
+    try {
+      const params = { format: 'xlsx' };
+      if (statusFilter !== 'all') params.status = statusFilter;
+      if (typeFilter !== 'all') params.project_type = typeFilter;
+      const response = await exportProjects(params);
+      const disposition = response.headers['content-disposition'] || '';
+      const match = disposition.match(/filename="([^"]+)"/);
+      const url = URL.createObjectURL(response.data);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = match ? match[1] : 'projetos.xlsx';
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error('Failed to export projects:', error);
+    } finally {
+      setExporting(false);
+    }
+  };
+
   const filteredProjects = projects.filter(project => {
     const matchesSearch = project.title.toLowerCase().includes(searchTerm.toLowerCase()) ||
                           project.municipality_name.toLowerCase().includes(searchTerm.toLowerCase());
@@ -70,12 +94,18 @@ const ProjectsPage = () => {
             {filteredProjects.length} projeto(s) encontrado(s)
           </p>
         </div>
-        <Link to="/projects/new">
-          <Button className="bg-teal-600 hover:bg-teal-700" data-testid="new-project-button">
-            <Plus className="w-4 h-4 mr-2" />
-            Nova Solicitação
+        <div className="flex gap-2">
+          <Button variant="outline" onClick={handleExport} disabled={exporting} data-testid="export-projects-button">
+            {exporting ? <Loader2 className="w-4 h-4 mr-2 animate-spin" /> : <Download className="w-4 h-4 mr-2" />}
+            Exportar
           </Button>
-        </Link>
+          <Link to="/projects/new">
+            <Button className="bg-teal-600 hover:bg-teal-700" data-testid="new-project-button">
+              <Plus className="w-4 h-4 mr-2" />
+              Nova Solicitação
+            </Button>
+          </Link>
+        </div>
       </div>
 
       {/* Filters */}
@@ -10,9 +10,12 @@ export const getMunicipalityDashboard = (id) => axios.get(`${API}/dashboard/muni
 // Projects
 export const getProjects = (params) => axios.get(`${API}/projects`, { params });
 export const getProject = (id) => axios.get(`${API}/projects/${id}`);
-export const createProject = (data) => axios.post(`${API}/projects`, data);
-export const updateProject = (id, data) => axios.put(`${API}/projects/${id}`, data);
-export const updateProjectStage = (id, stageData) => axios.put(`${API}/projects/${id}/stage`, stageData);
+export const createProject = (data, idempotencyKey) => axios.post(`${API}/projects`, data, idempotencyKey ? { headers: { 'Idempotency-Key': idempotencyKey } } : undefined);
+const ifMatch = (version) => (version === undefined || version === null ? undefined : { headers: { 'If-Match': `"${version}"` } });
+export const updateProject = (id, data, version) => axios.put(`${API}/projects/${id}`, data, ifMatch(version));
+export const updateProjectStage = (id, stageData, version) => axios.put(`${API}/projects/${id}/stage`, stageData, ifMatch(version));
+// Streamed by the server; params: format (csv|xlsx), municipality_id, status, project_type, date_from, date_to
+export const exportProjects = (params) => axios.get(`${API}/projects/export`, { params, responseType: 'blob' });
 
 // Municipalities
 export const getMunicipalities = () => axios.get(`${API}/municipalities`);
@@ -42,5 +45,8 @@ export const deleteAttachment = (projectId, attachmentId) => axios.delete(`${API
 export const getNotifications = () => axios.get(`${API}/notifications`);
 export const markNotificationRead = (id) => axios.put(`${API}/notifications/${id}/read`);
 
+// Delta sync: pass back the cursor from the previous response; reset=true means replace local data
+export const syncChanges = (since) => axios.get(`${API}/sync`, { params: since ? { since } : {} });
+
 // Seed
 export const seedData = () => axios.post(`${API}/seed`);